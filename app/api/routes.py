@@ -1,25 +1,182 @@
+import json
 import logging
-from fastapi import APIRouter, HTTPException
-from app.core.database import get_database
+from typing import Optional
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from app.core.database import get_database, user_writes
+from app.bot.balance_watcher import balance_watcher
+from app.bot.dedup import update_deduplicator
+from app.bot.outbound import outbound
+from app.core.async_session_manager import session_manager
+from app.bot.routing import session_router
+from app.bot.update_queue import update_dispatcher
+from app.core.balance_cache import balance_cache
+from app.core.bet_settlement import bet_settler
+from app.core.bet_slips import bet_placer
+from app.core.fixtures import fixture_fetcher
+from app.core.job_scheduler import scraper_scheduler
 
 # Create a router instance for managing user-related routes
 router = APIRouter()
 
+# Fields that are never returned, whatever the caller asks for
+HIDDEN_USER_FIELDS = {"password"}
+MAX_PAGE_SIZE = 1000
+
+
+def _user_projection(fields):
+    """
+    Build a Mongo projection from a comma-separated field list.
+
+    `_id` is always fetched because it is the pagination key; hidden fields are
+    always excluded.
+    """
+    if not fields:
+        return {field: 0 for field in HIDDEN_USER_FIELDS}
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    projection = {field: 1 for field in requested - HIDDEN_USER_FIELDS - {"_id"}}
+    projection["_id"] = 1
+    return projection
+
+
+async def _stream_users(cursor):
+    """
+    Yield users as NDJSON lines as the Motor cursor produces them.
+    """
+    async for user in cursor:
+        user.pop("_id", None)
+        yield json.dumps(user, default=str) + "\n"
+
+
 @router.get("/users", tags=["Users"])
-async def get_all_users():
+async def get_all_users(
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+):
     """
-    Fetch all users from the database.
-    This endpoint retrieves all documents from the 'users' collection and returns them as a list.
+    Fetch users from the database, one page at a time.
+
+    Users are ordered by `_id` and paginated by keyset: pass the `next_cursor` of a
+    page as `after` to get the next one. `fields` restricts the returned fields
+    (comma-separated); the password hash is never returned.
+
+    With `format=ndjson` every user after the cursor is streamed as one JSON object
+    per line while the cursor is read, so exports run in constant memory and
+    `limit` is ignored.
     """
+    query = {}
+    if after:
+        try:
+            query["_id"] = {"$gt": ObjectId(after)}
+        except InvalidId:
+            raise HTTPException(status_code=400, detail="Invalid cursor.")
+
     try:
         db = get_database()  # Get the database instance
         user_collection = db["users"]  # Get the 'users' collection
-        
-        users = await user_collection.find().to_list(100)
+        cursor = user_collection.find(query, _user_projection(fields)).sort("_id", 1)
+
+        if format == "ndjson":
+            return StreamingResponse(_stream_users(cursor.batch_size(MAX_PAGE_SIZE)), media_type="application/x-ndjson")
+
+        users = await cursor.limit(limit).to_list(limit)
+        next_cursor = str(users[-1]["_id"]) if len(users) == limit else None
         for user in users:
             user.pop("_id", None)  # Remove sensitive data like _id
-        
-        return {"users": users}
+
+        return {"users": users, "next_cursor": next_cursor}
     except Exception as e:
         logging.error(f"Error while fetching users: {e}")
-        raise HTTPException(status_code=500, detail="Failed to fetch users.")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Failed to fetch users.")
+
+
+@router.get("/sessions/stats", tags=["Sessions"])
+async def get_session_stats():
+    """
+    Report live browser session counts and eviction counters for capacity planning.
+    """
+    return session_manager.stats()
+
+
+@router.get("/balance-cache/stats", tags=["Sessions"])
+async def get_balance_cache_stats():
+    """
+    Report balance cache hits, misses and coalesced refreshes.
+    """
+    return balance_cache.stats()
+
+
+@router.get("/watcher/stats", tags=["Sessions"])
+async def get_watcher_stats():
+    """
+    Report watched users and background refresh counters.
+    """
+    return balance_watcher.stats()
+
+
+@router.get("/fixtures/stats", tags=["Fixtures"])
+async def get_fixture_stats():
+    """
+    Report the size and age of the fixtures snapshot and fetch counters.
+    """
+    return fixture_fetcher.stats()
+
+
+@router.get("/scraper/stats", tags=["Sessions"])
+async def get_scraper_stats():
+    """
+    Report running and queued browser jobs and how many were turned away.
+    """
+    return scraper_scheduler.stats()
+
+
+@router.get("/bets/stats", tags=["Bets"])
+async def get_bet_placement_stats():
+    """
+    Report bet placements, suppressed duplicates and slip submission latency.
+    """
+    return bet_placer.stats()
+
+
+@router.get("/bets/settlement/stats", tags=["Bets"])
+async def get_bet_settlement_stats():
+    """
+    Report settlement runs, users checked and bets settled.
+    """
+    return bet_settler.stats()
+
+
+@router.get("/outbound/stats", tags=["Updates"])
+async def get_outbound_stats():
+    """
+    Report queued outgoing messages, merges, retries and flood-control pauses.
+    """
+    return outbound.stats()
+
+
+@router.get("/updates/stats", tags=["Updates"])
+async def get_update_queue_stats():
+    """
+    Report incoming update queue depth, throughput, wait times and suppressed duplicates.
+    """
+    return {**update_dispatcher.stats(), "duplicates": update_deduplicator.stats()}
+
+
+@router.get("/writes/stats", tags=["Database"])
+async def get_write_behind_stats():
+    """
+    Report pending write-behind operations, flush sizes and flush latencies.
+    """
+    return user_writes.stats()
+
+
+@router.get("/routing/stats", tags=["Updates"])
+async def get_routing_stats():
+    """
+    Report this worker's identity and how many updates it forwarded to other workers.
+    """
+    return session_router.stats()
@@ -0,0 +1,202 @@
+"""
+Background refresh of watched balances, with a message to the user on every change.
+
+Users opt in with /watch. A repeating JobQueue job checks every `tick` seconds which
+watched balances are due and refreshes at most `concurrency` of them at a time.
+Users who talked to the bot recently are refreshed every `active_interval` seconds;
+the interval grows with idle time up to `idle_interval`. Every interval is
+jittered so refreshes spread out instead of arriving in waves.
+"""
+import asyncio
+import heapq
+import logging
+import random
+import time
+
+from app.bot.outbound import outbound
+from app.config.settings import Settings
+from app.core.async_scraper import validate_sportybet_credentials
+from app.core.balance_cache import balance_cache
+from app.core.http_client import sportybet_http
+
+logger = logging.getLogger(__name__)
+
+# Key in context.user_data marking a user as opted in, so watches survive restarts
+WATCH_FLAG = "watch_balance"
+
+
+class BalanceWatcher:
+    """
+    Schedules balance refreshes for watched users and reports changes.
+    """
+    def __init__(self, tick, concurrency, active_interval, idle_interval, active_window, jitter):
+        self.tick = tick
+        self.concurrency = concurrency
+        self.active_interval = active_interval
+        self.idle_interval = idle_interval
+        self.active_window = active_window
+        self.jitter = jitter
+        self.session_manager = None
+        self.application = None
+        self.user_data = {}
+        self._watched = {}  # user_id -> {"chat_id", "phone_number", "balance"}
+        self._due = []  # heap of (due timestamp, user_id); stale entries are skipped
+        self._next_due = {}  # user_id -> due timestamp of its live heap entry
+        self._last_seen = {}  # user_id -> timestamp of the user's last update
+        self._inflight = set()
+        self._tasks = set()  # Running refreshes, kept so they are not garbage-collected
+        self.refreshes = 0
+        self.skipped = 0
+        self.notified = 0
+
+    def start(self, application, session_manager):
+        """
+        Resume the watches stored in persisted user data and start the repeating job.
+        """
+        self.application = application
+        self.session_manager = session_manager
+        self.user_data = application.user_data
+        for user_id, data in self.user_data.items():
+            if data.get(WATCH_FLAG) and data.get("chat_id"):
+                self.watch(user_id, data["chat_id"], data.get("phone_number"), data.get("balance"))
+        if self._watched:
+            logger.info(f"Resumed balance watching for {len(self._watched)} user(s).")
+        application.job_queue.run_repeating(self._refresh_due, interval=self.tick, first=self.tick, name="balance_watcher")
+
+    async def stop(self):
+        """
+        Cancel the refreshes still running.
+        """
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _interval(self, user_id):
+        idle_for = time.time() - self._last_seen.get(user_id, 0)
+        interval = min(self.idle_interval, self.active_interval * max(1.0, idle_for / self.active_window))
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _schedule(self, user_id, delay):
+        due_at = time.time() + delay
+        self._next_due[user_id] = due_at
+        heapq.heappush(self._due, (due_at, user_id))
+
+    def watch(self, user_id, chat_id, phone_number, balance=None):
+        """
+        Start watching a user's balance.
+        """
+        self._watched[user_id] = {"chat_id": chat_id, "phone_number": phone_number, "balance": balance}
+        self._last_seen.setdefault(user_id, time.time())
+        self._schedule(user_id, self._interval(user_id))
+
+    def unwatch(self, user_id):
+        """
+        Stop watching a user's balance.
+        """
+        self._watched.pop(user_id, None)
+        self._next_due.pop(user_id, None)
+        self._last_seen.pop(user_id, None)
+
+    def touch(self, user_id):
+        """
+        Record activity of a user, bringing their next refresh forward if it is far off.
+        """
+        if user_id not in self._watched:
+            return
+        self._last_seen[user_id] = time.time()
+        due_at = self._next_due.get(user_id)
+        if due_at is not None and user_id not in self._inflight:
+            delay = self.active_interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+            if due_at - time.time() > delay:
+                self._schedule(user_id, delay)
+
+    async def _refresh_due(self, context=None):
+        """
+        Start refreshes for due users without exceeding the concurrency limit.
+        """
+        now = time.time()
+        while self._due and self._due[0][0] <= now and len(self._inflight) < self.concurrency:
+            due_at, user_id = heapq.heappop(self._due)
+            if self._next_due.get(user_id) != due_at:
+                continue  # Unwatched or rescheduled since this entry was pushed
+            del self._next_due[user_id]
+            self._inflight.add(user_id)
+            task = asyncio.get_running_loop().create_task(self._refresh(user_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _refresh(self, user_id):
+        try:
+            await self._refresh_user(user_id)
+        except Exception as e:
+            logger.error(f"Balance watcher failed for user_id={user_id}: {e}", exc_info=True)
+        finally:
+            self._inflight.discard(user_id)
+            if user_id in self._watched and user_id not in self._next_due:
+                self._schedule(user_id, self._interval(user_id))
+
+    async def _refresh_user(self, user_id):
+        watched = self._watched.get(user_id)
+        if watched is None:
+            return
+        # Only refresh sessions that are still alive; never start a browser just to watch
+        if user_id not in self.session_manager.sessions and not sportybet_http.has_cookies(user_id):
+            self.skipped += 1
+            return
+
+        result = await balance_cache.get(
+            user_id,
+            lambda: validate_sportybet_credentials(
+                user_id,
+                watched["phone_number"],
+                None,
+                self.session_manager,
+                refresh_only=True,
+                max_wait=0  # Never queue behind users' own requests; retry next round instead
+            )
+        )
+        self.refreshes += 1
+        if result.get("expired"):
+            self.unwatch(user_id)
+            if user_id in self.user_data:
+                self.user_data[user_id].pop(WATCH_FLAG, None)
+                # Changed outside a handler, so PTB would not persist it by itself
+                self.application.mark_data_for_update_persistence(user_ids=user_id)
+            outbound.send(
+                watched["chat_id"],
+                "Your session has expired, so balance updates have stopped. Use /login to log in again."
+            )
+            return
+        if not result["success"]:
+            self.skipped += 1
+            return
+
+        previous, watched["balance"] = watched["balance"], result["balance"]
+        if user_id in self.user_data:
+            self.user_data[user_id]["balance"] = result["balance"]
+            self.application.mark_data_for_update_persistence(user_ids=user_id)
+        if previous is not None and previous != result["balance"]:
+            self.notified += 1
+            outbound.send(watched["chat_id"], f"Your balance changed: {previous} → {result['balance']}")
+
+    def stats(self):
+        """
+        Return the number of watched users and refresh counters.
+        """
+        return {
+            "watched": len(self._watched),
+            "inflight": len(self._inflight),
+            "refreshes": self.refreshes,
+            "skipped": self.skipped,
+            "notified": self.notified,
+        }
+
+
+balance_watcher = BalanceWatcher(
+    tick=Settings.BALANCE_WATCH_TICK,
+    concurrency=Settings.BALANCE_WATCH_CONCURRENCY,
+    active_interval=Settings.BALANCE_WATCH_ACTIVE_INTERVAL,
+    idle_interval=Settings.BALANCE_WATCH_IDLE_INTERVAL,
+    active_window=Settings.BALANCE_WATCH_ACTIVE_WINDOW,
+    jitter=Settings.BALANCE_WATCH_JITTER,
+)
@@ -3,25 +3,31 @@ This module contains handlers for Telegram bot commands. It focuses on clean
 and modular implementation for each command.
 """
 import logging
-import bcrypt
+from datetime import datetime, timedelta, timezone
 from telegram import ForceReply, Update
 from telegram.ext import ContextTypes
 
-import asyncio
-
-from app.core.database import get_database
-from app.core.scraper import validate_sportybet_credentials
-from app.core.session_manager import SessionManager
+from app.bot.balance_watcher import WATCH_FLAG, balance_watcher
+from app.bot.outbound import reply
+from app.config.settings import Settings
+from app.core.database import aggregate_bet_stats, get_bet_stats, storage_state_exists, user_writes
+from app.core.async_scraper import validate_sportybet_credentials
+from app.core.async_session_manager import session_manager
+from app.core.balance_cache import balance_cache
+from app.core.bet_slips import SLIP_KEY, add_selection, bet_placer, clear_slip, total_odds
+from app.core.fixtures import fixture_store
+from app.core.http_client import sportybet_http
+from app.core.job_scheduler import SchedulerBusyError, scraper_scheduler
+from app.core.security import HasherBusyError, password_hasher
 from app.core.utils import delete_password_message_later
 
-session_manager = SessionManager() # Initialize the session manager globally
-
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Handle the /start command.
     Display a welcome message and offer login or skip options.
     """
-    await update.message.reply_text(
+    reply(
+        update,
         "Welcome to the BetNudge Bot! 🎉\n"
         "I am here to automate your betting experience.\n"
         "What would you like to do?\n"
@@ -35,7 +41,7 @@ async def login_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     Prompt the user to enter their SportyBet login details.
     """
     user_id = update.effective_user.id
-    await update.message.reply_text("Please enter your SportyBet phone number")
+    reply(update, "Please enter your SportyBet phone number")
     context.user_data["awaiting_phone_number"] = True # Set a state to await username
     context.user_data["user_id"] = user_id # Store the user ID for session management
     
@@ -48,8 +54,16 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     I am your Betting Bot. Here are the commands you can use:
     /start - Start the bot and see welcome options.
     /help - Display this help text.
+    /fetch [league] [page] - Show upcoming fixtures and odds.
+    /bet <match> <outcome> - Add a selection from /fetch to your bet slip.
+    /bet slip - Show your bet slip.
+    /bet place <stake> - Place the slip as one bet.
+    /bet clear - Empty your bet slip.
+    /stat [days] - Show your betting statistics, all-time or for the last days.
+    /watch - Get a message whenever your balance changes.
+    /unwatch - Stop balance change messages.
     """
-    await update.message.reply_text(help_text)
+    reply(update, help_text)
     
 async def text_handler(update, context):
     """
@@ -60,12 +74,12 @@ async def text_handler(update, context):
         phone_number = update.message.text.strip()
 
         if not phone_number.isdigit():
-            await update.message.reply_text("Invalid phone number. Please enter digits only.")
+            reply(update, "Invalid phone number. Please enter digits only.")
             return
         
         # Check if the phone number length is valid
         if len(phone_number) < 10 or len(phone_number) > 11:
-            await update.message.reply_text("Invalid phone number. The phone number must be 10 or 11 digits long.")
+            reply(update, "Invalid phone number. The phone number must be 10 or 11 digits long.")
             return
         
         # Store phone number and ask for password
@@ -73,7 +87,8 @@ async def text_handler(update, context):
         context.user_data['user_id'] = update.effective_user.id  # Store user ID for session management
         context.user_data['awaiting_phone_number'] = False
         context.user_data['awaiting_password'] = True
-        await update.message.reply_text(
+        reply(
+            update,
             "Please enter your password:",
         )
     elif context.user_data.get('awaiting_password'):
@@ -82,57 +97,55 @@ async def text_handler(update, context):
         password = update.message.text.strip()
 
         if not password:
-            await update.message.reply_text("Password cannot be empty. Please try again.")
+            reply(update, "Password cannot be empty. Please try again.")
             return
 
         # Validate login using Playwright
         phone_number = context.user_data.get('phone_number')
         user_id = context.user_data.get('user_id')  # Get the user ID
         
-        loop = asyncio.get_event_loop()
-        login_result = await loop.run_in_executor(
-            None, 
-            validate_sportybet_credentials,
+        login_result = await validate_sportybet_credentials(
             user_id,
             phone_number,
             password,
             session_manager,
-            False
+            refresh_only=False
         )
 
         if login_result["success"]:
+            balance_cache.put(user_id, login_result)
+            context.user_data["chat_id"] = update.effective_chat.id
+            context.user_data["balance"] = login_result["balance"]
+
             # Save user details in the database
             balance = login_result["balance"]
-            db = get_database()
+            user_fields = {"phone_number": phone_number}
 
-            # Hash the password before saving
-            hashed_password = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
+            # Hash the password before saving, in the hashing pool so the event loop stays free
+            try:
+                user_fields["password"] = await password_hasher.hash_password(password)
+            except HasherBusyError as e:
+                logging.warning(f"Skipping password hash update for phone_number={phone_number}: {e}")
 
             # Debug: Log what is being saved
             logging.info(f"Saving user: phone_number={phone_number}, balance={balance}")
             
-            # Insert or update user details in MongoDB
-            try:
-                result = await db["users"].update_one(
-                    {"phone_number": phone_number},  # Match on phone number
-                    {"$set": {"phone_number": phone_number, "password": hashed_password.decode(), "balance": balance}},
-                    upsert=True  # Insert if user doesn't exist
-                )
-            
-                # Debug: Log the result of the database operation
-                logging.info(f"Database update result: {result.raw_result}")
-            except Exception as e:
-                logging.error(f"Failed to save user to database: {e}")
+            # Queue the upsert; the write-behind buffer batches it with other writes
+            user_writes.update_user(phone_number, user_fields)
+            user_writes.record_balance(phone_number, balance, user_id=user_id)
 
-            await update.message.reply_text(f"Login successful! 🎉\nYour balance is: {balance}")
-            await update.message.reply_text(
+            reply(update, f"Login successful! 🎉\nYour balance is: {balance}")
+            reply(
+                update,
                 "To check your balance, use the /balance command.\n"
                 "Use /fetch, /stat, or /bet commands to continue."
                 "To log out, use the /logout command."
             )
+        elif login_result.get("busy"):
+            reply(update, f"{login_result['message']}\nSend your password again to retry.")
         else:
-            await update.message.reply_text(f"Incorrect phone numuber or password /n")
-            await update.message.reply_text(f"Login failed: {login_result['message']}")
+            reply(update, f"Incorrect phone numuber or password /n")
+            reply(update, f"Login failed: {login_result['message']}")
         
         # Schedule the password message for deletion
         delete_password_message_later(
@@ -142,16 +155,18 @@ async def text_handler(update, context):
             delay=40  # Wait for 60 seconds before deleting
         )
         
-        # Reset state
-        context.user_data['awaiting_password'] = False
+        # Reset state, unless the login has to be retried
+        if not login_result.get("busy"):
+            context.user_data['awaiting_password'] = False
     else:
-        await update.message.reply_text("Unknown command. Use /start to begin.")
+        reply(update, "Unknown command. Use /start to begin.")
 
 async def skip_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Handle the /skip command to allow users to proceed without logging in.
     """
-    await update.message.reply_text(
+    reply(
+        update,
         "You have chosen to skip login. Some features may be limited.\n"
         "Use /fetch, /stat, or /bet commands to continue."
     )
@@ -161,33 +176,52 @@ async def balance_command(update, context):
     Refresh the user's balance using the persistent browser session.
     """
     # Get user details from in-memory data
-    user_id = context.user_data.get("user_id")
+    user_id = context.user_data.get("user_id") or update.effective_user.id
     phone_number = context.user_data.get("phone_number")
 
-    if not user_id or not phone_number:
-        await update.message.reply_text("You are not logged in. Use /login to log in first.")
+    # After a restart the in-memory data is gone, but a stored session can still be resumed
+    if not phone_number and not await storage_state_exists(user_id):
+        reply(update, "You are not logged in. Use /login to log in first.")
         return
+    context.user_data["user_id"] = user_id
 
-    # Refresh balance using the session manager in a thread-safe manner
-    loop = asyncio.get_event_loop()
-    result = await loop.run_in_executor(
-        None,
-        validate_sportybet_credentials,
+    # Serve a recent balance from the cache; concurrent requests share one scrape
+    result = await balance_cache.get(
         user_id,
-        phone_number,
-        None,  # Password is not needed for refresh
-        session_manager,
-        True  # refresh_only=True
+        lambda: validate_sportybet_credentials(
+            user_id,
+            phone_number,
+            None,  # Password is not needed for refresh
+            session_manager,
+            refresh_only=True
+        )
     )
 
     if result["success"]:
         # Update the balance in the in-memory context
         context.user_data["balance"] = result["balance"]
 
-        # Respond with the updated balance
-        await update.message.reply_text(f"Your updated balance is: {result['balance']}")
+        # Respond with the balance, saying whether it was just fetched
+        if result["cached"]:
+            reply(
+                update,
+                f"Your balance is: {result['balance']} (cached {int(result['age'])}s ago)"
+            )
+        else:
+            if phone_number:
+                user_writes.record_balance(phone_number, result["balance"], user_id=user_id)
+            reply(update, f"Your updated balance is: {result['balance']}")
+    elif result.get("busy"):
+        reply(update, result["message"])
+    elif result.get("expired"):
+        # The stored session is no longer valid: fall back to the login flow
+        context.user_data["awaiting_phone_number"] = True
+        reply(
+            update,
+            "Your session has expired. Please enter your SportyBet phone number to log in again."
+        )
     else:
-        await update.message.reply_text(f"Could not refresh balance: {result['message']}")
+        reply(update, f"Could not refresh balance: {result['message']}")
 
 async def logout_command(update, context):
     """
@@ -195,12 +229,259 @@ async def logout_command(update, context):
     """
     user_id = context.user_data.get("user_id")
     if not user_id:
-        await update.message.reply_text("You are not logged in.")
+        reply(update, "You are not logged in.")
         return
 
-    # Use a thread executor to run the synchronous close_session function
-    loop = asyncio.get_event_loop()
-    await loop.run_in_executor(None, session_manager.close_session, user_id)
+    # Wait for a running login or refresh on the user's page to finish first
+    try:
+        async with scraper_scheduler.slot(user_id):
+            await session_manager.close_session(user_id, forget_state=True)
+    except SchedulerBusyError as e:
+        reply(update, e.args[0])
+        return
+    sportybet_http.forget(user_id)
+    balance_cache.invalidate(user_id)
     
-    await update.message.reply_text("You have been logged out. Your session has been closed.")
+    balance_watcher.unwatch(user_id)
+
+    reply(update, "You have been logged out. Your session has been closed.")
     context.user_data.clear()  # Clear session data
+
+async def watch_command(update, context):
+    """
+    Handle the /watch command. Refresh the balance in the background and report changes.
+    """
+    user_id = context.user_data.get("user_id") or update.effective_user.id
+    if not context.user_data.get("phone_number") and not await storage_state_exists(user_id):
+        reply(update, "You are not logged in. Use /login to log in first.")
+        return
+
+    context.user_data["user_id"] = user_id
+    context.user_data["chat_id"] = update.effective_chat.id
+    context.user_data[WATCH_FLAG] = True
+    balance_watcher.watch(
+        user_id,
+        update.effective_chat.id,
+        context.user_data.get("phone_number"),
+        context.user_data.get("balance")
+    )
+    reply(update, "I will message you whenever your balance changes. Use /unwatch to stop.")
+
+async def unwatch_command(update, context):
+    """
+    Handle the /unwatch command. Stop background balance refreshes for the user.
+    """
+    user_id = context.user_data.get("user_id") or update.effective_user.id
+    balance_watcher.unwatch(user_id)
+    context.user_data.pop(WATCH_FLAG, None)
+    reply(update, "Balance change messages stopped.")
+
+async def track_activity(update, context):
+    """
+    Record that a user is active, so their watched balance is refreshed more often.
+    """
+    if update.effective_user:
+        balance_watcher.touch(update.effective_user.id)
+
+async def fetch_command(update, context):
+    """
+    Handle the /fetch command. Show upcoming fixtures and odds from the shared snapshot.
+
+    Usage: /fetch [league] [page], e.g. "/fetch premier league 2".
+    """
+    if not fixture_store.matches:
+        reply(update, "Fixtures are not available yet. Please try again shortly.")
+        return
+
+    args = list(context.args or [])
+    page = int(args.pop()) if args and args[-1].isdigit() else 1
+    league = " ".join(args) or None
+    matches, total, pages = fixture_store.query(league, page, Settings.FETCH_PAGE_SIZE)
+    if not matches:
+        reply(update, f"No upcoming fixtures found for '{league}'.")
+        return
+
+    page = min(max(page, 1), pages)
+    lines = [f"Upcoming fixtures{f' for {league}' if league else ''} (page {page}/{pages}, {total} matches):"]
+    current_league = None
+    for match in matches:
+        if match.league != current_league:
+            current_league = match.league
+            lines.append(f"\n🏆 {current_league}")
+        lines.append(match.line())
+    if page < pages:
+        lines.append(f"\nNext page: /fetch {league + ' ' if league else ''}{page + 1}")
+    reply(update, "\n".join(lines))
+
+def _format_bet_stats(stats, title):
+    """
+    Render a bet rollup (or windowed aggregation) as a /stat reply.
+    """
+    settled = stats.get("won", 0) + stats.get("lost", 0)
+    lines = [title, f"Bets: {stats.get('bets', 0)} ({stats.get('open', 0)} open, {stats.get('void', 0)} void)"]
+    if settled:
+        profit = stats.get("returned", 0) - stats.get("settled_staked", 0)
+        roi = profit / stats["settled_staked"] * 100 if stats.get("settled_staked") else 0.0
+        lines.append(f"Win rate: {stats.get('won', 0) / settled * 100:.1f}% ({stats.get('won', 0)}/{settled})")
+        lines.append(f"Staked: {stats.get('settled_staked', 0):.2f}  Returned: {stats.get('returned', 0):.2f}")
+        lines.append(f"Profit: {profit:+.2f}  ROI: {roi:+.1f}%")
+    if "current_streak" in stats:
+        streak = stats["current_streak"]
+        current = f"{streak} win(s)" if streak > 0 else f"{-streak} loss(es)" if streak < 0 else "none"
+        lines.append(
+            f"Streak: {current} (best {stats.get('longest_win_streak', 0)}, "
+            f"worst {stats.get('longest_loss_streak', 0)})"
+        )
+    markets = sorted(stats.get("markets", {}).items(), key=lambda item: -item[1].get("bets", 0))
+    if markets:
+        lines.append("\nBy market:")
+    for market, entry in markets[:10]:
+        market_settled = entry.get("won", 0) + entry.get("lost", 0)
+        line = f"{market}: {entry.get('bets', 0)} bets"
+        if market_settled:
+            profit = entry.get("returned", 0) - entry.get("settled_staked", 0)
+            roi = profit / entry["settled_staked"] * 100 if entry.get("settled_staked") else 0.0
+            line += f", win rate {entry.get('won', 0) / market_settled * 100:.0f}%, ROI {roi:+.1f}%"
+        lines.append(line)
+    return "\n".join(lines)
+
+async def stat_command(update, context):
+    """
+    Handle the /stat command. All-time stats come from the precomputed rollup,
+    "/stat <days>" aggregates the bets placed in that window.
+    """
+    user_id = context.user_data.get("user_id") or update.effective_user.id
+    args = context.args or []
+    if args and args[0].isdigit():
+        days = int(args[0])
+        since = datetime.now(timezone.utc) - timedelta(days=days)
+        stats = await aggregate_bet_stats(user_id, since)
+        title = f"📊 Your betting stats, last {days} day(s):"
+    else:
+        stats = await get_bet_stats(user_id)
+        title = "📊 Your betting stats, all-time:"
+
+    if not stats:
+        reply(update, "No bets recorded yet. Use /bet to place one.")
+        return
+    reply(update, _format_bet_stats(stats, title))
+
+def _format_slip(selections):
+    """
+    Render the selections of a bet slip with their combined odds.
+    """
+    lines = [f"🧾 Your bet slip ({len(selections)} selection(s)):"]
+    for selection in selections:
+        lines.append(f"{selection['match']}: {selection['market']} {selection['outcome']} @ {selection['odds']}")
+    lines.append(f"Total odds: {total_odds(selections)}")
+    return "\n".join(lines)
+
+async def bet_command(update, context):
+    """
+    Handle the /bet command. Selections are collected in a slip that is placed in
+    one go.
+
+    Usage:
+        /bet <match> <outcome> [market] - add a selection, e.g. "/bet 1042 X"
+        /bet slip - show the slip
+        /bet place <stake> - place the slip
+        /bet clear - empty the slip
+    """
+    args = context.args or []
+    action = args[0].lower() if args else "slip"
+    slip = context.user_data.get(SLIP_KEY)
+    selections = slip["selections"] if slip else []
+
+    if action == "slip":
+        if not selections:
+            reply(
+                update,
+                "Your bet slip is empty. Add selections with /bet <match> <outcome>, using the #numbers from /fetch."
+            )
+            return
+        reply(update, _format_slip(selections) + "\nPlace it with /bet place <stake>.")
+        return
+
+    if action == "clear":
+        clear_slip(context.user_data)
+        reply(update, "Your bet slip is empty.")
+        return
+
+    if action == "place":
+        await _place_slip(update, context, slip, args[1:])
+        return
+
+    if len(args) < 2:
+        reply(update, "Usage: /bet <match> <outcome> [market], e.g. /bet 1042 X")
+        return
+    match = fixture_store.get(args[0].lstrip("#"))
+    if match is None:
+        reply(update, f"Match #{args[0].lstrip('#')} is not among the upcoming fixtures. See /fetch.")
+        return
+    found = match.find_outcome(args[1], " ".join(args[2:]) or None)
+    if found is None or not found[4]:
+        reply(update, f"No odds for '{args[1]}' on {match.home} vs {match.away}.")
+        return
+    try:
+        slip = add_selection(context.user_data, match, *found)
+    except ValueError as e:
+        reply(update, str(e))
+        return
+    reply(update, _format_slip(slip["selections"]) + "\nPlace it with /bet place <stake>.")
+
+async def _place_slip(update, context, slip, args):
+    """
+    Place the user's slip with the stake given in `args`.
+    """
+    if not slip or not slip["selections"]:
+        reply(update, "Your bet slip is empty. Add selections with /bet <match> <outcome>.")
+        return
+    try:
+        stake = round(float(args[0]), 2)
+    except (IndexError, ValueError):
+        stake = 0
+    if stake <= 0:
+        reply(update, "Usage: /bet place <stake>, e.g. /bet place 100")
+        return
+
+    user_id = context.user_data.get("user_id") or update.effective_user.id
+    if not context.user_data.get("phone_number") and not await storage_state_exists(user_id):
+        reply(update, "You are not logged in. Use /login to log in first.")
+        return
+    context.user_data["user_id"] = user_id
+
+    result = await bet_placer.place(user_id, slip, stake, session_manager)
+    if result.get("unknown"):
+        # Placing it again could place it twice: leave it to the user to check
+        reply(
+            update,
+            "⚠️ SportyBet did not confirm this bet, so it may or may not have been placed. "
+            "Please check your bet history on SportyBet before placing it again. "
+            "Use /bet clear to start a new slip."
+        )
+    elif result.get("duplicate"):
+        if result.get("pending"):
+            reply(update, "This slip is already being placed.")
+        elif result["success"]:
+            clear_slip(context.user_data)
+            reply(update, f"This slip was already placed (bet ID {result['bet_id']}).")
+        else:
+            reply(update, f"Could not place the bet: {result['message']}")
+    elif result["success"]:
+        if context.user_data.get(SLIP_KEY) is slip:
+            clear_slip(context.user_data)
+        reply(
+            update,
+            f"✅ Bet placed! ID: {result['bet_id']}\n"
+            f"Stake: {stake}  Total odds: {result['odds']}  Potential win: {stake * result['odds']:.2f}"
+        )
+    elif result.get("busy"):
+        reply(update, result["message"])
+    elif result.get("expired"):
+        context.user_data["awaiting_phone_number"] = True
+        reply(
+            update,
+            "Your session has expired, your slip is kept. Please enter your SportyBet phone number to log in again."
+        )
+    else:
+        reply(update, f"Could not place the bet: {result['message']}")
@@ -0,0 +1,93 @@
+"""
+Recognizes updates Telegram delivers more than once.
+
+Telegram redelivers an update when the webhook is slow or fails, and every
+redelivery used to run the handlers again, e.g. a second browser login and bcrypt
+hash for the same password message. The webhook checks each update_id here before
+queueing the update: the most recent IDs are kept in memory, and with several
+workers a TTL collection in MongoDB lets one worker recognize updates another one
+has already taken.
+"""
+import logging
+from collections import OrderedDict
+
+from app.config.settings import Settings
+from app.core.database import forget_update, mark_update_seen
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateDeduplicator:
+    """
+    Bounded window of seen update IDs, optionally backed by MongoDB.
+    """
+    def __init__(self, window, shared):
+        self.window = window
+        self.shared = shared
+        self._seen = OrderedDict()  # update_id -> None, oldest first
+        self.checked = 0
+        self.duplicates_memory = 0
+        self.duplicates_shared = 0
+        self.released = 0
+        self.shared_errors = 0
+
+    async def is_duplicate(self, update_id):
+        """
+        Check an update and remember it as taken.
+
+        Returns:
+            bool: True if the update was seen before and must be dropped.
+        """
+        self.checked += 1
+        if update_id in self._seen:
+            self.duplicates_memory += 1
+            return True
+        self._seen[update_id] = None
+        if len(self._seen) > self.window:
+            self._seen.popitem(last=False)
+
+        if self.shared:
+            try:
+                if not await mark_update_seen(update_id):
+                    self.duplicates_shared += 1
+                    return True
+            except Exception as e:
+                # Processing a rare duplicate beats dropping updates while MongoDB is unreachable
+                self.shared_errors += 1
+                logger.error(f"Could not record update {update_id} in MongoDB: {e}")
+        return False
+
+    async def release(self, update_id):
+        """
+        Forget an update that was not taken after all (e.g. the queue was full), so
+        that Telegram's redelivery of it is processed.
+        """
+        self.released += 1
+        self._seen.pop(update_id, None)
+        if self.shared:
+            try:
+                await forget_update(update_id)
+            except Exception as e:
+                self.shared_errors += 1
+                logger.error(f"Could not release update {update_id} in MongoDB: {e}")
+
+    def suppressed(self):
+        return self.duplicates_memory + self.duplicates_shared
+
+    def stats(self):
+        """
+        Return the window size and suppressed duplicate counts.
+        """
+        return {
+            "shared": self.shared,
+            "window": len(self._seen),
+            "checked": self.checked,
+            "suppressed": self.suppressed(),
+            "suppressed_memory": self.duplicates_memory,
+            "suppressed_shared": self.duplicates_shared,
+            "released": self.released,
+            "shared_errors": self.shared_errors,
+        }
+
+
+update_deduplicator = UpdateDeduplicator(window=Settings.UPDATE_DEDUP_WINDOW, shared=Settings.UPDATE_DEDUP_SHARED)
@@ -8,7 +8,7 @@ import logging
 import os
 import pytz
 from telegram import Update
-from telegram.ext import Application, JobQueue, CommandHandler, MessageHandler, filters
+from telegram.ext import Application, JobQueue, CommandHandler, MessageHandler, TypeHandler, filters
 from app.bot.commands import (
     login_command,
     skip_command,
@@ -16,8 +16,26 @@ from app.bot.commands import (
     help_command,
     balance_command,
     text_handler,
-    logout_command
+    logout_command,
+    watch_command,
+    fetch_command,
+    bet_command,
+    stat_command,
+    unwatch_command,
+    track_activity
 )  # Import handlers from commands.py
+from app.bot.balance_watcher import balance_watcher
+from app.bot.dedup import update_deduplicator
+from app.bot.outbound import outbound
+from app.bot.persistence import MongoPersistence
+from app.bot.routing import session_router
+from app.bot.update_queue import UpdateQueueFull, update_dispatcher
+from app.config.settings import Settings
+from app.core.async_session_manager import session_manager
+from app.core.bet_settlement import bet_settler
+from app.core.fixtures import fixture_fetcher
+from app.core.metrics import WEBHOOK_SECONDS
+from app.core.utils import deletion_scheduler
 from fastapi import Request, Response
 
 # Enable logging
@@ -39,46 +57,100 @@ application: Application = None
 async def webhook_handler(request: Request):
     """
     FastAPI webhook handler to receive updates from Telegram.
+
+    The update is only parsed and queued; it is acknowledged before it is processed.
+    Updates seen before (Telegram redeliveries) are acknowledged and dropped. With
+    several workers, updates of users owned by another worker are forwarded to it.
     """
+    with WEBHOOK_SECONDS.time():
+        return await _handle_webhook(request)
+
+
+async def _handle_webhook(request: Request):
     request_json = await request.json()
+    update_id = None  # Set once the update is taken, so it can be released if queueing fails
     try:
-        update = Update.de_json(request_json, application.bot)
-        if application:
-            await application.process_update(update)
+        if application and application.running:
+            update = Update.de_json(request_json, application.bot)
+            user = update.effective_user
+            forwarded = session_router.enabled and session_router.is_forwarded(request)
+            if not forwarded:  # The forwarding worker has already checked it
+                if await update_deduplicator.is_duplicate(update.update_id):
+                    logger.info(f"Dropping duplicate update {update.update_id}.")
+                    return Response(status_code=200)
+                update_id = update.update_id
+            if session_router.enabled and user and not forwarded:
+                owner_url = await session_router.owner_url(user.id)
+                if owner_url:
+                    if await session_router.forward(owner_url, request_json):
+                        return Response(status_code=200)
+                    # Let Telegram redeliver; by then the owner is back or has been replaced
+                    session_router.forget(user.id)
+                    await update_deduplicator.release(update_id)
+                    return Response(status_code=503, content="Owner worker unavailable")
+            update_dispatcher.submit(update)
             return Response(status_code=200)
         else:
-            logger.error("Application not initialized in webhook_handler.")
-            return Response(status_code=500, content="Application not initialized")
+            # Telegram redelivers, so updates arriving during startup are not lost
+            logger.warning("Update received before the bot application is running.")
+            return Response(status_code=503, content="Application not initialized")
+    except UpdateQueueFull as e:
+        logger.warning(f"Rejecting update, queue is full: {e}")
+        if update_id is not None:
+            await update_deduplicator.release(update_id)
+        return Response(status_code=503, content="Update queue full")
     except Exception as e:
         logger.error(f"Webhook handler error: {e}", exc_info=True)
+        if update_id is not None:
+            await update_deduplicator.release(update_id)
         return Response(status_code=500, content="Webhook handler error")
 
 
-async def start_bot_listener(webhook_url: str) -> None:
+async def start_bot_listener(webhook_url: str) -> bool:
     """
     Start the Telegram bot listener using webhooks.
+
+    The /webhook route itself is registered by main.py and answers 503 until the
+    application is running.
+
+    Returns:
+        bool: True once the bot is processing updates.
     """
     global application
     logger.info("Starting Telegram bot listener...")
 
     if not TELEGRAM_BOT_TOKEN:
         logger.error("Telegram bot token not provided. Bot listener cannot start.")
-        return
+        return False
     if not webhook_url:
         logger.error("Webhook URL not provided. Bot listener cannot start.")
-        return
+        return False
+    if session_router.enabled and not Settings.WORKER_SHARED_SECRET:
+        logger.error("WORKER_SHARED_SECRET is required when WORKER_URL is set. Bot listener cannot start.")
+        return False
 
     if application is None:
         logger.info("Building Telegram bot application...")
         try:
             job_queue = JobQueue()
             job_queue.scheduler.timezone = pytz.utc
-            application = Application.builder().token(TELEGRAM_BOT_TOKEN).job_queue(job_queue).build()
+            persistence = MongoPersistence(
+                update_interval=Settings.PERSISTENCE_UPDATE_INTERVAL,
+                shared=session_router.enabled,
+            )
+            application = (
+                Application.builder()
+                .token(TELEGRAM_BOT_TOKEN)
+                .base_url(Settings.TELEGRAM_API_BASE_URL)
+                .job_queue(job_queue)
+                .persistence(persistence)
+                .build()
+            )
             await application.initialize()
             logger.info("Telegram bot application built and initialized.")
         except Exception as app_build_exception:
             logger.error(f"Error building Telegram bot application: {app_build_exception}", exc_info=True)
-            return
+            return False
     else:
         logger.info("Telegram bot application already initialized.")
 
@@ -90,11 +162,27 @@ async def start_bot_listener(webhook_url: str) -> None:
         application.add_handler(CommandHandler("skip", skip_command)) 
         application.add_handler(CommandHandler("balance", balance_command))
         application.add_handler(CommandHandler("logout", logout_command))
+        application.add_handler(CommandHandler("fetch", fetch_command))
+        application.add_handler(CommandHandler("stat", stat_command))
+        application.add_handler(CommandHandler("bet", bet_command))
+        application.add_handler(CommandHandler("watch", watch_command))
+        application.add_handler(CommandHandler("unwatch", unwatch_command))
+        application.add_handler(TypeHandler(Update, track_activity, block=False), group=-1)
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, text_handler))
         logger.info("Command handlers registered.")
     except Exception as handler_error:
         logger.error(f"Error registering command handlers: {handler_error}", exc_info=True)
-        return
+        return False
+
+    # Start the job queue and persistence (no updater: updates arrive through the webhook)
+    await application.start()
+    outbound.start(application.bot)
+    await session_router.start()
+    await deletion_scheduler.start(application.bot, application.job_queue)
+    fixture_fetcher.start(application.job_queue)
+    bet_settler.start(application.job_queue)
+    balance_watcher.start(application, session_manager)
+    update_dispatcher.start(application.process_update)
 
     webhook_full_url = f"{webhook_url}/webhook"
     logger.info(f"Attempting to set webhook: {webhook_full_url}")
@@ -104,11 +192,21 @@ async def start_bot_listener(webhook_url: str) -> None:
         logger.info(f"Webhook URL set to: {webhook_full_url}")
     except Exception as e:
         logger.error(f"Failed to set webhook: {e}", exc_info=True)
-        return
-
-    # Add FastAPI route for webhook
-    from main import app
-    app.add_api_route("/webhook", webhook_handler, methods=["POST"])
-    logger.info("FastAPI webhook route added.")
+        return False
 
     logger.info("Telegram bot listener started with webhook.")
+    return True
+
+
+async def stop_bot_listener() -> None:
+    """
+    Stop processing updates, letting queued ones finish first.
+    """
+    await update_dispatcher.stop()
+    logger.info("Telegram update dispatcher stopped.")
+    await balance_watcher.stop()
+    await outbound.stop()
+    await session_router.stop()
+    if application and application.running:
+        await application.stop()
+        await application.shutdown()
@@ -0,0 +1,312 @@
+"""
+Rate-limited, coalescing queue for outgoing Telegram messages.
+
+Handlers and background jobs queue messages with `send` (or `reply`) and carry on;
+they do not wait for Telegram. A single dispatcher sends them while staying under a
+global and a per-chat token bucket, so bursts never run into Telegram's flood limits.
+Messages queued for a chat while it waits for its turn are merged into one, so a
+handler that replies two or three times for one event costs one API call. A 429
+pauses only the affected chat for the `retry_after` Telegram asks for, and network
+errors are retried with exponential backoff.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+
+from app.config.settings import Settings
+from app.core.metrics import TELEGRAM_SEND_SECONDS
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_LENGTH = 4096  # Telegram's limit for one text message
+
+
+class TokenBucket:
+    """
+    Allows `rate` events per second on average, with bursts of up to `burst`.
+    """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """
+        Return the seconds until a token is available (0 if one is available now).
+        """
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now):
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class _Pending:
+    """
+    One queued message, possibly merged from several, and the futures waiting on it.
+    """
+    __slots__ = ("text", "kwargs", "futures", "queued_at", "attempts")
+
+    def __init__(self, text, kwargs, future, queued_at):
+        self.text = text
+        self.kwargs = kwargs
+        self.futures = [future]
+        self.queued_at = [queued_at]
+        self.attempts = 0
+
+    def absorb(self, other):
+        """
+        Append `other` to this message if both are plain messages with the same options.
+        """
+        if other.kwargs != self.kwargs or len(self.text) + 2 + len(other.text) > MAX_MESSAGE_LENGTH:
+            return False
+        self.text = f"{self.text}\n\n{other.text}"
+        self.futures += other.futures
+        self.queued_at += other.queued_at
+        return True
+
+
+class OutboundSender:
+    """
+    Per-chat FIFO queues drained by one dispatcher under global and per-chat limits.
+
+    A chat with pending messages and no send in flight is in the ready heap once,
+    keyed by the earliest time its bucket (or a retry-after pause) lets it send.
+    """
+    def __init__(self, global_rate, global_burst, chat_rate, chat_burst, max_retries):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.bot = None
+        self._global = TokenBucket(global_rate, global_burst)
+        self._buckets = {}  # chat_id -> TokenBucket
+        self._queues = {}  # chat_id -> deque of _Pending, present while the chat has messages or a send in flight
+        self._paused = {}  # chat_id -> monotonic time a retry-after pause ends
+        self._ready = []  # heap of (not before, seq, chat_id)
+        self._scheduled = set()  # Chats in the ready heap
+        self._sending = set()  # Chats with a send in flight
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._deliveries = set()
+        self.pending = 0
+        self.sent = 0
+        self.merged = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failed = 0
+        self.throttle_wait_total = 0.0
+
+    def start(self, bot):
+        """
+        Start sending with `bot` on the running loop. Messages queued earlier go out now.
+        """
+        self.bot = bot
+        self._task = asyncio.get_running_loop().create_task(self._dispatch())
+        self._wakeup.set()
+
+    async def stop(self):
+        """
+        Send what is still queued, for at most `OUTBOUND_DRAIN_TIMEOUT` seconds, then stop.
+        """
+        deadline = time.monotonic() + Settings.OUTBOUND_DRAIN_TIMEOUT
+        while (self.pending or self._deliveries) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self.pending:
+            logger.warning(f"Dropping {self.pending} outgoing message(s) still queued at shutdown.")
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def send(self, chat_id, text, **kwargs):
+        """
+        Queue a message and return at once.
+
+        Args:
+            chat_id: Chat to send to.
+            text: Message text.
+            **kwargs: Passed on to `Bot.send_message`; only messages with the same
+                options are merged.
+
+        Returns:
+            asyncio.Future: Resolves to the sent `Message`, which may carry other
+            messages merged with this one. Failures are logged whether or not it is
+            awaited.
+        """
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(self._log_failure)
+        pending = _Pending(text, kwargs, future, time.monotonic())
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = deque()
+        if queue and queue[-1].absorb(pending):
+            self.merged += 1
+        else:
+            queue.append(pending)
+            self.pending += 1
+        self._schedule(chat_id)
+        return future
+
+    def _log_failure(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning(f"Outgoing message failed: {future.exception()}")
+
+    def _bucket(self, chat_id):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _schedule(self, chat_id):
+        if chat_id in self._scheduled or chat_id in self._sending or not self._queues.get(chat_id):
+            return
+        now = time.monotonic()
+        not_before = max(now + self._bucket(chat_id).delay(now), self._paused.get(chat_id, 0))
+        heapq.heappush(self._ready, (not_before, next(self._seq), chat_id))
+        self._scheduled.add(chat_id)
+        self._wakeup.set()
+
+    async def _dispatch(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            wait = None
+            if self._ready:
+                wait = max(self._ready[0][0] - now, self._global.delay(now))
+            if wait is None or wait > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            not_before, _, chat_id = heapq.heappop(self._ready)
+            self._scheduled.discard(chat_id)
+            bucket = self._bucket(chat_id)
+            delay = bucket.delay(now)
+            if delay > 0:  # Can happen after a pause was scheduled from a stale bucket state
+                self._schedule(chat_id)
+                continue
+            bucket.take(now)
+            self._global.take(now)
+            queue = self._queues[chat_id]
+            message = queue.popleft()
+            while queue and message.absorb(queue[0]):  # Everything that piled up while waiting
+                queue.popleft()
+                self.pending -= 1
+                self.merged += 1
+            self.pending -= 1
+            self.throttle_wait_total += now - message.queued_at[0]
+            self._sending.add(chat_id)
+            task = asyncio.get_running_loop().create_task(self._deliver(chat_id, message))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, chat_id, message):
+        # Imported here: the API routes import this module, and PTB is only loaded with the bot
+        from telegram.error import NetworkError, RetryAfter, TelegramError
+
+        retry_at = None
+        try:
+            result = await self.bot.send_message(chat_id=chat_id, text=message.text, **message.kwargs)
+        except RetryAfter as e:
+            self.throttled += 1
+            retry_after = getattr(e.retry_after, "total_seconds", lambda: e.retry_after)()
+            retry_at = time.monotonic() + retry_after
+            logger.warning(f"Flood control for chat_id={chat_id}, pausing it for {retry_after}s.")
+            self._retry(chat_id, message, e)
+        except NetworkError as e:  # Includes timeouts; not raised for errors Telegram answered
+            retry_at = time.monotonic() + min(2 ** message.attempts, 30)
+            self._retry(chat_id, message, e)
+        except TelegramError as e:  # E.g. the user blocked the bot: retrying cannot help
+            self._fail(message, e)
+        except Exception as e:
+            self._fail(message, e)
+        else:
+            now = time.monotonic()
+            self.sent += 1
+            for queued_at, future in zip(message.queued_at, message.futures):
+                TELEGRAM_SEND_SECONDS.observe(now - queued_at)
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._sending.discard(chat_id)
+            if retry_at is not None:
+                self._paused[chat_id] = retry_at
+            self._cleanup(chat_id)
+            self._schedule(chat_id)
+
+    def _retry(self, chat_id, message, error):
+        message.attempts += 1
+        if message.attempts > self.max_retries:
+            self._fail(message, error)
+            return
+        self.retries += 1
+        self._queues[chat_id].appendleft(message)  # Keep the chat's order
+        self.pending += 1
+
+    def _fail(self, message, error):
+        self.failed += 1
+        for future in message.futures:
+            if not future.done():
+                future.set_exception(error)
+
+    def _cleanup(self, chat_id):
+        if self._queues.get(chat_id):
+            return
+        self._queues.pop(chat_id, None)
+        if self._paused.get(chat_id, 0) <= time.monotonic():
+            self._paused.pop(chat_id, None)
+        # Drop idle buckets once they have refilled, so they do not pile up per chat ever seen
+        if len(self._buckets) > 10000:
+            now = time.monotonic()
+            for idle in [c for c, b in self._buckets.items() if c not in self._queues and b.full(now)]:
+                del self._buckets[idle]
+
+    def stats(self):
+        """
+        Return queue sizes and send, merge, retry and throttling counters.
+        """
+        dequeued = self.sent + self.failed + self.retries
+        return {
+            "pending": self.pending,
+            "chats_waiting": len(self._queues),
+            "sending": len(self._sending),
+            "paused_chats": sum(1 for until in self._paused.values() if until > time.monotonic()),
+            "sent": self.sent,
+            "merged": self.merged,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "failed": self.failed,
+            "throttle_wait_avg_ms": round(self.throttle_wait_total / dequeued * 1000, 1) if dequeued else 0.0,
+        }
+
+
+outbound = OutboundSender(
+    global_rate=Settings.OUTBOUND_GLOBAL_RATE,
+    global_burst=Settings.OUTBOUND_GLOBAL_BURST,
+    chat_rate=Settings.OUTBOUND_CHAT_RATE,
+    chat_burst=Settings.OUTBOUND_CHAT_BURST,
+    max_retries=Settings.OUTBOUND_MAX_RETRIES,
+)
+
+
+def reply(update, text, **kwargs):
+    """
+    Queue a reply in the chat an update came from. See `OutboundSender.send`.
+    """
+    return outbound.send(update.effective_chat.id, text, **kwargs)
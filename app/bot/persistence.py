@@ -0,0 +1,181 @@
+"""
+MongoDB-backed persistence for the Telegram application.
+
+`context.user_data` (and chat/bot data) is kept in memory as usual and mirrored to
+MongoDB, so the login state machine survives restarts and can be picked up by any
+worker. Writes only touch a local cache; a background task batches them into one
+`bulk_write`.
+"""
+import asyncio
+import copy
+import logging
+
+from pymongo import UpdateOne
+from telegram.ext import BasePersistence, PersistenceInput
+
+from app.core.database import get_database
+from app.core.metrics import MONGO_WRITE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "bot_persistence"
+
+
+class MongoPersistence(BasePersistence):
+    """
+    `BasePersistence` implementation on the shared Motor client.
+
+    Documents are keyed "user:<id>", "chat:<id>", "bot" and "conversation:<name>".
+    Every document carries a `version` that is bumped on each write. With `shared`
+    enabled (several workers), `refresh_user_data` compares it with the version this
+    worker last saw and reloads the data another worker wrote in the meantime.
+    """
+    def __init__(self, update_interval=5, shared=False):
+        super().__init__(store_data=PersistenceInput(callback_data=False), update_interval=update_interval)
+        self.shared = shared
+        self._versions = {}  # document _id -> last version read or written here
+        self._snapshots = {}  # document _id -> data as last written
+        self._dirty = {}  # document _id -> data waiting to be written
+        self._flushing = set()  # document _ids of the write in flight
+        self._flush_lock = asyncio.Lock()
+        self._flush_task = None
+
+    @property
+    def _collection(self):
+        return get_database()[COLLECTION]
+
+    async def _load(self, kind):
+        """
+        Load every document of one kind, keyed by the numeric ID after the prefix.
+        """
+        loaded = {}
+        async for document in self._collection.find({"kind": kind}):
+            self._versions[document["_id"]] = document.get("version", 0)
+            self._snapshots[document["_id"]] = document["data"]
+            loaded[int(document["_id"].split(":", 1)[1])] = copy.deepcopy(document["data"])
+        return loaded
+
+    def _stage(self, document_id, kind, data):
+        """
+        Queue a document for the next background flush if its data changed.
+        """
+        if self._snapshots.get(document_id) == data:
+            return
+        snapshot = copy.deepcopy(data)
+        self._snapshots[document_id] = snapshot
+        self._dirty[document_id] = (kind, snapshot)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+
+    async def get_user_data(self):
+        return await self._load("user")
+
+    async def get_chat_data(self):
+        return await self._load("chat")
+
+    async def get_bot_data(self):
+        document = await self._collection.find_one({"_id": "bot"})
+        if not document:
+            return {}
+        self._versions["bot"] = document.get("version", 0)
+        self._snapshots["bot"] = document["data"]
+        return copy.deepcopy(document["data"])
+
+    async def get_callback_data(self):
+        return None  # Callback data is not stored
+
+    async def get_conversations(self, name):
+        document = await self._collection.find_one({"_id": f"conversation:{name}"})
+        if not document:
+            return {}
+        self._snapshots[document["_id"]] = document["data"]
+        return {tuple(entry["key"]): entry["state"] for entry in document["data"]}
+
+    async def update_conversation(self, name, key, new_state):
+        document_id = f"conversation:{name}"
+        entries = [entry for entry in self._snapshots.get(document_id, []) if tuple(entry["key"]) != key]
+        if new_state is not None:
+            entries.append({"key": list(key), "state": new_state})
+        self._stage(document_id, "conversation", entries)
+
+    async def update_user_data(self, user_id, data):
+        self._stage(f"user:{user_id}", "user", data)
+
+    async def update_chat_data(self, chat_id, data):
+        self._stage(f"chat:{chat_id}", "chat", data)
+
+    async def update_bot_data(self, data):
+        self._stage("bot", "bot", data)
+
+    async def update_callback_data(self, data):
+        pass  # Callback data is not stored
+
+    async def drop_chat_data(self, chat_id):
+        await self._drop(f"chat:{chat_id}")
+
+    async def drop_user_data(self, user_id):
+        await self._drop(f"user:{user_id}")
+
+    async def _drop(self, document_id):
+        self._dirty.pop(document_id, None)
+        self._snapshots.pop(document_id, None)
+        self._versions.pop(document_id, None)
+        await self._collection.delete_one({"_id": document_id})
+
+    async def refresh_user_data(self, user_id, user_data):
+        """
+        Pick up changes another worker made to this user's data.
+
+        Only the `version` field is read unless it differs from the one known here.
+        """
+        if not self.shared:
+            return
+        document_id = f"user:{user_id}"
+        if document_id in self._dirty or document_id in self._flushing:
+            return  # Local changes are newer than anything stored
+        document = await self._collection.find_one({"_id": document_id}, {"version": 1})
+        if not document or document.get("version", 0) == self._versions.get(document_id):
+            return
+        document = await self._collection.find_one({"_id": document_id})
+        self._versions[document_id] = document.get("version", 0)
+        self._snapshots[document_id] = document["data"]
+        user_data.clear()
+        user_data.update(copy.deepcopy(document["data"]))
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass  # Chat data is not shared between workers
+
+    async def refresh_bot_data(self, bot_data):
+        pass  # Bot data is not shared between workers
+
+    async def flush(self):
+        """
+        Write every staged document with a single `bulk_write`.
+        """
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, {}
+            versions = {document_id: self._versions.get(document_id, 0) + 1 for document_id in dirty}
+            operations = [
+                UpdateOne(
+                    {"_id": document_id},
+                    {"$set": {"kind": kind, "data": data, "version": versions[document_id]}},
+                    upsert=True
+                )
+                for document_id, (kind, data) in dirty.items()
+            ]
+            # Until the write lands, the stored versions lag behind the local data:
+            # refresh_user_data must not mistake that for another worker's change
+            self._flushing = set(dirty)
+            try:
+                with MONGO_WRITE_SECONDS.labels(COLLECTION).time():
+                    await self._collection.bulk_write(operations, ordered=False)
+            except Exception as e:
+                logger.error(f"Failed to flush bot persistence, will retry: {e}")
+                for document_id, staged in dirty.items():
+                    self._dirty.setdefault(document_id, staged)
+                return
+            finally:
+                self._flushing = set()
+            self._versions.update(versions)
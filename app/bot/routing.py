@@ -0,0 +1,183 @@
+"""
+Routing of Telegram updates to the worker that owns the user's browser session.
+
+Browser sessions live in one process. When the bot runs as several workers (each
+reachable at its own `WORKER_URL`), the first worker that handles a user claims
+ownership in MongoDB, and every other worker forwards that user's updates to it.
+Ownership moves to the receiving worker when the owner stops sending heartbeats.
+"""
+import asyncio
+import hmac
+import logging
+import os
+import socket
+import time
+
+import httpx
+from pymongo.errors import DuplicateKeyError
+
+from app.config.settings import Settings
+from app.core.database import get_database
+
+logger = logging.getLogger(__name__)
+
+# Header marking an update forwarded by another worker, so it is never forwarded again
+FORWARDED_HEADER = "X-Forwarded-Update"
+
+
+class SessionRouter:
+    """
+    Tracks live workers and user ownership, and forwards updates to owners.
+
+    Routing is disabled when `WORKER_URL` is not set, i.e. in single-worker setups.
+    """
+    def __init__(self, worker_id, worker_url, heartbeat_interval, owner_cache_ttl):
+        self.worker_id = worker_id
+        self.worker_url = worker_url
+        self.heartbeat_interval = heartbeat_interval
+        self.owner_cache_ttl = owner_cache_ttl
+        self.enabled = bool(worker_url)
+        self._owners = {}  # user_id -> (worker_id, url or None if local, cached at)
+        self._heartbeat_task = None
+        self._client = None
+        self.forwarded = 0
+        self.takeovers = 0
+
+    async def start(self):
+        """
+        Register this worker and start sending heartbeats.
+        """
+        if not self.enabled:
+            return
+        if not Settings.WORKER_SHARED_SECRET:
+            # Without it anyone reaching /webhook could pass updates off as forwarded
+            raise ValueError("WORKER_SHARED_SECRET must be set when WORKER_URL is set.")
+        await self._heartbeat()
+        self._client = httpx.AsyncClient(timeout=Settings.HTTP_TIMEOUT)
+        self._heartbeat_task = asyncio.get_running_loop().create_task(self._heartbeat_loop())
+        logger.info(f"Session routing enabled for worker {self.worker_id} at {self.worker_url}.")
+
+    async def stop(self):
+        """
+        Stop heartbeats and deregister, so other workers take over this worker's users.
+        """
+        if not self.enabled or self._heartbeat_task is None:
+            return
+        self._heartbeat_task.cancel()
+        await asyncio.gather(self._heartbeat_task, return_exceptions=True)
+        await self._client.aclose()
+        await get_database()["workers"].delete_one({"_id": self.worker_id})
+
+    async def _heartbeat(self):
+        await get_database()["workers"].update_one(
+            {"_id": self.worker_id},
+            {"$set": {"url": self.worker_url, "heartbeat_at": time.time()}},
+            upsert=True
+        )
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self._heartbeat()
+            except Exception as e:
+                logger.warning(f"Worker heartbeat failed: {e}")
+
+    async def _live_worker_url(self, worker_id):
+        """
+        Return the URL of a worker whose heartbeat is recent, else None.
+        """
+        worker = await get_database()["workers"].find_one({"_id": worker_id})
+        if worker and time.time() - worker["heartbeat_at"] < self.heartbeat_interval * 3:
+            return worker["url"]
+        return None
+
+    async def owner_url(self, user_id):
+        """
+        Return the URL of the worker owning a user, or None if it is this worker.
+
+        Users without a live owner are claimed by this worker.
+        """
+        cached = self._owners.get(user_id)
+        if cached and time.monotonic() - cached[2] < self.owner_cache_ttl:
+            return cached[1]
+
+        owners = get_database()["session_owners"]
+        owner = await owners.find_one({"_id": user_id})
+        url = None
+        if owner and owner["worker_id"] != self.worker_id:
+            url = await self._live_worker_url(owner["worker_id"])
+        if owner is None or (owner["worker_id"] != self.worker_id and url is None):
+            # Nobody owns the user yet, or the owner is gone: claim it, unless another
+            # worker has claimed it in the meantime
+            previous = owner["worker_id"] if owner else None
+            try:
+                result = await owners.update_one(
+                    {"_id": user_id, "worker_id": previous},
+                    {"$set": {"worker_id": self.worker_id, "claimed_at": time.time()}},
+                    upsert=owner is None
+                )
+                lost_race = owner is not None and result.modified_count == 0
+            except DuplicateKeyError:
+                lost_race = True
+            if lost_race:
+                self._owners.pop(user_id, None)
+                return await self.owner_url(user_id)
+            if owner is not None:
+                self.takeovers += 1
+        self._owners[user_id] = (owner["worker_id"] if url else self.worker_id, url, time.monotonic())
+        return url
+
+    async def forward(self, url, payload):
+        """
+        Post a raw update to the owning worker's webhook.
+
+        Returns:
+            bool: True if the owner accepted the update.
+        """
+        try:
+            response = await self._client.post(
+                f"{url}/webhook",
+                json=payload,
+                headers={FORWARDED_HEADER: Settings.WORKER_SHARED_SECRET}
+            )
+            if response.status_code == 200:
+                self.forwarded += 1
+                return True
+            logger.warning(f"Owner worker at {url} answered {response.status_code}.")
+        except httpx.HTTPError as e:
+            logger.warning(f"Failed to forward update to {url}: {e}")
+        return False
+
+    def is_forwarded(self, request):
+        """
+        Check whether a webhook request was forwarded by another worker.
+        """
+        secret = Settings.WORKER_SHARED_SECRET
+        header = request.headers.get(FORWARDED_HEADER)
+        if not secret or header is None:
+            return False
+        return hmac.compare_digest(header.encode(), secret.encode())
+
+    def forget(self, user_id):
+        """
+        Drop the cached owner of a user, e.g. after a failed forward.
+        """
+        self._owners.pop(user_id, None)
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "worker_id": self.worker_id,
+            "cached_owners": len(self._owners),
+            "forwarded": self.forwarded,
+            "takeovers": self.takeovers,
+        }
+
+
+session_router = SessionRouter(
+    worker_id=Settings.WORKER_ID or f"{socket.gethostname()}:{os.getpid()}",
+    worker_url=Settings.WORKER_URL,
+    heartbeat_interval=Settings.WORKER_HEARTBEAT_INTERVAL,
+    owner_cache_ttl=Settings.WORKER_OWNER_CACHE_TTL,
+)
@@ -0,0 +1,167 @@
+"""
+Bounded queue and worker pool for incoming Telegram updates.
+
+The webhook only parses and enqueues an update, then acknowledges it right away.
+Workers process updates concurrently across users while keeping the updates of a
+single user strictly in order, which the login state machine in `context.user_data`
+relies on.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+
+from app.config.settings import Settings
+from app.core.metrics import UPDATE_PROCESSING_SECONDS, UPDATE_QUEUE_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateQueueFull(Exception):
+    """
+    Raised when an update is rejected because the queue is at capacity.
+    """
+
+
+def _update_key(update):
+    """
+    Return the key updates are ordered by: the user, else the chat.
+    """
+    if update.effective_user:
+        return update.effective_user.id
+    if update.effective_chat:
+        return update.effective_chat.id
+    return None
+
+
+class UpdateDispatcher:
+    """
+    Per-user ordered, cross-user concurrent processing of Telegram updates.
+
+    Each user has a FIFO of pending updates. A user with pending updates is in the
+    ready queue at most once, and only the worker that took the user from it may
+    process that user's next update, so one user's updates never run concurrently.
+    After each update the user goes to the back of the ready queue, which keeps a
+    busy user from starving the others.
+
+    When `max_size` updates are pending, the `policy` decides: "reject" raises
+    `UpdateQueueFull` so Telegram redelivers later, "drop" discards the new update.
+    """
+    def __init__(self, workers, max_size, policy="reject"):
+        self.workers = workers
+        self.max_size = max_size
+        self.policy = policy
+        self._process = None
+        self._queues = {}  # key -> deque of (update, enqueue time), present while owned
+        self._ready = asyncio.Queue()
+        self._tasks = []
+        self.size = 0
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def start(self, process):
+        """
+        Start the workers on the running loop.
+
+        Args:
+            process: Coroutine function handling one update,
+                e.g. `Application.process_update`.
+        """
+        self._process = process
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Update dispatcher started with {self.workers} worker(s).")
+
+    def submit(self, update):
+        """
+        Enqueue an update without waiting for it to be processed.
+
+        Returns:
+            bool: False if the update was dropped by the backpressure policy.
+
+        Raises:
+            UpdateQueueFull: If the queue is full and the policy is "reject".
+        """
+        if self.size >= self.max_size:
+            if self.policy == "drop":
+                self.dropped += 1
+                logger.warning(f"Update queue full, dropping update {update.update_id}.")
+                return False
+            self.rejected += 1
+            raise UpdateQueueFull(f"{self.size} updates pending.")
+
+        key = _update_key(update)
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+            self._ready.put_nowait(key)
+        queue.append((update, time.monotonic()))
+        self.size += 1
+        self.enqueued += 1
+        return True
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            queue = self._queues[key]
+            update, enqueued_at = queue.popleft()
+            self.size -= 1
+            wait = time.monotonic() - enqueued_at
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            UPDATE_QUEUE_WAIT_SECONDS.observe(wait)
+            try:
+                with UPDATE_PROCESSING_SECONDS.time():
+                    await self._process(update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Failed to process update {update.update_id}: {e}", exc_info=True)
+            finally:
+                if queue:
+                    self._ready.put_nowait(key)  # Keep ownership, go to the back of the line
+                else:
+                    del self._queues[key]
+
+    async def stop(self, timeout=10):
+        """
+        Give pending updates up to `timeout` seconds to finish, then stop the workers.
+        """
+        deadline = time.monotonic() + timeout
+        while self._queues and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.size:
+            logger.warning(f"Update dispatcher stopped with {self.size} update(s) unprocessed.")
+
+    def stats(self):
+        """
+        Return queue depth, throughput counters and queue wait times.
+        """
+        handled = self.processed + self.failed
+        return {
+            "depth": self.size,
+            "users_pending": len(self._queues),
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "wait_avg_ms": round(self.wait_total / handled * 1000, 1) if handled else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 1),
+        }
+
+
+update_dispatcher = UpdateDispatcher(
+    workers=Settings.UPDATE_WORKERS,
+    max_size=Settings.UPDATE_QUEUE_SIZE,
+    policy=Settings.UPDATE_QUEUE_POLICY,
+)
@@ -1,4 +1,5 @@
 import os
+from urllib.parse import urlsplit
 from dotenv import load_dotenv
 
 # Load environment variables from a .env file
@@ -12,9 +13,149 @@ class Settings:
     """
     # MongoDB URI
     MONGO_URI = os.getenv("MONGO_URI")
-    # Telegram bot token
+    # Telegram bot token; checked when the bot starts, so the API can run without one
     TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-    if not TELEGRAM_BOT_TOKEN:
-        raise ValueError("TELEGRAM_BOT_TOKEN environment variable is not set.")
+    # Bot API endpoint, overridable to point the bot at a local Bot API server or a stub
+    TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL", "https://api.telegram.org/bot")
+
+    # MongoDB connection pool
+    MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+    MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+    MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 60000))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 10000))
+    MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 20000))
+    MONGO_WRITE_CONCERN = os.getenv("MONGO_WRITE_CONCERN")  # e.g. "1" or "majority"; driver default when unset
+
+    # Write-behind buffer for user and balance writes
+    WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", 500))
+    WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", 2))  # Seconds
+
+    # SportyBet site root, overridable to point the scraper at a stub site
+    SPORTYBET_BASE_URL = os.getenv("SPORTYBET_BASE_URL", "https://www.sportybet.com/ng").rstrip("/")
+
+    # SportyBet JSON API used by the browserless fast path
+    SPORTYBET_API_URL = os.getenv("SPORTYBET_API_URL", "{0.scheme}://{0.netloc}".format(urlsplit(SPORTYBET_BASE_URL)))
+    BALANCE_API_PATH = os.getenv("BALANCE_API_PATH", "/api/ng/pocket/v1/finAccs/get")
+    BALANCE_API_FIELD = os.getenv("BALANCE_API_FIELD", "data.avlBal")  # Dotted path in the JSON body
+    BALANCE_HTTP_FAST_PATH = os.getenv("BALANCE_HTTP_FAST_PATH", "true").lower() == "true"
+    HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 10))  # Seconds
+    HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+
+    # Balance refresh
+    # Upper bound for waiting on a refreshed balance, in milliseconds
+    BALANCE_REFRESH_TIMEOUT_MS = int(os.getenv("BALANCE_REFRESH_TIMEOUT_MS", 6000))
+    # Substring of the URL the site calls to fetch the balance; the balance API path by default
+    BALANCE_RESPONSE_PATTERN = os.getenv("BALANCE_RESPONSE_PATTERN", BALANCE_API_PATH)
+
+    # Request interception on scraper pages (comma-separated lists)
+    RESOURCE_BLOCKING = os.getenv("RESOURCE_BLOCKING", "true").lower() == "true"
+    BLOCK_RESOURCE_TYPES = [t for t in os.getenv("BLOCK_RESOURCE_TYPES", "image,font,media").split(",") if t]
+    BLOCK_DOMAINS = [d for d in os.getenv(
+        "BLOCK_DOMAINS",
+        "google-analytics.com,googletagmanager.com,doubleclick.net,facebook.net,"
+        "facebook.com,hotjar.com,clarity.ms,adjust.com,appsflyer.com,onesignal.com"
+    ).split(",") if d]
+    ALLOW_DOMAINS = [d for d in os.getenv("ALLOW_DOMAINS", "").split(",") if d]
+
+    # Seconds a fetched balance is served from cache
+    BALANCE_CACHE_TTL = float(os.getenv("BALANCE_CACHE_TTL", 30))
+
+    # Shared fixtures/odds snapshot served by /fetch
+    FIXTURES_API_PATH = os.getenv("FIXTURES_API_PATH", "/api/ng/factsCenter/pcUpcomingEvents")
+    FIXTURES_SPORT_ID = os.getenv("FIXTURES_SPORT_ID", "sr:sport:1")
+    FIXTURES_MARKETS = os.getenv("FIXTURES_MARKETS", "1,18,10")  # Market IDs requested with each event
+    FIXTURES_PAGE_SIZE = int(os.getenv("FIXTURES_PAGE_SIZE", 100))
+    FIXTURES_MAX_PAGES = int(os.getenv("FIXTURES_MAX_PAGES", 10))
+    FIXTURES_REFRESH_INTERVAL = float(os.getenv("FIXTURES_REFRESH_INTERVAL", 60))  # Seconds
+    FETCH_PAGE_SIZE = int(os.getenv("FETCH_PAGE_SIZE", 10))  # Matches per /fetch reply
+
+    # Bet placement (/bet)
+    BET_API_PATH = os.getenv("BET_API_PATH", "/api/ng/orders/order")  # Called from the user's page
+    BET_API_ID_FIELD = os.getenv("BET_API_ID_FIELD", "data.orderId")  # Dotted path of the bet ID in the response
+    BET_MAX_SELECTIONS = int(os.getenv("BET_MAX_SELECTIONS", 20))  # Per slip
+    BET_MAX_WAIT = float(os.getenv("BET_MAX_WAIT", 60))  # Seconds a slip may wait for the user's browser
+    BET_SUBMIT_TIMEOUT_MS = int(os.getenv("BET_SUBMIT_TIMEOUT_MS", 30000))
+    BET_IDEMPOTENCY_TTL = int(os.getenv("BET_IDEMPOTENCY_TTL", 7 * 24 * 3600))  # Seconds placements are remembered
+
+    # Settlement of open bets, which feeds the results shown by /stat
+    BET_SETTLED_API_PATH = os.getenv("BET_SETTLED_API_PATH", "/api/ng/orders/order/v2/realbet/settled")
+    BET_SETTLED_LIST_FIELD = os.getenv("BET_SETTLED_LIST_FIELD", "data.entityList")  # Dotted path of the orders
+    BET_SETTLED_PAGE_SIZE = int(os.getenv("BET_SETTLED_PAGE_SIZE", 50))
+    BET_SETTLED_MAX_PAGES = int(os.getenv("BET_SETTLED_MAX_PAGES", 20))  # Per user and run
+    BET_SETTLE_INTERVAL = float(os.getenv("BET_SETTLE_INTERVAL", 300))  # Seconds between checks
+    BET_SETTLE_CONCURRENCY = int(os.getenv("BET_SETTLE_CONCURRENCY", 4))  # Users checked at a time
+
+    # Background balance watcher (/watch)
+    BALANCE_WATCH_TICK = float(os.getenv("BALANCE_WATCH_TICK", 5))  # Seconds between due checks
+    BALANCE_WATCH_CONCURRENCY = int(os.getenv("BALANCE_WATCH_CONCURRENCY", 4))
+    BALANCE_WATCH_ACTIVE_INTERVAL = float(os.getenv("BALANCE_WATCH_ACTIVE_INTERVAL", 60))  # Recently active users
+    BALANCE_WATCH_IDLE_INTERVAL = float(os.getenv("BALANCE_WATCH_IDLE_INTERVAL", 900))  # Upper bound for idle users
+    BALANCE_WATCH_ACTIVE_WINDOW = float(os.getenv("BALANCE_WATCH_ACTIVE_WINDOW", 600))  # Seconds a user counts as active
+    BALANCE_WATCH_JITTER = float(os.getenv("BALANCE_WATCH_JITTER", 0.2))  # +/- fraction of the interval
+
+    # Password hashing
+    BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))  # Cost factor
+    BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", os.cpu_count() or 1))
+    BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", 100))  # Queued + running jobs
+
+    # Incoming update queue
+    UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", 64))
+    UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", 1000))
+    UPDATE_QUEUE_POLICY = os.getenv("UPDATE_QUEUE_POLICY", "reject")  # "reject" or "drop"
+
+    # Outgoing messages, paced below Telegram's flood limits
+    OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", 30))  # Messages per second, all chats
+    OUTBOUND_GLOBAL_BURST = int(os.getenv("OUTBOUND_GLOBAL_BURST", 30))
+    OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", 1))  # Messages per second, per chat
+    OUTBOUND_CHAT_BURST = int(os.getenv("OUTBOUND_CHAT_BURST", 3))
+    OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", 5))  # Per message, network errors and 429s
+    OUTBOUND_DRAIN_TIMEOUT = float(os.getenv("OUTBOUND_DRAIN_TIMEOUT", 10))  # Seconds to flush on shutdown
+
+    # Seconds between batches of scheduled message deletions
+    MESSAGE_DELETION_TICK = float(os.getenv("MESSAGE_DELETION_TICK", 5))
+
+    # Seconds between writes of user_data/chat_data to MongoDB
+    PERSISTENCE_UPDATE_INTERVAL = float(os.getenv("PERSISTENCE_UPDATE_INTERVAL", 1))
+
+    # Multi-worker routing. Each worker needs its own URL reachable by the others;
+    # routing is disabled when WORKER_URL is unset.
+    WORKER_ID = os.getenv("WORKER_ID")
+    WORKER_URL = os.getenv("WORKER_URL")
+    WORKER_SHARED_SECRET = os.getenv("WORKER_SHARED_SECRET")  # Required with WORKER_URL; marks forwarded updates
+    WORKER_HEARTBEAT_INTERVAL = float(os.getenv("WORKER_HEARTBEAT_INTERVAL", 5))  # Seconds
+    WORKER_OWNER_CACHE_TTL = float(os.getenv("WORKER_OWNER_CACHE_TTL", 30))  # Seconds
+
+    # Redelivered updates are recognized by update_id and dropped. The window is kept
+    # in memory; the shared TTL collection (on by default with routing) spans workers.
+    UPDATE_DEDUP_WINDOW = int(os.getenv("UPDATE_DEDUP_WINDOW", 10000))  # Most recent update IDs remembered
+    UPDATE_DEDUP_SHARED = os.getenv("UPDATE_DEDUP_SHARED", "true" if WORKER_URL else "false").lower() == "true"
+    UPDATE_DEDUP_TTL = int(os.getenv("UPDATE_DEDUP_TTL", 24 * 3600))  # Telegram keeps undelivered updates 24h
+
+    # Admission control for browser jobs
+    SCRAPER_MAX_CONCURRENT = int(os.getenv("SCRAPER_MAX_CONCURRENT", 8))  # Jobs running at once, all users
+    SCRAPER_MAX_WAIT = float(os.getenv("SCRAPER_MAX_WAIT", 20))  # Seconds a job may wait before "busy"
+    SCRAPER_MAX_QUEUED = int(os.getenv("SCRAPER_MAX_QUEUED", 200))
+
+    # Browser pool
+    # Number of shared Chromium processes. 0 launches one browser per user.
+    BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", 2))
+    BROWSER_HEADLESS = os.getenv("BROWSER_HEADLESS", "true").lower() == "true"
+    # Launch the pool at startup and keep this many blank contexts ready for new logins
+    BROWSER_PREWARM = os.getenv("BROWSER_PREWARM", "true").lower() == "true"
+    BROWSER_PREWARM_CONTEXTS = int(os.getenv("BROWSER_PREWARM_CONTEXTS", 2))
+
+    # Session store
+    SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", 200))
+    SESSION_IDLE_TTL = int(os.getenv("SESSION_IDLE_TTL", 1800))  # Seconds
+    # Memory for the process and its browsers, in MB. 0 disables the budget.
+    SESSION_MEMORY_BUDGET_MB = int(os.getenv("SESSION_MEMORY_BUDGET_MB", 0))
+    SESSION_REAPER_INTERVAL = int(os.getenv("SESSION_REAPER_INTERVAL", 30))  # Seconds
+
+    # Persisted browser storage state
+    # Fernet key used to encrypt storage state at rest. Persistence is off when unset.
+    SESSION_STATE_KEY = os.getenv("SESSION_STATE_KEY")
+    SESSION_STATE_MAX_AGE = int(os.getenv("SESSION_STATE_MAX_AGE", 7 * 24 * 3600))  # Seconds
+    SESSION_RESTORE_TIMEOUT = int(os.getenv("SESSION_RESTORE_TIMEOUT", 15000))  # Milliseconds
 
     # Other settings......
\ No newline at end of file
@@ -0,0 +1,318 @@
+"""
+Asyncio-native counterpart of `app.core.scraper`, driven by `AsyncSessionManager`.
+"""
+import logging
+import time
+
+from app.config.settings import Settings
+from app.core.database import load_storage_state
+from app.core.http_client import AuthExpiredError, sportybet_http
+from app.core.job_scheduler import SchedulerBusyError, scraper_scheduler
+from app.core.metrics import BALANCE_FETCH_SECONDS, SCRAPER_STEP_SECONDS
+from app.core.scraper import balance_from_response, is_balance_response
+
+logger = logging.getLogger(__name__)
+
+# Histogram children resolved once, so timing a step costs no label lookup
+GOTO_TIMER = SCRAPER_STEP_SECONDS.labels("goto")
+FILL_TIMER = SCRAPER_STEP_SECONDS.labels("fill")
+CLICK_TIMER = SCRAPER_STEP_SECONDS.labels("click")
+SELECTOR_WAIT_TIMER = SCRAPER_STEP_SECONDS.labels("wait_for_selector")
+REFRESH_WAIT_TIMER = SCRAPER_STEP_SECONDS.labels("refresh_wait")
+BALANCE_READ_TIMER = SCRAPER_STEP_SECONDS.labels("balance_read")
+HTTP_BALANCE_TIMER = BALANCE_FETCH_SECONDS.labels("http")
+BROWSER_BALANCE_TIMER = BALANCE_FETCH_SECONDS.labels("browser")
+SUBMIT_SLIP_TIMER = SCRAPER_STEP_SECONDS.labels("submit_slip")
+
+# Posts a whole bet slip from inside the page, so the request carries the page's
+# cookies and headers and the slip costs one round trip however many selections it has
+SUBMIT_SLIP_JS = """async ([path, payload, timeoutMs]) => {
+  const controller = new AbortController();
+  const timer = setTimeout(() => controller.abort(), timeoutMs);
+  try {
+    const response = await fetch(path, {
+      method: "POST",
+      credentials: "same-origin",
+      headers: {"Content-Type": "application/json"},
+      body: JSON.stringify(payload),
+      signal: controller.signal,
+    });
+    let body = null;
+    try { body = await response.json(); } catch (e) {}
+    return {status: response.status, body};
+  } catch (e) {
+    return {status: 0, body: null, error: String(e)};
+  } finally {
+    clearTimeout(timer);
+  }
+}"""
+
+
+async def _resume_session(page):
+    """
+    Load the home page in a rehydrated context and check that it is still logged in.
+
+    Returns:
+        bool: True if the balance is visible, i.e. the stored session is still valid.
+    """
+    try:
+        with GOTO_TIMER.time():
+            await page.goto(f"{Settings.SPORTYBET_BASE_URL}/", wait_until="domcontentloaded", timeout=90000)
+        with SELECTOR_WAIT_TIMER.time():
+            await page.wait_for_selector(".m-balance", timeout=Settings.SESSION_RESTORE_TIMEOUT)
+        return True
+    except Exception as e:
+        logger.warning(f"Stored session is no longer valid. Error: {e}")
+        return False
+
+
+async def refresh_balance(page):
+    """
+    Click the refresh button and take the balance from the response it triggers.
+
+    The page re-renders the balance only after that response has arrived, so the
+    value is read from the response body rather than the DOM. The shown balance is
+    the fallback when no response arrives within `BALANCE_REFRESH_TIMEOUT_MS` or it
+    carries no balance.
+
+    Returns:
+        tuple: (balance, observed, elapsed_ms) where observed is "response" or
+        "timeout".
+    """
+    started = time.perf_counter()
+    clicked = False
+    try:
+        with REFRESH_WAIT_TIMER.time():
+            # Leaving the block waits for the response
+            async with page.expect_response(
+                is_balance_response, timeout=Settings.BALANCE_REFRESH_TIMEOUT_MS
+            ) as response_info:
+                with CLICK_TIMER.time():
+                    await page.click("#j_refreshBalance")  # Click the refresh button
+                clicked = True
+        response = await response_info.value
+        balance = balance_from_response(await response.json())
+    except Exception:
+        if not clicked:
+            raise
+        balance = None  # No usable response, read whatever is shown
+    elapsed_ms = round((time.perf_counter() - started) * 1000)
+    if balance is None:
+        with BALANCE_READ_TIMER.time():
+            return await page.locator(".m-balance").inner_text(), "timeout", elapsed_ms
+    return balance, "response", elapsed_ms
+
+
+async def _fetch_balance_over_http(user_id):
+    """
+    Try to read the balance from the JSON API with the user's exported cookies.
+
+    Cookies are taken from the stored storage state when none were exported in
+    this process yet, so the fast path also works right after a restart.
+
+    Returns:
+        dict: A refresh result, or None if the Playwright path has to be used.
+    """
+    if not sportybet_http.has_cookies(user_id):
+        try:
+            state = await load_storage_state(user_id)
+        except Exception as e:
+            logger.warning(f"Could not load storage state for the HTTP fast path. Error: {e}")
+            state = None
+        if not state:
+            return None
+        sportybet_http.export_cookies(user_id, state.get("cookies", []))
+
+    started = time.perf_counter()
+    try:
+        with HTTP_BALANCE_TIMER.time():
+            balance = await sportybet_http.fetch_balance(user_id)
+    except AuthExpiredError as e:
+        logger.warning(f"HTTP fast path rejected, falling back to the browser. Error: {e}")
+        sportybet_http.forget(user_id)
+        return None
+    except Exception as e:
+        logger.warning(f"HTTP fast path failed, falling back to the browser. Error: {e}")
+        return None
+    elapsed_ms = round((time.perf_counter() - started) * 1000)
+    return {"success": True, "balance": balance, "elapsed_ms": elapsed_ms}
+
+
+async def _export_cookies(user_id, page):
+    """
+    Hand the cookies of a logged-in page to the HTTP fast path.
+    """
+    if Settings.BALANCE_HTTP_FAST_PATH:
+        sportybet_http.export_cookies(user_id, await page.context.cookies())
+
+
+async def validate_sportybet_credentials(user_id, phone_number, password, session_manager, refresh_only=False,
+                                         max_wait=None):
+    """
+    Validate user credentials or refresh the balance using async Playwright.
+
+    Browser work waits for a scheduler slot, at most `max_wait` seconds (the
+    scheduler default when None); when none frees up in time the result is
+    `{"success": False, "busy": True, ...}`.
+    """
+    logger.debug(f"Running {'refresh' if refresh_only else 'login'} process for user_id={user_id}")
+
+    if refresh_only and Settings.BALANCE_HTTP_FAST_PATH:
+        result = await _fetch_balance_over_http(user_id)
+        if result:
+            return result
+
+    try:
+        async with scraper_scheduler.slot(user_id, max_wait=max_wait):
+            return await _run_in_browser(user_id, phone_number, password, session_manager, refresh_only)
+    except SchedulerBusyError as e:
+        return {"success": False, "busy": True, "message": str(e)}
+
+
+async def _run_in_browser(user_id, phone_number, password, session_manager, refresh_only):
+    """
+    Log in or refresh the balance on the user's page. Runs inside a scheduler slot.
+    """
+    # Get or create the user's session
+    try:
+        session = await session_manager.start_session(user_id)
+    except Exception as e:
+        logger.warning(f"Could not start a browser session for user_id={user_id}. Error: {e}")
+        return {"success": False, "message": "The browser could not be started. Please try again later."}
+    page = session["page"]
+
+    if not refresh_only:
+        # Login flow
+        logger.debug("Navigating to login page...")
+        try:
+            with GOTO_TIMER.time():
+                await page.goto(f"{Settings.SPORTYBET_BASE_URL}/login", timeout=90000)
+            with FILL_TIMER.time():
+                await page.fill("input[name='phone']", phone_number)
+                await page.fill("input[type='password']", password)
+            with CLICK_TIMER.time():
+                await page.click("button.af-button")
+            with SELECTOR_WAIT_TIMER.time():
+                await page.wait_for_selector(".m-balance", timeout=30000)
+            with BALANCE_READ_TIMER.time():
+                balance = await page.locator(".m-balance").inner_text()
+            session["restored"] = False
+            await session_manager.persist_session(user_id)
+            await _export_cookies(user_id, page)
+            return {"success": True, "balance": balance}
+        except Exception as e:
+            logger.warning(f"Login failed. Error: {e}")
+            return {"success": False, "message": "Failed to login or fetch balance."}
+    else:
+        # Refresh balance flow
+        if session.get("restored") or page.url == "about:blank":
+            # The session was rehydrated from storage (or has never logged in):
+            # a single page load replaces the login and already shows a fresh balance.
+            logger.debug("Resuming stored session...")
+            if not await _resume_session(page):
+                await session_manager.close_session(user_id, forget_state=True)
+                return {"success": False, "expired": True, "message": "Your session has expired."}
+            session["restored"] = False
+            try:
+                await _export_cookies(user_id, page)
+                with BALANCE_READ_TIMER.time():
+                    balance = await page.locator(".m-balance").inner_text()
+            except Exception as e:
+                logger.warning(f"Failed to read the balance of the resumed session. Error: {e}")
+                return {"success": False, "message": "Failed to refresh balance."}
+            return {"success": True, "balance": balance}
+
+        logger.debug("Refreshing balance...")
+        try:
+            with BROWSER_BALANCE_TIMER.time():
+                balance, observed, elapsed_ms = await refresh_balance(page)
+            logger.debug(f"Balance refresh settled on '{observed}' after {elapsed_ms} ms")
+            return {"success": True, "balance": balance, "elapsed_ms": elapsed_ms}
+        except Exception as e:
+            logger.warning(f"Failed to refresh balance. Error: {e}")
+            return {"success": False, "message": "Failed to refresh balance."}
+
+
+def _field(payload, path):
+    """
+    Read a dotted path from a JSON payload, or None if it is missing.
+    """
+    value = payload
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+async def place_bet_slip(user_id, slip, session_manager, max_wait=None):
+    """
+    Submit a whole bet slip from the user's page in a single request.
+
+    Waits for the user's scheduler slot like any other browser job, so a slip never
+    overlaps a login or a balance refresh on the same page.
+
+    Args:
+        slip: JSON payload of the slip, as expected by `BET_API_PATH`.
+        max_wait: Seconds the slip may wait for a slot (the scheduler default when None).
+
+    Returns:
+        dict: `{"success": True, "bet_id", "session_ms", "submit_ms"}`, or a failure
+        with "message" and possibly "busy" or "expired". "unknown" is set when the
+        slip may have reached the site (timeout, aborted request, error response
+        without a definite rejection), so it must not be submitted again.
+    """
+    try:
+        async with scraper_scheduler.slot(user_id, max_wait=max_wait):
+            return await _submit_in_browser(user_id, slip, session_manager)
+    except SchedulerBusyError as e:
+        return {"success": False, "busy": True, "message": str(e)}
+
+
+async def _submit_in_browser(user_id, slip, session_manager):
+    """
+    Post the slip on the user's page. Runs inside a scheduler slot.
+    """
+    started = time.perf_counter()
+    session = await session_manager.start_session(user_id)
+    page = session["page"]
+    if session.get("restored") or page.url == "about:blank":
+        # The page has to be on the site, logged in, for the request to carry the session
+        if not await _resume_session(page):
+            await session_manager.close_session(user_id, forget_state=True)
+            return {"success": False, "expired": True, "message": "Your session has expired."}
+        session["restored"] = False
+        await _export_cookies(user_id, page)
+    session_ms = round((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    try:
+        with SUBMIT_SLIP_TIMER.time():
+            response = await page.evaluate(
+                SUBMIT_SLIP_JS, [Settings.BET_API_PATH, slip, Settings.BET_SUBMIT_TIMEOUT_MS]
+            )
+    except Exception as e:
+        # The page may have sent the request before failing
+        logger.warning(f"Slip submission failed mid-request. Error: {e}")
+        response = {"status": 0, "body": None, "error": str(e)}
+    submit_ms = round((time.perf_counter() - started) * 1000)
+    timings = {"session_ms": session_ms, "submit_ms": submit_ms}
+
+    status, body = response["status"], response.get("body")
+    if status in (401, 403):
+        await session_manager.close_session(user_id, forget_state=True)
+        return {"success": False, "expired": True, "message": "Your session has expired.", **timings}
+    bet_id = _field(body, Settings.BET_API_ID_FIELD) if isinstance(body, dict) else None
+    if status == 200 and bet_id is not None:
+        return {"success": True, "bet_id": str(bet_id), **timings}
+    if 400 <= status < 500 and isinstance(body, dict):
+        # The site answered and refused the slip: nothing was placed
+        logger.warning(f"Slip rejected with HTTP {status}: {body}")
+        return {"success": False, "message": body.get("message") or "The bet could not be placed.", **timings}
+    logger.warning(f"Slip outcome unknown, HTTP {status}: {response.get('error') or body}")
+    return {
+        "success": False,
+        "unknown": True,
+        "message": "The site did not confirm the bet, so it may or may not have been placed.",
+        **timings,
+    }
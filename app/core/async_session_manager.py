@@ -0,0 +1,404 @@
+"""
+Asyncio-native counterpart of `app.core.session_manager`.
+
+Everything here runs on the FastAPI/PTB event loop through `playwright.async_api`,
+so sessions can be used from any handler without executor threads and without the
+thread-affinity problems of sync Playwright objects.
+"""
+import asyncio
+import logging
+
+from app.config.settings import Settings
+from app.core.database import delete_storage_state, load_storage_state, save_storage_state
+from app.core.job_scheduler import SchedulerBusyError, scraper_scheduler
+from app.core.resource_policy import ResourceCounters, ResourcePolicy, install_async
+from app.core.session_store import SessionStore
+from app.core.utils import process_tree_rss_mb
+
+
+class AsyncBrowserPool:
+    """
+    A small, fixed set of long-lived Chromium browsers shared by all users.
+
+    Each user gets an isolated BrowserContext placed on the least-loaded browser.
+    A browser that crashes or disconnects is replaced the next time a context is
+    requested; contexts on the other browsers are left untouched.
+
+    Up to `spare_target` blank contexts can be kept open ahead of time and are
+    handed out to sessions that have no storage state to restore.
+    """
+    def __init__(self, size, headless=True):
+        self.size = size
+        self.headless = headless
+        self.playwright = None
+        self.slots = []  # One entry per browser: {"browser", "contexts", "pending", "crashed"}
+        self._lock = asyncio.Lock()
+        self.spare_target = 0
+        self._spares = []  # (slot, context, page) ready to be handed out
+        self._replenish_task = None
+
+    async def _launch(self):
+        """
+        Launch a browser and wrap it in a pool slot.
+        """
+        browser = await self.playwright.chromium.launch(headless=self.headless)
+        slot = {"browser": browser, "contexts": set(), "pending": 0, "crashed": False}
+        browser.on("disconnected", lambda _: self._mark_crashed(slot))
+        return slot
+
+    def _mark_crashed(self, slot):
+        """
+        Flag a slot whose browser went away. It is replaced lazily in `acquire`.
+        """
+        if not slot["crashed"]:
+            logging.warning(f"Pooled browser disconnected, dropping {len(slot['contexts'])} context(s).")
+        slot["crashed"] = True
+
+    async def start(self):
+        """
+        Start the Playwright driver and launch the pooled browsers.
+        """
+        async with self._lock:
+            if self.playwright is None:
+                from playwright.async_api import async_playwright  # Imported on first use, it is slow to load
+                self.playwright = await async_playwright().start()
+                self.slots = list(await asyncio.gather(*(self._launch() for _ in range(self.size))))
+                logging.info(f"Async browser pool started with {self.size} browser(s).")
+
+    async def recycle_crashed(self):
+        """
+        Replace every crashed browser with a freshly launched one.
+        """
+        async with self._lock:
+            for index, slot in enumerate(self.slots):
+                if slot["crashed"] or not slot["browser"].is_connected():
+                    slot["crashed"] = True
+                    slot["contexts"].clear()
+                    self.slots[index] = await self._launch()
+                    logging.info(f"Recycled pooled browser #{index}.")
+
+    async def prewarm(self, contexts):
+        """
+        Launch the browsers and open `contexts` spare contexts, kept topped up from now on.
+        """
+        await self.start()
+        self.spare_target = contexts
+        await self._replenish()
+        logging.info(f"Browser pool pre-warmed with {len(self._spares)} spare context(s).")
+
+    async def _replenish(self):
+        while len(self._spares) < self.spare_target:
+            self._spares.append(await self._new_context())
+
+    def _take_spare(self):
+        """
+        Return a spare context on a healthy browser and start replacing it, or None.
+        """
+        while self._spares:
+            slot, context, page = self._spares.pop()
+            if not slot["crashed"]:
+                if self._replenish_task is None or self._replenish_task.done():
+                    self._replenish_task = asyncio.get_running_loop().create_task(self._replenish())
+                return slot, context, page
+        return None
+
+    async def acquire(self, storage_state=None):
+        """
+        Create a new context and page on the least-loaded healthy browser.
+
+        Args:
+            storage_state: Optional Playwright storage state to rehydrate the context from.
+                Without one, a pre-warmed spare context is used when available.
+
+        Returns:
+            tuple: (slot, context, page)
+        """
+        if storage_state is None:
+            spare = self._take_spare()
+            if spare:
+                return spare
+        return await self._new_context(storage_state)
+
+    async def _new_context(self, storage_state=None):
+        await self.start()
+        if any(slot["crashed"] for slot in self.slots):
+            await self.recycle_crashed()
+        slot = min(self.slots, key=lambda s: len(s["contexts"]) + s["pending"])
+        slot["pending"] += 1  # Count the context before it exists so bursts spread out
+        try:
+            context = await slot["browser"].new_context(storage_state=storage_state)
+            page = await context.new_page()
+        finally:
+            slot["pending"] -= 1
+        slot["contexts"].add(context)
+        return slot, context, page
+
+    async def release(self, slot, context):
+        """
+        Close a context and return its capacity to the pool.
+        """
+        slot["contexts"].discard(context)
+        if slot["crashed"]:
+            return  # The browser is gone together with its contexts
+        try:
+            await context.close()
+        except Exception as e:
+            logging.warning(f"Failed to close browser context: {e}")
+
+    async def close(self):
+        """
+        Close every pooled browser and stop the Playwright driver.
+        """
+        self.spare_target = 0
+        if self._replenish_task is not None:
+            self._replenish_task.cancel()
+        self._spares = []
+        for slot in self.slots:
+            try:
+                await slot["browser"].close()
+            except Exception as e:
+                logging.warning(f"Failed to close pooled browser: {e}")
+        self.slots = []
+        if self.playwright:
+            await self.playwright.stop()
+            self.playwright = None
+
+    def stats(self):
+        """
+        Return the number of contexts open on each browser.
+        """
+        return [len(slot["contexts"]) for slot in self.slots]
+
+
+class AsyncSessionManager:
+    """
+    Manages asynchronous Playwright browser sessions for users.
+
+    Sessions have the same shape as the sync `SessionManager` ones, with async
+    Playwright objects. With a pool size of 0 every user gets a dedicated browser.
+
+    Sessions live in a bounded `SessionStore`. A background reaper expires idle
+    sessions, enforces the memory budget and closes evicted sessions off the hot path.
+
+    Authenticated storage state is persisted (encrypted) in MongoDB, so a session
+    that was evicted or lost in a restart is rehydrated instead of logging in again.
+    Such sessions are flagged with `"restored": True` until the scraper verifies them.
+    """
+    def __init__(self, pool_size=None):
+        if pool_size is None:
+            pool_size = Settings.BROWSER_POOL_SIZE
+        self.pool = AsyncBrowserPool(pool_size, headless=Settings.BROWSER_HEADLESS) if pool_size > 0 else None
+        self.sessions = SessionStore(
+            max_sessions=Settings.SESSION_MAX_SESSIONS,
+            idle_ttl=Settings.SESSION_IDLE_TTL,
+            memory_budget_mb=Settings.SESSION_MEMORY_BUDGET_MB,
+        )
+        self._starting = {}  # user_id -> task creating that user's session
+        self._reaper_task = None
+        self._retiring = set()  # Tasks closing evicted sessions, kept so they are not garbage-collected
+        self.resource_policy = ResourcePolicy.from_settings() if Settings.RESOURCE_BLOCKING else None
+        self.resource_totals = ResourceCounters()
+
+    def _is_alive(self, session):
+        """
+        Check whether the browser behind a session is still usable.
+        """
+        slot = session.get("slot")
+        if slot is not None and slot["crashed"]:
+            return False
+        return session["browser"].is_connected()
+
+    async def _create_session(self, user_id):
+        """
+        Build a new session for a user, pooled or dedicated, rehydrated from the
+        stored storage state when one exists.
+        """
+        try:
+            storage_state = await load_storage_state(user_id)
+        except Exception as e:
+            logging.warning(f"Could not load storage state for user_id={user_id}: {e}")
+            storage_state = None
+
+        if self.pool:
+            slot, context, page = await self.pool.acquire(storage_state=storage_state)
+            session = {"browser": slot["browser"], "context": context, "page": page, "slot": slot}
+        else:
+            from playwright.async_api import async_playwright
+            playwright = await async_playwright().start()
+            browser = await playwright.chromium.launch(headless=Settings.BROWSER_HEADLESS)
+            page = await browser.new_page(storage_state=storage_state)
+            session = {"playwright": playwright, "browser": browser, "page": page}
+        session["restored"] = storage_state is not None
+        if self.resource_policy:
+            session["resources"] = ResourceCounters(parent=self.resource_totals)
+            await install_async(page.context, self.resource_policy, session["resources"])
+        return session
+
+    async def start_session(self, user_id):
+        """
+        Start a new browser session for a user, or return the existing one.
+
+        Concurrent calls for the same user share a single session creation.
+        """
+        session = self.sessions.get(user_id)
+        if session:
+            if self._is_alive(session):
+                return session
+            logging.warning(f"Browser session for user_id={user_id} was lost, starting a new one.")
+            self.sessions.pop(user_id)
+
+        self._ensure_reaper()
+        task = self._starting.get(user_id)
+        if task is None:
+            task = asyncio.ensure_future(self._create_session(user_id))
+            self._starting[user_id] = task
+            try:
+                session = await task
+            finally:
+                self._starting.pop(user_id, None)
+            self.sessions[user_id] = session
+            return session
+        return await asyncio.shield(task)
+
+    def get_session(self, user_id):
+        """
+        Retrieve the session for a user.
+        """
+        return self.sessions.get(user_id)
+
+    async def _close(self, session):
+        """
+        Release the browser resources held by a session.
+        """
+        if "slot" in session:
+            await self.pool.release(session["slot"], session["context"])
+        else:
+            await session["browser"].close()
+            await session["playwright"].stop()
+
+    async def persist_session(self, user_id, session=None):
+        """
+        Save the storage state of a user's session so it can be restored later.
+        """
+        session = session or self.sessions.get(user_id)
+        if not session:
+            return
+        try:
+            state = await session["page"].context.storage_state()
+            await save_storage_state(user_id, state)
+        except Exception as e:
+            logging.warning(f"Failed to persist storage state for user_id={user_id}: {e}")
+
+    async def close_session(self, user_id, forget_state=False):
+        """
+        Close the browser session for a user.
+
+        Args:
+            user_id: Telegram user ID.
+            forget_state: Also delete the stored storage state, e.g. on logout.
+        """
+        if user_id in self.sessions:
+            session = self.sessions.pop(user_id)
+            await self._close(session)
+        if forget_state:
+            await delete_storage_state(user_id)
+
+    def _ensure_reaper(self):
+        """
+        Start the background reaper on the running loop if it is not running yet.
+        """
+        if self._reaper_task is None or self._reaper_task.done():
+            self._reaper_task = asyncio.get_running_loop().create_task(self._reap())
+
+    async def _reap(self):
+        """
+        Close evicted sessions as they arrive and periodically evict idle or
+        over-budget ones.
+        """
+        loop = asyncio.get_running_loop()
+        interval = Settings.SESSION_REAPER_INTERVAL
+        next_sweep = loop.time() + interval
+        while True:
+            try:
+                timeout = max(next_sweep - loop.time(), 0)
+                user_id, session = await asyncio.wait_for(self.sessions.evicted.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                self.sessions.expire_idle()
+                if self.sessions.memory_budget_mb:
+                    used_mb = await asyncio.to_thread(process_tree_rss_mb)
+                    self.sessions.enforce_memory_budget(used_mb)
+                next_sweep = loop.time() + interval
+                continue
+            # Closed in its own task: it may have to wait for a job still using the session
+            task = loop.create_task(self._retire(user_id, session))
+            self._retiring.add(task)
+            task.add_done_callback(self._retiring.discard)
+
+    async def _retire(self, user_id, session):
+        """
+        Persist and close an evicted session once no job of its user is running.
+
+        Eviction does not look at whether a session is in use, so a login, refresh or
+        bet may still be driving the page. Taking the user's scheduler slot waits for
+        it to finish; later jobs of the user start a new session.
+        """
+        try:
+            while True:
+                try:
+                    async with scraper_scheduler.slot(user_id):
+                        await self.persist_session(user_id, session)  # Keep the login for the next request
+                    break
+                except SchedulerBusyError:
+                    await asyncio.sleep(Settings.SESSION_REAPER_INTERVAL)  # Overloaded, try again later
+        finally:
+            try:
+                await self._close(session)
+                logging.info(f"Closed evicted browser session for user_id={user_id}.")
+            except Exception as e:
+                logging.warning(f"Failed to close evicted session for user_id={user_id}: {e}")
+
+    def stats(self):
+        """
+        Return session counts, eviction counters, per-browser context counts and
+        request-blocking totals.
+        """
+        stats = self.sessions.stats()
+        stats["browsers"] = self.pool.stats() if self.pool else [1] * len(self.sessions)
+        stats["spare_contexts"] = len(self.pool._spares) if self.pool else 0
+        stats["resources"] = self.resource_totals.stats()
+        return stats
+
+    async def prewarm(self, contexts=0):
+        """
+        Launch the pooled browsers and open spare contexts before the first login.
+        Without a pool there is nothing to warm: browsers are per user.
+        """
+        if self.pool:
+            await self.pool.prewarm(contexts)
+
+    async def close_all(self):
+        """
+        Close every session and, in pooled mode, the shared browsers.
+        """
+        if self._reaper_task:
+            self._reaper_task.cancel()
+            self._reaper_task = None
+        for task in list(self._retiring):
+            task.cancel()  # Closes the session without waiting for its user's jobs
+        await asyncio.gather(*self._retiring, return_exceptions=True)
+        while not self.sessions.evicted.empty():
+            _, session = self.sessions.evicted.get_nowait()
+            try:
+                await self._close(session)
+            except Exception as e:
+                logging.warning(f"Failed to close evicted session: {e}")
+        for user_id in list(self.sessions):
+            try:
+                await self.close_session(user_id)
+            except Exception as e:
+                logging.warning(f"Failed to close session for user_id={user_id}: {e}")
+        if self.pool:
+            await self.pool.close()
+
+
+session_manager = AsyncSessionManager()  # Shared by the bot and the API; launches nothing until used
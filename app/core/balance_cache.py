@@ -0,0 +1,98 @@
+"""
+Per-user balance cache with single-flight refreshes.
+
+A balance fetched less than `ttl` seconds ago is served from memory. Concurrent
+refreshes for the same user share one in-flight scrape and all receive its result.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+
+from app.config.settings import Settings
+
+
+class BalanceCache:
+    """
+    TTL cache of successful balance results, keyed by user ID.
+    """
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # user_id -> (result, monotonic fetch time)
+        self._inflight = {}  # user_id -> task running the refresh
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def put(self, user_id, result):
+        """
+        Store a fresh successful result, e.g. the balance read during login.
+        """
+        if not result.get("success"):
+            return
+        self._entries[user_id] = (result, time.monotonic())
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        """
+        Forget a user's cached balance.
+
+        A refresh still in flight is detached as well: its result reaches the callers
+        already waiting for it, but is not cached.
+        """
+        self._entries.pop(user_id, None)
+        self._inflight.pop(user_id, None)
+
+    def _on_refreshed(self, user_id, task):
+        if self._inflight.get(user_id) is not task:
+            return  # Invalidated while it ran
+        del self._inflight[user_id]
+        if not task.cancelled() and task.exception() is None:
+            self.put(user_id, task.result())
+
+    async def get(self, user_id, refresh):
+        """
+        Return the user's balance result, refreshing it only when needed.
+
+        Args:
+            user_id: Telegram user ID.
+            refresh: Zero-argument coroutine function performing the scrape.
+
+        Returns:
+            dict: The refresh result with `cached` (bool) and `age` (seconds) added.
+        """
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            age = time.monotonic() - entry[1]
+            if age < self.ttl:
+                self.hits += 1
+                return {**entry[0], "cached": True, "age": age}
+
+        task = self._inflight.get(user_id)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(refresh())
+            self._inflight[user_id] = task
+            task.add_done_callback(lambda done: self._on_refreshed(user_id, done))
+        else:
+            self.coalesced += 1
+        # Shield so that one cancelled caller does not cancel the scrape for the others
+        result = await asyncio.shield(task)
+        return {**result, "cached": False, "age": 0.0}
+
+    def stats(self):
+        """
+        Return cache hit, miss and coalescing counters.
+        """
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
+
+
+balance_cache = BalanceCache(ttl=Settings.BALANCE_CACHE_TTL, max_entries=Settings.SESSION_MAX_SESSIONS * 10)
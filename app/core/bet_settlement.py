@@ -0,0 +1,160 @@
+"""
+Settlement of placed bets.
+
+/bet records every placed bet as open. A repeating JobQueue job asks SportyBet for
+the settled orders of each user with open bets and settles the ones it finds with
+`settle_bet`, which feeds the results, ROI and streaks shown by /stat. Orders are
+read over HTTP with the user's session cookies; no browser is started for this, so
+users without a usable session are checked again once they log in.
+"""
+import asyncio
+import logging
+import time
+
+from app.config.settings import Settings
+from app.core.database import get_open_bets, load_storage_state, settle_bet
+from app.core.http_client import AuthExpiredError, sportybet_http
+
+logger = logging.getLogger(__name__)
+
+# Order status on the site -> bet status in the bets collection
+SETTLED_STATUSES = {
+    "won": "won",
+    "win": "won",
+    "lost": "lost",
+    "lose": "lost",
+    "void": "void",
+    "refund": "void",
+    "cancelled": "void",
+}
+
+
+def order_list(payload):
+    """
+    Return the orders in one page of the settled-orders endpoint.
+    """
+    orders = payload
+    for key in Settings.BET_SETTLED_LIST_FIELD.split("."):
+        orders = orders.get(key) if isinstance(orders, dict) else None
+    return orders if isinstance(orders, list) else []
+
+
+def parse_settled_orders(orders):
+    """
+    Pick the settled orders out of a page of orders.
+
+    Returns:
+        dict: bet ID -> (status, payout) for orders that are won, lost or void.
+    """
+    settled = {}
+    for order in orders:
+        status = SETTLED_STATUSES.get(str(order.get("status", "")).lower())
+        if status and order.get("orderId"):
+            settled[str(order["orderId"])] = (status, float(order.get("totalWinnings") or 0))
+    return settled
+
+
+class BetSettler:
+    """
+    Settles open bets from the site's settled orders on a repeating JobQueue job.
+    """
+    def __init__(self, interval, concurrency):
+        self.interval = interval
+        self.concurrency = concurrency
+        self._running = False
+        self.runs = 0
+        self.checked = 0
+        self.settled = 0
+        self.skipped = 0
+        self.failures = 0
+        self.last_duration_ms = None
+
+    def start(self, job_queue):
+        """
+        Check open bets every `interval` seconds.
+        """
+        job_queue.run_repeating(self._settle_open_bets, interval=self.interval, first=self.interval, name="bet_settlement")
+
+    async def _settle_open_bets(self, context=None):
+        if self._running:
+            return  # The previous run is still going
+        self._running = True
+        started = time.perf_counter()
+        try:
+            open_bets = await get_open_bets()
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def settle(user_id, bet_ids):
+                async with semaphore:
+                    try:
+                        await self.settle_user(user_id, bet_ids)
+                    except Exception as e:
+                        self.failures += 1
+                        logger.error(f"Bet settlement failed for user_id={user_id}: {e}", exc_info=True)
+
+            await asyncio.gather(*(settle(user_id, bet_ids) for user_id, bet_ids in open_bets.items()))
+            self.runs += 1
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Bet settlement run failed: {e}")
+        finally:
+            self._running = False
+            self.last_duration_ms = round((time.perf_counter() - started) * 1000)
+
+    async def settle_user(self, user_id, bet_ids):
+        """
+        Settle those of a user's open bets that the site reports as settled.
+
+        Returns:
+            int: The number of bets settled.
+        """
+        if not sportybet_http.has_cookies(user_id):
+            state = await load_storage_state(user_id)
+            if not state:
+                self.skipped += 1
+                return 0
+            sportybet_http.export_cookies(user_id, state.get("cookies", []))
+        open_ids = {str(bet_id): bet_id for bet_id in bet_ids}  # Bet IDs are stored as the site returned them
+        settled = 0
+        # Newest orders come first: page until every open bet is accounted for or the list ends
+        for page in range(1, Settings.BET_SETTLED_MAX_PAGES + 1):
+            try:
+                payload = await sportybet_http.get_json(user_id, Settings.BET_SETTLED_API_PATH, params={
+                    "pageSize": Settings.BET_SETTLED_PAGE_SIZE,
+                    "pageNum": page,
+                })
+            except AuthExpiredError:
+                sportybet_http.forget(user_id)
+                self.skipped += 1
+                break
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"Could not fetch settled orders for user_id={user_id}: {e}")
+                break
+            if page == 1:
+                self.checked += 1
+            orders = order_list(payload)
+            for order_id, (status, payout) in parse_settled_orders(orders).items():
+                bet_id = open_ids.pop(order_id, None)
+                if bet_id is not None and await settle_bet(user_id, bet_id, status, payout=payout):
+                    settled += 1
+            if not open_ids or len(orders) < Settings.BET_SETTLED_PAGE_SIZE:
+                break
+        self.settled += settled
+        return settled
+
+    def stats(self):
+        """
+        Return settlement counters and the duration of the last run.
+        """
+        return {
+            "runs": self.runs,
+            "users_checked": self.checked,
+            "settled": self.settled,
+            "skipped": self.skipped,
+            "failures": self.failures,
+            "last_run_ms": self.last_duration_ms,
+        }
+
+
+bet_settler = BetSettler(interval=Settings.BET_SETTLE_INTERVAL, concurrency=Settings.BET_SETTLE_CONCURRENCY)
@@ -0,0 +1,226 @@
+"""
+Bet slips and their placement.
+
+Selections added with /bet are collected in the user's slip (kept in persisted user
+data) and the whole slip is submitted with one request from the user's page. Every
+submission carries an idempotency key derived from the slip, so a Telegram update
+that is delivered again, or a double-tapped /bet place, never places the slip twice:
+duplicates arriving while the slip is being placed share its outcome, and later ones
+find the key claimed in MongoDB. Placements of one user run one after the other in
+their scheduler slot, behind any login or balance refresh already queued.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import secrets
+import time
+from datetime import datetime, timezone
+
+from app.config.settings import Settings
+from app.core.async_scraper import place_bet_slip
+from app.core.database import claim_bet_placement, finish_bet_placement, record_bet
+from app.core.metrics import BET_PLACEMENT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Key in context.user_data holding the user's open slip
+SLIP_KEY = "bet_slip"
+
+
+def get_slip(user_data):
+    """
+    Return the user's open slip, starting an empty one if needed.
+    """
+    slip = user_data.get(SLIP_KEY)
+    if slip is None:
+        slip = user_data[SLIP_KEY] = {"id": secrets.token_hex(8), "selections": []}
+    return slip
+
+
+def add_selection(user_data, match, market_id, market, outcome_id, outcome, odds):
+    """
+    Add a selection to the user's slip, replacing an earlier pick on the same match.
+
+    Returns:
+        dict: The slip.
+
+    Raises:
+        ValueError: If the slip is full.
+    """
+    slip = get_slip(user_data)
+    selections = [s for s in slip["selections"] if s["match_id"] != match.match_id]
+    if len(selections) >= Settings.BET_MAX_SELECTIONS:
+        raise ValueError(f"A slip can hold at most {Settings.BET_MAX_SELECTIONS} selections.")
+    selections.append({
+        "match_id": match.match_id,
+        "match": f"{match.home} vs {match.away}",
+        "market_id": market_id,
+        "market": market,
+        "outcome_id": outcome_id,
+        "outcome": outcome,
+        "odds": float(odds),
+    })
+    slip["selections"] = selections
+    return slip
+
+
+def clear_slip(user_data):
+    """
+    Drop the user's open slip. The next selection starts a new one with a new ID.
+    """
+    user_data.pop(SLIP_KEY, None)
+
+
+def total_odds(selections):
+    """
+    Return the combined odds of an accumulator of `selections`.
+    """
+    odds = 1.0
+    for selection in selections:
+        odds *= selection["odds"]
+    return round(odds, 2)
+
+
+def idempotency_key(user_id, slip, stake):
+    """
+    Derive the placement key from the slip's ID, contents and stake.
+
+    The same slip placed again with the same stake maps to the same key, whichever
+    update carried the request; changing the slip or the stake gives a new key.
+    """
+    selections = [(s["match_id"], s["market_id"], s["outcome_id"]) for s in slip["selections"]]
+    raw = json.dumps([user_id, slip["id"], selections, str(stake)], default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class BetPlacer:
+    """
+    Submits slips once per idempotency key and records the placed bets.
+    """
+    def __init__(self, max_wait):
+        self.max_wait = max_wait
+        # A pending placement older than this was abandoned mid-submission
+        self.stale_after = max_wait + Settings.BET_SUBMIT_TIMEOUT_MS / 1000 + 60
+        self._inflight = {}  # idempotency key -> task placing the slip
+        self.placed = 0
+        self.failed = 0
+        self.unknown = 0
+        self.busy = 0
+        self.duplicates = 0
+        self.submit_ms_total = 0
+        self.submit_ms_max = 0
+
+    async def place(self, user_id, slip, stake, session_manager):
+        """
+        Place the slip unless a placement with the same key exists.
+
+        Returns:
+            dict: The outcome with "success", "bet_id", "odds" and "timings", or
+            "message" on failure. "duplicate" is set when the slip had already been
+            submitted; "pending" then means that placement has not finished yet.
+            "unknown" means the slip may have been placed and will not be retried.
+        """
+        key = idempotency_key(user_id, slip, stake)
+        task = self._inflight.get(key)
+        if task is not None:
+            self.duplicates += 1
+            return {**await asyncio.shield(task), "duplicate": True}
+
+        task = asyncio.ensure_future(self._place(key, user_id, slip, stake, session_manager))
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._inflight.pop(key, None))
+        # Shield so that a cancelled handler does not abandon a slip mid-submission
+        return await asyncio.shield(task)
+
+    async def _place(self, key, user_id, slip, stake, session_manager):
+        started = time.perf_counter()
+        selections = slip["selections"]
+        odds = total_odds(selections)
+        existing = await claim_bet_placement(key, user_id, stake=stake, selections=len(selections))
+        if existing is not None:
+            self.duplicates += 1
+            status = existing["status"]
+            if status == "pending":
+                # Still being placed, unless the process placing it died mid-submission
+                created_at = existing["created_at"].replace(tzinfo=timezone.utc)
+                if (datetime.now(timezone.utc) - created_at).total_seconds() > self.stale_after:
+                    status = "unknown"
+            return {
+                "success": status == "placed",
+                "duplicate": True,
+                "pending": status == "pending",
+                "unknown": status == "unknown",
+                "bet_id": existing.get("bet_id"),
+                "message": existing.get("message"),
+                "odds": odds,
+            }
+        claim_ms = round((time.perf_counter() - started) * 1000)
+
+        payload = {
+            "selections": [
+                {"eventId": s["match_id"], "marketId": s["market_id"], "outcomeId": s["outcome_id"], "odds": s["odds"]}
+                for s in selections
+            ],
+            "stake": stake,
+            "requestId": key,  # Lets the site deduplicate too, where it supports it
+        }
+        try:
+            result = await place_bet_slip(user_id, payload, session_manager, max_wait=self.max_wait)
+        except Exception as e:
+            # Submission errors are reported as "unknown" by place_bet_slip, so this
+            # failed before the slip was sent
+            logger.error(f"Bet placement failed for user_id={user_id}: {e}", exc_info=True)
+            result = {"success": False, "message": "The bet could not be placed."}
+
+        total_ms = round((time.perf_counter() - started) * 1000)
+        timings = {"claim_ms": claim_ms, "total_ms": total_ms}
+        if "submit_ms" in result:
+            timings["session_ms"] = result["session_ms"]
+            timings["submit_ms"] = result["submit_ms"]
+            timings["queue_ms"] = max(total_ms - claim_ms - result["session_ms"] - result["submit_ms"], 0)
+
+        if not result["success"]:
+            outcome = "busy" if result.get("busy") else "unknown" if result.get("unknown") else "failed"
+            self.busy += outcome == "busy"
+            self.unknown += outcome == "unknown"
+            self.failed += outcome == "failed"
+            BET_PLACEMENT_SECONDS.labels(outcome).observe(total_ms / 1000)
+            await finish_bet_placement(
+                key, "unknown" if outcome == "unknown" else "failed", message=result["message"], timings=timings
+            )
+            return {**result, "odds": odds, "timings": timings}
+
+        self.placed += 1
+        self.submit_ms_total += result["submit_ms"]
+        self.submit_ms_max = max(self.submit_ms_max, result["submit_ms"])
+        BET_PLACEMENT_SECONDS.labels("placed").observe(total_ms / 1000)
+        # Mark the key first: whatever happens to the bet history, the slip is never placed twice
+        await finish_bet_placement(key, "placed", bet_id=result["bet_id"], timings=timings)
+        market = selections[0]["market"] if len(selections) == 1 else "Multiple"
+        try:
+            await record_bet(
+                user_id, result["bet_id"], market, stake, odds,
+                selections=selections, idempotency_key=key, timings=timings
+            )
+        except Exception as e:
+            logger.error(f"Could not record placed bet {result['bet_id']} for user_id={user_id}: {e}", exc_info=True)
+        return {"success": True, "bet_id": result["bet_id"], "odds": odds, "timings": timings}
+
+    def stats(self):
+        """
+        Return placement counters and submission latencies.
+        """
+        return {
+            "inflight": len(self._inflight),
+            "placed": self.placed,
+            "failed": self.failed,
+            "unknown": self.unknown,
+            "busy": self.busy,
+            "duplicates": self.duplicates,
+            "submit_ms_avg": round(self.submit_ms_total / self.placed) if self.placed else 0,
+            "submit_ms_max": self.submit_ms_max,
+        }
+
+
+bet_placer = BetPlacer(max_wait=Settings.BET_MAX_WAIT)
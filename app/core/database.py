@@ -1,6 +1,16 @@
+import asyncio
 import logging
 import os
+import time
+from datetime import datetime, timezone
+from bson.binary import Binary
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from app.config.settings import Settings
+from app.core.metrics import MONGO_WRITE_SECONDS
+from app.core.security import decrypt_json, encrypt_json, encryption_enabled
 
 # Database client (to be shared across the application)
 db_client = None
@@ -8,6 +18,63 @@ db_client = None
 # Access the MongoDB URI from environment variables
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/betting_botdb")
 
+# Indexes ensured at startup, per collection
+INDEXES = {
+    "users": [
+        # Login upserts match on the phone number; unique so concurrent upserts cannot duplicate a user
+        IndexModel([("phone_number", ASCENDING)], unique=True, name="phone_number_unique"),
+    ],
+    "session_states": [
+        # Let MongoDB drop storage states that are too old to be restored anyway
+        IndexModel([("saved_at", ASCENDING)], expireAfterSeconds=Settings.SESSION_STATE_MAX_AGE, name="saved_at_ttl"),
+    ],
+    "balance_history": [
+        IndexModel([("phone_number", ASCENDING), ("recorded_at", DESCENDING)], name="phone_number_recorded_at"),
+    ],
+    "bot_persistence": [
+        IndexModel([("kind", ASCENDING)], name="kind"),
+    ],
+    "session_owners": [
+        IndexModel([("worker_id", ASCENDING)], name="worker_id"),
+    ],
+    "pending_deletions": [
+        IndexModel([("due_at", ASCENDING)], name="due_at"),
+    ],
+    "bets": [
+        # A bet is recorded once per user, however often placement is reported
+        IndexModel([("user_id", ASCENDING), ("bet_id", ASCENDING)], unique=True, name="user_id_bet_id_unique"),
+        # Windowed /stat aggregations scan one user's bets by placement time
+        IndexModel([("user_id", ASCENDING), ("placed_at", DESCENDING)], name="user_id_placed_at"),
+        # The settlement job looks up every user's open bets
+        IndexModel([("status", ASCENDING), ("user_id", ASCENDING)], name="status_user_id"),
+    ],
+    "processed_updates": [
+        IndexModel([("seen_at", ASCENDING)], expireAfterSeconds=Settings.UPDATE_DEDUP_TTL, name="seen_at_ttl"),
+    ],
+    "bet_placements": [
+        # Idempotency keys (the _id) only have to outlive Telegram's redelivery of an update
+        IndexModel([("created_at", ASCENDING)], expireAfterSeconds=Settings.BET_IDEMPOTENCY_TTL, name="created_at_ttl"),
+    ],
+}
+
+
+def _client_options():
+    """
+    Build the Motor client options from the settings.
+    """
+    options = {
+        "maxPoolSize": Settings.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": Settings.MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": Settings.MONGO_MAX_IDLE_TIME_MS,
+        "serverSelectionTimeoutMS": Settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": Settings.MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": Settings.MONGO_SOCKET_TIMEOUT_MS,
+    }
+    if Settings.MONGO_WRITE_CONCERN:
+        write_concern = Settings.MONGO_WRITE_CONCERN
+        options["w"] = int(write_concern) if write_concern.isdigit() else write_concern
+    return options
+
 async def connect_to_db():
     """
     Establish a connection to the MongoDB database.
@@ -19,7 +86,7 @@ async def connect_to_db():
     try:
         # initialize the Motor client
         logging.info("Connecting to MongoDB database...")
-        db_client = AsyncIOMotorClient(MONGO_URI)
+        db_client = AsyncIOMotorClient(MONGO_URI, **_client_options())
         
         # Check connection by running a simple command
         await db_client.admin.command("ping")
@@ -28,6 +95,25 @@ async def connect_to_db():
         logging.error(f"An error occurred while connecting to MongoDB database: {e}")
         raise
 
+async def ensure_indexes():
+    """
+    Create the indexes declared in `INDEXES` if they do not exist yet.
+
+    Failures are logged per collection (e.g. existing duplicates preventing a unique
+    index) so that one bad index does not stop the application from starting.
+    """
+    db = get_database()
+    started = time.perf_counter()
+    for collection, indexes in INDEXES.items():
+        collection_started = time.perf_counter()
+        try:
+            await db[collection].create_indexes(indexes)
+            elapsed_ms = (time.perf_counter() - collection_started) * 1000
+            logging.info(f"Ensured {len(indexes)} index(es) on '{collection}' in {elapsed_ms:.1f} ms.")
+        except Exception as e:
+            logging.error(f"Failed to create indexes on '{collection}': {e}")
+    logging.info(f"Index management finished in {(time.perf_counter() - started) * 1000:.1f} ms.")
+
 async def close_db_connection():
     """
     Close the connection to the MongoDB database.
@@ -53,4 +139,511 @@ def get_database():
     global db_client
     if not db_client:
         raise RuntimeError("Database client is not initialized. Call `connect_to_db` first.")
-    return db_client["betting_botdb"] 
\ No newline at end of file
+    return db_client["betting_botdb"]
+
+
+def _storage_state_expired(state):
+    """
+    Check whether every cookie with an expiry date in a storage state has expired.
+
+    Session cookies (expires == -1) are ignored because the browser keeps them for
+    the lifetime of the context.
+    """
+    expiring = [cookie["expires"] for cookie in state.get("cookies", []) if cookie.get("expires", -1) > 0]
+    return bool(expiring) and max(expiring) < time.time()
+
+
+async def save_storage_state(user_id, state):
+    """
+    Store a user's Playwright storage state (cookies and localStorage), encrypted.
+
+    Args:
+        user_id: Telegram user ID owning the browser session.
+        state: Dictionary returned by `BrowserContext.storage_state()`.
+    """
+    if not encryption_enabled():
+        return
+    db = get_database()
+    await db["session_states"].update_one(
+        {"_id": user_id},
+        {"$set": {"state": Binary(encrypt_json(state)), "saved_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+
+
+async def load_storage_state(user_id):
+    """
+    Load a user's decrypted storage state.
+
+    States older than `SESSION_STATE_MAX_AGE`, states whose cookies have all expired
+    and states that can no longer be decrypted are deleted.
+
+    Returns:
+        dict: The storage state, or None if no usable state is stored.
+    """
+    if not encryption_enabled():
+        return None
+    db = get_database()
+    document = await db["session_states"].find_one({"_id": user_id})
+    if not document:
+        return None
+
+    saved_at = document["saved_at"].replace(tzinfo=timezone.utc)
+    age = (datetime.now(timezone.utc) - saved_at).total_seconds()
+    state = decrypt_json(document["state"]) if age <= Settings.SESSION_STATE_MAX_AGE else None
+    if state is None or _storage_state_expired(state):
+        logging.info(f"Discarding expired storage state for user_id={user_id}.")
+        await delete_storage_state(user_id)
+        return None
+    return state
+
+
+async def storage_state_exists(user_id):
+    """
+    Check cheaply whether a storage state is stored for a user.
+    """
+    if not encryption_enabled():
+        return False
+    db = get_database()
+    return await db["session_states"].count_documents({"_id": user_id}, limit=1) > 0
+
+
+async def delete_storage_state(user_id):
+    """
+    Remove a user's stored storage state.
+    """
+    if not encryption_enabled():
+        return
+    db = get_database()
+    await db["session_states"].delete_one({"_id": user_id})
+
+
+async def add_pending_deletion(chat_id, message_id, due_at):
+    """
+    Persist a message that has to be deleted at `due_at` (UNIX timestamp).
+    """
+    db = get_database()
+    await db["pending_deletions"].update_one(
+        {"_id": f"{chat_id}:{message_id}"},
+        {"$set": {"chat_id": chat_id, "message_id": message_id, "due_at": due_at}},
+        upsert=True
+    )
+
+
+async def load_pending_deletions():
+    """
+    Return every persisted message deletion that has not been carried out yet.
+    """
+    db = get_database()
+    return await db["pending_deletions"].find({}, {"_id": 0}).to_list(None)
+
+
+async def remove_pending_deletions(messages):
+    """
+    Forget persisted deletions once they have been carried out.
+
+    Args:
+        messages: Iterable of (chat_id, message_id) pairs.
+    """
+    db = get_database()
+    ids = [f"{chat_id}:{message_id}" for chat_id, message_id in messages]
+    await db["pending_deletions"].delete_many({"_id": {"$in": ids}})
+
+
+def _market_key(market):
+    """
+    Turn a market name into a field name usable in a dotted path.
+    """
+    return str(market or "other").replace(".", "_").replace("$", "_")
+
+
+def _add(field, amount):
+    """
+    Update-pipeline expression adding `amount` to a possibly missing numeric field.
+    """
+    return {"$add": [{"$ifNull": [f"${field}", 0]}, amount]}
+
+
+async def record_bet(user_id, bet_id, market, stake, odds, placed_at=None, **fields):
+    """
+    Store a newly placed bet and count it in the user's rollup.
+
+    Args:
+        user_id: Telegram user ID.
+        bet_id: Identifier of the bet, unique per user.
+        market: Market name, e.g. "1X2". Used for the per-market breakdown.
+        stake: Amount staked.
+        odds: Total odds of the slip.
+        placed_at: When the bet was placed. Defaults to now.
+        **fields: Anything else to keep on the bet document, e.g. selections or timings.
+
+    Returns:
+        bool: False if the bet was already recorded.
+    """
+    db = get_database()
+    document = {
+        "user_id": user_id,
+        "bet_id": bet_id,
+        "market": market,
+        "stake": stake,
+        "odds": odds,
+        "status": "open",
+        "placed_at": placed_at or datetime.now(timezone.utc),
+        **fields,
+    }
+    try:
+        await db["bets"].insert_one(document)
+    except DuplicateKeyError:
+        return False
+    market_key = _market_key(market)
+    await db["bet_stats"].update_one(
+        {"_id": user_id},
+        {"$inc": {
+            "bets": 1,
+            "open": 1,
+            "staked": stake,
+            f"markets.{market_key}.bets": 1,
+            f"markets.{market_key}.staked": stake,
+        }},
+        upsert=True
+    )
+    return True
+
+
+async def settle_bet(user_id, bet_id, status, payout=0):
+    """
+    Record the outcome of an open bet and fold it into the user's rollup.
+
+    The rollup, including the current and longest win/loss streaks (in settlement
+    order), is updated by a single update pipeline, so concurrent settlements of the
+    same user's bets cannot lose increments. Void bets return the stake and neither
+    count towards the win rate nor break a streak.
+
+    Args:
+        status: "won", "lost" or "void".
+        payout: Amount returned (stake included); 0 for lost bets.
+
+    Returns:
+        bool: False if the bet is unknown or was already settled.
+    """
+    if status not in ("won", "lost", "void"):
+        raise ValueError(f"Unknown bet status: {status}")
+    db = get_database()
+    bet = await db["bets"].find_one_and_update(
+        {"user_id": user_id, "bet_id": bet_id, "status": "open"},
+        {"$set": {"status": status, "payout": payout, "settled_at": datetime.now(timezone.utc)}},
+        projection={"market": 1, "stake": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if bet is None:
+        return False
+
+    market = f"markets.{_market_key(bet['market'])}"
+    won, lost = int(status == "won"), int(status == "lost")
+    counted_stake = 0 if status == "void" else bet["stake"]
+    counted_payout = 0 if status == "void" else payout
+    streak = {"$ifNull": ["$current_streak", 0]}
+    if status == "won":
+        streak = {"$cond": [{"$gt": [streak, 0]}, {"$add": [streak, 1]}, 1]}
+    elif status == "lost":
+        streak = {"$cond": [{"$lt": [streak, 0]}, {"$subtract": [streak, 1]}, -1]}
+
+    await db["bet_stats"].update_one(
+        {"_id": user_id},
+        [
+            {"$set": {
+                "open": _add("open", -1),
+                "won": _add("won", won),
+                "lost": _add("lost", lost),
+                "void": _add("void", int(status == "void")),
+                "settled_staked": _add("settled_staked", counted_stake),
+                "returned": _add("returned", counted_payout),
+                "current_streak": streak,
+                f"{market}.won": _add(f"{market}.won", won),
+                f"{market}.lost": _add(f"{market}.lost", lost),
+                f"{market}.settled_staked": _add(f"{market}.settled_staked", counted_stake),
+                f"{market}.returned": _add(f"{market}.returned", counted_payout),
+            }},
+            {"$set": {
+                "longest_win_streak": {"$max": [{"$ifNull": ["$longest_win_streak", 0]}, "$current_streak"]},
+                "longest_loss_streak": {
+                    "$max": [{"$ifNull": ["$longest_loss_streak", 0]}, {"$multiply": [-1, "$current_streak"]}]
+                },
+            }},
+        ],
+        upsert=True
+    )
+    return True
+
+
+async def get_open_bets():
+    """
+    Return the IDs of all open bets, grouped by user.
+
+    Returns:
+        dict: user_id -> set of bet IDs
+    """
+    db = get_database()
+    open_bets = {}
+    async for bet in db["bets"].find({"status": "open"}, {"_id": 0, "user_id": 1, "bet_id": 1}):
+        open_bets.setdefault(bet["user_id"], set()).add(bet["bet_id"])
+    return open_bets
+
+
+async def get_bet_stats(user_id):
+    """
+    Return the user's precomputed all-time rollup, or None if they have no bets.
+    """
+    db = get_database()
+    return await db["bet_stats"].find_one({"_id": user_id})
+
+
+async def aggregate_bet_stats(user_id, since):
+    """
+    Compute totals and the per-market breakdown of bets placed since a date with one
+    aggregation pipeline, in the same shape as the rollup (without streaks).
+
+    Returns:
+        dict: The stats, or None if no bets were placed in the window.
+    """
+    db = get_database()
+
+    settled = {"$in": ["$status", ["won", "lost"]]}
+    sums = {
+        "bets": {"$sum": 1},
+        "open": {"$sum": {"$cond": [{"$eq": ["$status", "open"]}, 1, 0]}},
+        "won": {"$sum": {"$cond": [{"$eq": ["$status", "won"]}, 1, 0]}},
+        "lost": {"$sum": {"$cond": [{"$eq": ["$status", "lost"]}, 1, 0]}},
+        "void": {"$sum": {"$cond": [{"$eq": ["$status", "void"]}, 1, 0]}},
+        "staked": {"$sum": "$stake"},
+        "settled_staked": {"$sum": {"$cond": [settled, "$stake", 0]}},
+        "returned": {"$sum": {"$cond": [settled, {"$ifNull": ["$payout", 0]}, 0]}},
+    }
+
+    pipeline = [
+        {"$match": {"user_id": user_id, "placed_at": {"$gte": since}}},
+        {"$project": {"market": 1, "status": 1, "stake": 1, "payout": 1}},
+        {"$facet": {
+            "totals": [{"$group": {"_id": None, **sums}}],
+            "markets": [{"$group": {"_id": "$market", **sums}}],
+        }},
+    ]
+    result = await db["bets"].aggregate(pipeline).to_list(1)
+    if not result or not result[0]["totals"]:
+        return None
+    stats = result[0]["totals"][0]
+    stats["markets"] = {_market_key(market.pop("_id")): market for market in result[0]["markets"]}
+    return stats
+
+
+async def mark_update_seen(update_id):
+    """
+    Record an incoming update_id across workers.
+
+    Returns:
+        bool: False if the update was already recorded, i.e. it is a redelivery.
+    """
+    db = get_database()
+    try:
+        await db["processed_updates"].insert_one({"_id": update_id, "seen_at": datetime.now(timezone.utc)})
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+async def forget_update(update_id):
+    """
+    Remove an update_id, so that Telegram's redelivery of it is processed.
+    """
+    db = get_database()
+    await db["processed_updates"].delete_one({"_id": update_id})
+
+
+async def claim_bet_placement(key, user_id, **fields):
+    """
+    Claim an idempotency key before a slip is submitted.
+
+    The key is the document's _id, so of two concurrent claims only one can insert
+    it. Only a key whose earlier placement definitely failed may be claimed again;
+    "pending" and "unknown" placements may have reached the site and are never
+    retried.
+
+    Args:
+        key: Idempotency key of the placement.
+        user_id: Telegram user ID placing the slip.
+        **fields: Anything else to keep on the claim, e.g. the stake.
+
+    Returns:
+        dict: None if the key was claimed, else the existing placement document.
+    """
+    db = get_database()
+    now = datetime.now(timezone.utc)
+    try:
+        await db["bet_placements"].insert_one(
+            {"_id": key, "user_id": user_id, "status": "pending", "created_at": now, **fields}
+        )
+        return None
+    except DuplicateKeyError:
+        pass
+    existing = await db["bet_placements"].find_one_and_update(
+        {"_id": key, "status": "failed"},
+        {"$set": {"status": "pending", "created_at": now}},
+    )
+    if existing is not None:
+        return None
+    return await db["bet_placements"].find_one({"_id": key})
+
+
+async def finish_bet_placement(key, status, **fields):
+    """
+    Record the outcome of a claimed placement.
+
+    Args:
+        status: "placed", "failed" (rejected, may be retried) or "unknown" (the
+            slip may have reached the site; never retried).
+        **fields: E.g. the bet ID, an error message or timings.
+    """
+    db = get_database()
+    await db["bet_placements"].update_one(
+        {"_id": key},
+        {"$set": {"status": status, "finished_at": datetime.now(timezone.utc), **fields}}
+    )
+
+
+class WriteBehindBuffer:
+    """
+    Collects user updates and balance history in memory and writes them in batches.
+
+    Repeated updates for the same user are merged into a single upsert. The buffer
+    is flushed with one `bulk_write` per collection when `max_pending` operations
+    are waiting or every `flush_interval` seconds, whichever comes first.
+    """
+    def __init__(self, max_pending, flush_interval):
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self._user_updates = {}  # phone_number -> merged fields to $set
+        self._history = []  # balance_history documents to insert
+        self._flush_needed = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self.merged = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.operations_written = 0
+        self.last_flush_size = 0
+        self.flush_ms_total = 0.0
+        self.flush_ms_max = 0.0
+
+    def pending(self):
+        return len(self._user_updates) + len(self._history)
+
+    def _added(self):
+        if self.pending() >= self.max_pending:
+            self._flush_needed.set()
+
+    def update_user(self, phone_number, fields):
+        """
+        Queue fields to be set on the user with this phone number (upserted).
+        """
+        if phone_number in self._user_updates:
+            self.merged += 1
+            self._user_updates[phone_number].update(fields)
+        else:
+            self._user_updates[phone_number] = dict(fields)
+        self._added()
+
+    def record_balance(self, phone_number, balance, user_id=None):
+        """
+        Queue a balance observation: appended to the history and set on the user.
+        """
+        now = datetime.now(timezone.utc)
+        self._history.append({"phone_number": phone_number, "user_id": user_id, "balance": balance, "recorded_at": now})
+        self.update_user(phone_number, {"balance": balance, "balance_updated_at": now})
+
+    def start(self):
+        """
+        Start the background flusher on the running loop.
+        """
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_needed.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self):
+        """
+        Write every pending operation with one `bulk_write` per collection.
+        """
+        async with self._flush_lock:
+            self._flush_needed.clear()
+            user_updates, self._user_updates = self._user_updates, {}
+            history, self._history = self._history, []
+            if not user_updates and not history:
+                return
+
+            size = len(user_updates) + len(history)
+            db = get_database()
+            started = time.perf_counter()
+            try:
+                if user_updates:
+                    with MONGO_WRITE_SECONDS.labels("users").time():
+                        await db["users"].bulk_write(
+                            [UpdateOne({"phone_number": phone}, {"$set": fields}, upsert=True)
+                             for phone, fields in user_updates.items()],
+                            ordered=False
+                        )
+                    user_updates = {}
+                if history:
+                    with MONGO_WRITE_SECONDS.labels("balance_history").time():
+                        await db["balance_history"].bulk_write([InsertOne(doc) for doc in history], ordered=False)
+                    history = []
+            except Exception as e:
+                self.failed_flushes += 1
+                logging.error(f"Write-behind flush failed, requeueing: {e}")
+                # Put unwritten operations back, without overriding newer updates
+                for phone, fields in user_updates.items():
+                    self._user_updates[phone] = {**fields, **self._user_updates.get(phone, {})}
+                self._history[:0] = history[-self.max_pending * 10:]  # Bound what survives repeated failures
+                return
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.flushes += 1
+            self.operations_written += size
+            self.last_flush_size = size
+            self.flush_ms_total += elapsed_ms
+            self.flush_ms_max = max(self.flush_ms_max, elapsed_ms)
+
+    async def stop(self):
+        """
+        Stop the background flusher and write everything still pending.
+        """
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def stats(self):
+        """
+        Return pending operations, flush counts, sizes and latencies.
+        """
+        return {
+            "pending": self.pending(),
+            "merged": self.merged,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "operations_written": self.operations_written,
+            "last_flush_size": self.last_flush_size,
+            "flush_ms_avg": round(self.flush_ms_total / self.flushes, 1) if self.flushes else 0.0,
+            "flush_ms_max": round(self.flush_ms_max, 1),
+        }
+
+
+user_writes = WriteBehindBuffer(
+    max_pending=Settings.WRITE_BEHIND_MAX_PENDING,
+    flush_interval=Settings.WRITE_BEHIND_INTERVAL,
+)
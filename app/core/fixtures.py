@@ -0,0 +1,284 @@
+"""
+Shared in-memory snapshot of upcoming fixtures and their odds.
+
+Fixtures and odds are the same for every user, so one background fetcher pulls
+them from SportyBet's public events endpoint and every /fetch reply is served from
+memory. Each fetch is applied to the snapshot as a diff: unchanged matches keep
+their objects (and pre-rendered text), and only the leagues that changed have
+their indexes rebuilt.
+"""
+import logging
+import time
+from datetime import datetime, timezone
+from heapq import merge
+
+from app.config.settings import Settings
+from app.core.http_client import sportybet_http
+
+
+class Match:
+    """
+    One fixture with its odds, as a compact immutable-by-convention record.
+
+    `odds` is a tuple of (market_id, market, ((outcome_id, outcome, price), ...)) so
+    two fetches can be compared with `==`. The rendered /fetch line is built once
+    and cached.
+    """
+    __slots__ = ("match_id", "league_id", "league", "home", "away", "start_time", "odds", "_line")
+
+    def __init__(self, match_id, league_id, league, home, away, start_time, odds):
+        self.match_id = match_id
+        self.league_id = league_id
+        self.league = league
+        self.home = home
+        self.away = away
+        self.start_time = start_time  # Epoch seconds
+        self.odds = odds
+        self._line = None
+
+    def key(self):
+        return (self.league_id, self.league, self.home, self.away, self.start_time, self.odds)
+
+    @property
+    def short_id(self):
+        """
+        The numeric part of the match ID, which users type in /bet.
+        """
+        return self.match_id.rsplit(":", 1)[-1]
+
+    def find_outcome(self, outcome, market=None):
+        """
+        Look up an outcome by name or ID, in `market` if given, else in the first
+        market offering it.
+
+        Returns:
+            tuple: (market_id, market, outcome_id, outcome, price), or None.
+        """
+        wanted = outcome.lower()
+        for market_id, market_name, outcomes in self.odds:
+            if market and market.lower() not in (str(market_id).lower(), market_name.lower()):
+                continue
+            for outcome_id, outcome_name, price in outcomes:
+                if wanted in (str(outcome_id).lower(), outcome_name.lower()):
+                    return market_id, market_name, outcome_id, outcome_name, price
+        return None
+
+    def line(self):
+        """
+        Return the match as it is shown in /fetch replies.
+        """
+        if self._line is None:
+            kickoff = datetime.fromtimestamp(self.start_time, timezone.utc).strftime("%d %b %H:%M")
+            markets = "\n".join(
+                f"  {market}: " + "  ".join(f"{outcome} {price}" for _, outcome, price in outcomes)
+                for _, market, outcomes in self.odds
+            )
+            header = f"#{self.short_id} {kickoff} {self.home} vs {self.away}"
+            self._line = f"{header}\n{markets}" if markets else header
+        return self._line
+
+
+def parse_events(payload):
+    """
+    Turn one page of the events endpoint into `Match` records.
+
+    Returns:
+        dict: match_id -> Match
+    """
+    matches = {}
+    for tournament in (payload.get("data") or {}).get("tournaments", []):
+        league_id = tournament.get("id")
+        league = " / ".join(part for part in (tournament.get("categoryName"), tournament.get("name")) if part)
+        for event in tournament.get("events", []):
+            odds = tuple(
+                (market.get("id"), market.get("desc", market.get("id", "")), tuple(
+                    (outcome.get("id"), outcome.get("desc", outcome.get("id", "")), outcome.get("odds"))
+                    for outcome in market.get("outcomes", [])
+                ))
+                for market in event.get("markets", [])
+            )
+            matches[event["eventId"]] = Match(
+                event["eventId"],
+                league_id,
+                league,
+                event.get("homeTeamName", ""),
+                event.get("awayTeamName", ""),
+                int(event.get("estimateStartTime", 0)) // 1000,
+                odds,
+            )
+    return matches
+
+
+class FixtureStore:
+    """
+    The current snapshot, indexed by match and by league in kickoff order.
+    """
+    def __init__(self):
+        self.matches = {}  # match_id -> Match
+        self.leagues = {}  # league_id -> {"name", "key", "ids"} with ids in kickoff order
+        self._all_ids = []  # Every match_id in kickoff order
+        self._filtered = {}  # League filter -> matching ids, valid for the current version
+        self.version = 0
+        self.updated_at = None
+        self.added = 0
+        self.removed = 0
+        self.changed = 0
+
+    def _sorted_ids(self, ids):
+        return sorted(ids, key=lambda match_id: (self.matches[match_id].start_time, match_id))
+
+    def apply(self, fresh):
+        """
+        Replace the snapshot with a newly fetched one, touching only what changed.
+
+        Returns:
+            tuple: (added, removed, changed) match counts.
+        """
+        dirty = set()
+        added = removed = changed = 0
+        for match_id in self.matches.keys() - fresh.keys():
+            dirty.add(self.matches.pop(match_id).league_id)
+            removed += 1
+        for match_id, match in fresh.items():
+            current = self.matches.get(match_id)
+            if current is None:
+                added += 1
+            elif current.key() != match.key():
+                changed += 1
+                dirty.add(current.league_id)
+            else:
+                continue  # Keep the existing object and its rendered line
+            self.matches[match_id] = match
+            dirty.add(match.league_id)
+
+        if dirty:
+            by_league = {league_id: [] for league_id in dirty}
+            for match_id, match in self.matches.items():
+                if match.league_id in by_league:
+                    by_league[match.league_id].append(match_id)
+            for league_id, ids in by_league.items():
+                if ids:
+                    name = self.matches[ids[0]].league
+                    self.leagues[league_id] = {"name": name, "key": name.lower(), "ids": self._sorted_ids(ids)}
+                else:
+                    self.leagues.pop(league_id, None)
+            self._all_ids = self._sorted_ids(self.matches)
+            self._filtered = {}
+            self.version += 1
+        self.updated_at = time.time()
+        self.added += added
+        self.removed += removed
+        self.changed += changed
+        return added, removed, changed
+
+    def get(self, reference):
+        """
+        Find a match by full ID or by the short ID shown in /fetch.
+        """
+        return self.matches.get(reference) or self.matches.get(f"sr:match:{reference}")
+
+    def query(self, league=None, page=1, page_size=10):
+        """
+        Return one page of matches, optionally only from leagues whose name contains `league`.
+
+        Returns:
+            tuple: (matches on the page, total matching, number of pages)
+        """
+        if league:
+            needle = league.lower()
+            ids = self._filtered.get(needle)
+            if ids is None:
+                lists = [entry["ids"] for entry in self.leagues.values() if needle in entry["key"]]
+                ids = lists[0] if len(lists) == 1 else list(
+                    merge(*lists, key=lambda match_id: (self.matches[match_id].start_time, match_id))
+                )
+                if len(self._filtered) < 1000:  # Bounded; cleared on every snapshot change
+                    self._filtered[needle] = ids
+        else:
+            ids = self._all_ids
+        total = len(ids)
+        pages = max((total + page_size - 1) // page_size, 1)
+        page = min(max(page, 1), pages)
+        start = (page - 1) * page_size
+        return [self.matches[match_id] for match_id in ids[start:start + page_size]], total, pages
+
+    def stats(self):
+        return {
+            "matches": len(self.matches),
+            "leagues": len(self.leagues),
+            "version": self.version,
+            "age_seconds": round(time.time() - self.updated_at, 1) if self.updated_at else None,
+            "added": self.added,
+            "removed": self.removed,
+            "changed": self.changed,
+        }
+
+
+class FixtureFetcher:
+    """
+    Refreshes the shared snapshot on a repeating JobQueue job.
+    """
+    def __init__(self, store, interval):
+        self.store = store
+        self.interval = interval
+        self.fetches = 0
+        self.failures = 0
+        self.last_duration_ms = None
+
+    def start(self, job_queue):
+        """
+        Fetch right away, then every `interval` seconds.
+        """
+        job_queue.run_repeating(self._refresh, interval=self.interval, first=0, name="fixtures")
+
+    async def fetch(self):
+        """
+        Fetch every page of upcoming events.
+
+        Returns:
+            dict: match_id -> Match
+        """
+        matches = {}
+        for page in range(1, Settings.FIXTURES_MAX_PAGES + 1):
+            payload = await sportybet_http.get_public_json(Settings.FIXTURES_API_PATH, params={
+                "sportId": Settings.FIXTURES_SPORT_ID,
+                "marketId": Settings.FIXTURES_MARKETS,
+                "pageSize": Settings.FIXTURES_PAGE_SIZE,
+                "pageNum": page,
+            })
+            parsed = parse_events(payload)
+            matches.update(parsed)
+            if len(parsed) < Settings.FIXTURES_PAGE_SIZE:
+                break
+        return matches
+
+    async def _refresh(self, context=None):
+        started = time.perf_counter()
+        try:
+            fresh = await self.fetch()
+        except Exception as e:
+            self.failures += 1
+            logging.error(f"Failed to fetch fixtures, keeping the previous snapshot: {e}")
+            return
+        if not fresh:
+            # An error answer parses to nothing; applying it would remove every match
+            self.failures += 1
+            logging.warning("Fixtures fetch returned no matches, keeping the previous snapshot.")
+            return
+        added, removed, changed = self.store.apply(fresh)
+        self.fetches += 1
+        self.last_duration_ms = round((time.perf_counter() - started) * 1000)
+        if added or removed or changed:
+            logging.info(f"Fixtures updated: {added} added, {removed} removed, {changed} changed.")
+
+    def stats(self):
+        return {
+            **self.store.stats(),
+            "fetches": self.fetches,
+            "failures": self.failures,
+            "last_fetch_ms": self.last_duration_ms,
+        }
+
+
+fixture_store = FixtureStore()
+fixture_fetcher = FixtureFetcher(fixture_store, interval=Settings.FIXTURES_REFRESH_INTERVAL)
@@ -0,0 +1,137 @@
+"""
+Browserless access to SportyBet's JSON endpoints.
+
+Once a user has logged in through Playwright, the session cookies are exported here
+and account data such as the balance is fetched with a plain pooled HTTP request
+instead of driving a Chromium page.
+"""
+import logging
+import httpx
+
+from app.config.settings import Settings
+
+
+class AuthExpiredError(Exception):
+    """
+    Raised when the site rejects the exported session cookies.
+    """
+
+
+class SportyBetHttpClient:
+    """
+    A pooled async HTTP client that reuses each user's browser session cookies.
+
+    One `httpx.AsyncClient` (and its connection pool) is shared by all users; the
+    cookies are sent per request as a header, so users never share a cookie jar.
+    """
+    def __init__(self, base_url=None):
+        self.base_url = (base_url or Settings.SPORTYBET_API_URL).rstrip("/")
+        self.host = httpx.URL(self.base_url).host
+        self._client = None
+        self._cookie_headers = {}  # user_id -> "name=value; ..." Cookie header
+
+    def _get_client(self):
+        """
+        Create the shared client lazily so it binds to the running event loop.
+        """
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=Settings.HTTP_TIMEOUT,
+                limits=httpx.Limits(max_connections=Settings.HTTP_MAX_CONNECTIONS),
+                headers={"Accept": "application/json"},
+            )
+        return self._client
+
+    def export_cookies(self, user_id, cookies):
+        """
+        Remember the cookies of a logged-in browser context for a user.
+
+        Args:
+            user_id: Telegram user ID.
+            cookies: List of cookie dicts as returned by `BrowserContext.cookies()`
+                or found in a storage state.
+        """
+        pairs = [f"{cookie['name']}={cookie['value']}" for cookie in cookies if self._matches_host(cookie)]
+        if pairs:
+            self._cookie_headers[user_id] = "; ".join(pairs)
+
+    def _matches_host(self, cookie):
+        """
+        Check whether a cookie's domain covers the API host, on a label boundary.
+        """
+        domain = cookie.get("domain", "").lstrip(".").lower()
+        if not domain:
+            return False
+        return self.host == domain or self.host.endswith("." + domain)
+
+    def has_cookies(self, user_id):
+        """
+        Return True when cookies have been exported for a user.
+        """
+        return user_id in self._cookie_headers
+
+    def forget(self, user_id):
+        """
+        Drop a user's cookies, e.g. on logout or after an auth failure.
+        """
+        self._cookie_headers.pop(user_id, None)
+
+    async def get_json(self, user_id, path, params=None):
+        """
+        GET a JSON endpoint with the user's session cookies.
+
+        Raises:
+            AuthExpiredError: If the user has no cookies or the site rejects them.
+            httpx.HTTPError: On network errors and other unexpected statuses.
+        """
+        cookie_header = self._cookie_headers.get(user_id)
+        if not cookie_header:
+            raise AuthExpiredError("No session cookies exported for this user.")
+        response = await self._get_client().get(path, params=params, headers={"Cookie": cookie_header})
+        if response.status_code in (401, 403):
+            raise AuthExpiredError(f"Session rejected with HTTP {response.status_code}.")
+        response.raise_for_status()
+        return response.json()
+
+    async def get_public_json(self, path, params=None):
+        """
+        GET a JSON endpoint that needs no session, e.g. fixtures and odds.
+
+        Raises:
+            httpx.HTTPError: On network errors and unexpected statuses.
+        """
+        response = await self._get_client().get(path, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def fetch_balance(self, user_id):
+        """
+        Fetch the user's balance from the balance endpoint.
+
+        Returns:
+            str: The balance as found at `BALANCE_API_FIELD` in the response.
+
+        Raises:
+            AuthExpiredError: If the session is rejected or the response carries no balance.
+        """
+        payload = await self.get_json(user_id, Settings.BALANCE_API_PATH)
+        value = payload
+        for key in Settings.BALANCE_API_FIELD.split("."):
+            if not isinstance(value, dict) or key not in value:
+                # The site answers logged-out requests with an error body instead of a 401
+                raise AuthExpiredError(f"No balance in response: {payload}")
+            value = value[key]
+        return str(value)
+
+    async def close(self):
+        """
+        Close the shared connection pool.
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            logging.info("SportyBet HTTP client closed.")
+
+
+sportybet_http = SportyBetHttpClient()
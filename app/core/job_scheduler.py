@@ -0,0 +1,162 @@
+"""
+Admission control for browser jobs.
+
+Every job that drives a user's Playwright page runs inside a scheduler slot. Jobs of
+one user never overlap, at most `max_concurrent` jobs run at once across all users,
+and waiting jobs are started round-robin across users. A job that cannot start
+within its deadline is turned away with `SchedulerBusyError`, so the user gets a
+quick "busy" reply instead of a chat that hangs.
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from app.config.settings import Settings
+from app.core.metrics import EXECUTOR_QUEUE_WAIT_SECONDS
+
+QUEUE_WAIT_TIMER = EXECUTOR_QUEUE_WAIT_SECONDS.labels("scraper")
+
+
+class SchedulerBusyError(Exception):
+    """
+    Raised when a job cannot start within its deadline.
+    """
+
+
+class JobScheduler:
+    """
+    Per-user serialization, a global concurrency cap and a fair queue with deadlines.
+
+    A user with waiting jobs and no running job is in the ready queue once. When a
+    slot frees up, the user at the front gets it for their oldest job and goes to the
+    back of the line if more jobs are waiting, so a user firing many commands cannot
+    starve the others.
+    """
+    def __init__(self, max_concurrent, max_wait, max_queued):
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self.max_queued = max_queued
+        self.running = 0
+        self.queued = 0
+        self._busy_users = set()  # Users with a job running
+        self._waiting = {}  # user_id -> deque of futures resolved when the job may start
+        self._ready = deque()  # Users with waiting jobs and none running, in turn order
+        self.avg_duration = 0.0  # Moving average of job duration, used to predict waits
+        self.admitted = 0
+        self.rejected = 0
+        self.expired = 0
+        self.wait_max = 0.0
+
+    def _estimated_wait(self):
+        return self.avg_duration * (self.queued + 1) / self.max_concurrent
+
+    def _start(self, user_id):
+        self.running += 1
+        self._busy_users.add(user_id)
+
+    def _dispatch(self):
+        while self.running < self.max_concurrent and self._ready:
+            user_id = self._ready.popleft()
+            waiters = self._waiting[user_id]
+            future = waiters.popleft()
+            if not waiters:
+                del self._waiting[user_id]
+            self.queued -= 1
+            self._start(user_id)
+            future.set_result(None)
+
+    def _release(self, user_id):
+        self.running -= 1
+        self._busy_users.discard(user_id)
+        if user_id in self._waiting:
+            self._ready.append(user_id)  # Next job of this user, behind everyone else
+        self._dispatch()
+
+    def _withdraw(self, user_id, future):
+        waiters = self._waiting[user_id]
+        waiters.remove(future)
+        self.queued -= 1
+        if not waiters:
+            del self._waiting[user_id]
+            if user_id in self._ready:
+                self._ready.remove(user_id)
+
+    async def _admit(self, user_id, max_wait):
+        if user_id not in self._busy_users and not self._ready and self.running < self.max_concurrent:
+            self._start(user_id)
+            return
+        if self.queued >= self.max_queued or self._estimated_wait() > max_wait:
+            self.rejected += 1
+            raise SchedulerBusyError("Too many requests are waiting. Please try again in a minute.")
+
+        future = asyncio.get_running_loop().create_future()
+        if user_id not in self._waiting:
+            self._waiting[user_id] = deque()
+            if user_id not in self._busy_users:
+                self._ready.append(user_id)
+        self._waiting[user_id].append(future)
+        self.queued += 1
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), max_wait)
+        except asyncio.TimeoutError:
+            if future.done():
+                return  # Started just as the deadline passed
+            self._withdraw(user_id, future)
+            self.expired += 1
+            raise SchedulerBusyError("The bot is busy right now. Please try again in a minute.")
+        except asyncio.CancelledError:
+            if future.done():
+                self._release(user_id)
+            else:
+                self._withdraw(user_id, future)
+            raise
+
+    @asynccontextmanager
+    async def slot(self, user_id, max_wait=None):
+        """
+        Wait for the user's turn and a free slot, then hold both while the block runs.
+
+        Args:
+            user_id: Telegram user ID the job works for.
+            max_wait: Seconds the job may wait to start. Defaults to `max_wait`.
+
+        Raises:
+            SchedulerBusyError: If the job cannot start in time.
+        """
+        submitted = time.monotonic()
+        await self._admit(user_id, self.max_wait if max_wait is None else max_wait)
+        started = time.monotonic()
+        waited = started - submitted
+        self.admitted += 1
+        self.wait_max = max(self.wait_max, waited)
+        QUEUE_WAIT_TIMER.observe(waited)
+        try:
+            yield
+        finally:
+            self.avg_duration = 0.8 * self.avg_duration + 0.2 * (time.monotonic() - started)
+            self._release(user_id)
+
+    def stats(self):
+        """
+        Return running and queued job counts and admission counters.
+        """
+        return {
+            "running": self.running,
+            "max_concurrent": self.max_concurrent,
+            "queued": self.queued,
+            "users_waiting": len(self._waiting),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "avg_job_seconds": round(self.avg_duration, 2),
+            "wait_max_seconds": round(self.wait_max, 2),
+        }
+
+
+scraper_scheduler = JobScheduler(
+    max_concurrent=Settings.SCRAPER_MAX_CONCURRENT,
+    max_wait=Settings.SCRAPER_MAX_WAIT,
+    max_queued=Settings.SCRAPER_MAX_QUEUED,
+)
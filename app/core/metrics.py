@@ -0,0 +1,206 @@
+"""
+Minimal in-process metrics with Prometheus text exposition.
+
+Recording a value is a few integer operations and a bisect, so instrumentation can
+stay on the hot path. Values that already live elsewhere (session counts, queue
+depths, RSS) are read by collectors only when `/metrics` is scraped.
+"""
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from sub-millisecond cache hits to 90 s page loads
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 90)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        registry.register(self)
+
+    def labels(self, *values):
+        """
+        Return the child metric for one combination of label values.
+        """
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _default(self):
+        return self.labels(*())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for values, child in self._children.items():
+            lines.extend(child.render(self.name, self.labelnames, values))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def render(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {self.value}"]
+
+
+class Counter(_Metric):
+    """
+    A monotonically increasing count.
+    """
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def render(self, name, labelnames, values):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(float(bound))
+            lines.append(f"{name}_bucket{_format_labels(labelnames, values, [('le', le)])} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, values)} {self.sum}")
+        lines.append(f"{name}_count{_format_labels(labelnames, values)} {self.count}")
+        return lines
+
+
+class Histogram(_Metric):
+    """
+    A distribution of observed values (latencies, in seconds) over fixed buckets.
+    """
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+
+class Registry:
+    """
+    Holds every metric plus collectors that produce gauge values at scrape time.
+    """
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def register_collector(self, collector):
+        """
+        Add a callable returning an iterable of
+        (name, documentation, value, labels dict) gauge samples.
+        """
+        self._collectors.append(collector)
+
+    def render(self):
+        """
+        Return all metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        documented = set()
+        for collector in self._collectors:
+            for name, documentation, value, labels in collector():
+                if value is None:
+                    continue
+                if name not in documented:
+                    documented.add(name)
+                    lines.append(f"# HELP {name} {documentation}")
+                    lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Hot-path histograms shared by the modules that record them
+SCRAPER_STEP_SECONDS = Histogram(
+    "scraper_step_seconds", "Duration of Playwright steps in the scraper.", labelnames=("step",)
+)
+BALANCE_FETCH_SECONDS = Histogram(
+    "balance_fetch_seconds", "Duration of a balance read, by source.", labelnames=("source",)
+)
+BCRYPT_SECONDS = Histogram(
+    "bcrypt_seconds", "Time spent in bcrypt inside the hashing pool.", labelnames=("operation",)
+)
+EXECUTOR_QUEUE_WAIT_SECONDS = Histogram(
+    "executor_queue_wait_seconds", "Time jobs wait before an executor worker picks them up.", labelnames=("executor",)
+)
+MONGO_WRITE_SECONDS = Histogram(
+    "mongo_write_seconds", "Latency of MongoDB writes.", labelnames=("collection",)
+)
+WEBHOOK_SECONDS = Histogram(
+    "webhook_seconds", "Time from receiving a webhook request to acknowledging it."
+)
+UPDATE_QUEUE_WAIT_SECONDS = Histogram(
+    "update_queue_wait_seconds", "Time updates wait in the queue before a worker picks them up."
+)
+UPDATE_PROCESSING_SECONDS = Histogram(
+    "update_processing_seconds", "Time spent processing one update in the handlers."
+)
+BET_PLACEMENT_SECONDS = Histogram(
+    "bet_placement_seconds", "Time from /bet place to the recorded outcome, by outcome.", labelnames=("outcome",)
+)
+TELEGRAM_SEND_SECONDS = Histogram(
+    "telegram_send_seconds", "Time from queueing an outgoing message to Telegram accepting it."
+)
@@ -0,0 +1,125 @@
+"""
+Request interception policy for scraper pages.
+
+The scraper only needs SportyBet's documents, scripts and API calls. Images, fonts,
+media and third-party trackers are aborted before they hit the network, which cuts
+bandwidth and makes `page.goto` settle sooner.
+"""
+from collections import Counter
+from urllib.parse import urlsplit
+
+from app.config.settings import Settings
+
+# Rough transfer size of a blocked request, by resource type. Blocked requests never
+# reach the network, so the bytes saved can only be estimated.
+ESTIMATED_BYTES = {
+    "image": 30_000,
+    "font": 40_000,
+    "media": 250_000,
+    "stylesheet": 20_000,
+    "script": 25_000,
+}
+DEFAULT_ESTIMATED_BYTES = 5_000
+
+
+def _host_matches(host, domains):
+    """
+    Check whether a host equals or is a subdomain of one of the given domains.
+    """
+    return any(host == domain or host.endswith(f".{domain}") for domain in domains)
+
+
+class ResourcePolicy:
+    """
+    Allow/deny rules deciding which requests a scraper page may make.
+
+    Requests to an allowed domain always go through. Otherwise a request is blocked
+    when its resource type or its domain is on the deny list.
+    """
+    def __init__(self, blocked_types=(), blocked_domains=(), allowed_domains=()):
+        self.blocked_types = frozenset(blocked_types)
+        self.blocked_domains = tuple(blocked_domains)
+        self.allowed_domains = tuple(allowed_domains)
+
+    @classmethod
+    def from_settings(cls):
+        """
+        Build the policy configured through the environment.
+        """
+        return cls(
+            blocked_types=Settings.BLOCK_RESOURCE_TYPES,
+            blocked_domains=Settings.BLOCK_DOMAINS,
+            allowed_domains=Settings.ALLOW_DOMAINS,
+        )
+
+    def should_block(self, resource_type, url):
+        """
+        Decide whether a request has to be aborted.
+        """
+        host = urlsplit(url).hostname or ""
+        if _host_matches(host, self.allowed_domains):
+            return False
+        return resource_type in self.blocked_types or _host_matches(host, self.blocked_domains)
+
+
+class ResourceCounters:
+    """
+    Requests and estimated bytes saved by blocking, optionally rolled up into a
+    parent (process-wide) counter.
+    """
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.requests_allowed = 0
+        self.requests_blocked = Counter()  # resource type -> count
+        self.bytes_saved = 0
+
+    def record_allowed(self):
+        self.requests_allowed += 1
+        if self.parent:
+            self.parent.record_allowed()
+
+    def record_blocked(self, resource_type):
+        self.requests_blocked[resource_type] += 1
+        self.bytes_saved += ESTIMATED_BYTES.get(resource_type, DEFAULT_ESTIMATED_BYTES)
+        if self.parent:
+            self.parent.record_blocked(resource_type)
+
+    def stats(self):
+        return {
+            "requests_allowed": self.requests_allowed,
+            "requests_blocked": sum(self.requests_blocked.values()),
+            "blocked_by_type": dict(self.requests_blocked),
+            "estimated_bytes_saved": self.bytes_saved,
+        }
+
+
+async def install_async(target, policy, counters):
+    """
+    Route every request of an async Playwright context or page through the policy.
+    """
+    async def handle(route):
+        request = route.request
+        if policy.should_block(request.resource_type, request.url):
+            counters.record_blocked(request.resource_type)
+            await route.abort("blockedbyclient")
+        else:
+            counters.record_allowed()
+            await route.continue_()
+
+    await target.route("**/*", handle)
+
+
+def install_sync(target, policy, counters):
+    """
+    Route every request of a sync Playwright context or page through the policy.
+    """
+    def handle(route):
+        request = route.request
+        if policy.should_block(request.resource_type, request.url):
+            counters.record_blocked(request.resource_type)
+            route.abort("blockedbyclient")
+        else:
+            counters.record_allowed()
+            route.continue_()
+
+    target.route("**/*", handle)
@@ -1,10 +1,68 @@
 #from playwright.sync_api import sync_playwright
+import logging
+import time
+
+from app.config.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+def balance_from_response(payload):
+    """
+    Read the balance at `BALANCE_API_FIELD` from the site's balance response.
+
+    Returns:
+        str: The balance, or None if the response carries none (e.g. logged out).
+    """
+    value = payload
+    for key in Settings.BALANCE_API_FIELD.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return str(value)
+
+
+def is_balance_response(response):
+    """
+    Match the request the page makes to fetch the balance.
+    """
+    return Settings.BALANCE_RESPONSE_PATTERN in response.url
+
+
+def refresh_balance(page):
+    """
+    Click the refresh button and take the balance from the response it triggers.
+
+    The page re-renders the balance only after that response has arrived, so the
+    value is read from the response body rather than the DOM. The shown balance is
+    the fallback when no response arrives within `BALANCE_REFRESH_TIMEOUT_MS` or it
+    carries no balance.
+
+    Returns:
+        tuple: (balance, observed, elapsed_ms) where observed is "response" or
+        "timeout".
+    """
+    started = time.perf_counter()
+    clicked = False
+    try:
+        # Leaving the block waits for the response
+        with page.expect_response(is_balance_response, timeout=Settings.BALANCE_REFRESH_TIMEOUT_MS) as response_info:
+            page.click("#j_refreshBalance")  # Click the refresh button
+            clicked = True
+        balance = balance_from_response(response_info.value.json())
+    except Exception:
+        if not clicked:
+            raise
+        balance = None  # No usable response, read whatever is shown
+    elapsed_ms = round((time.perf_counter() - started) * 1000)
+    if balance is None:
+        return page.locator(".m-balance").inner_text(), "timeout", elapsed_ms
+    return balance, "response", elapsed_ms
 
 def validate_sportybet_credentials(user_id, phone_number, password, session_manager, refresh_only=False):
     """
     Validate user credentials or refresh the balance using Playwright.
     """
-    print(f"Debug: Running {'refresh' if refresh_only else 'login'} process for user_id={user_id}")
+    logger.debug(f"Running {'refresh' if refresh_only else 'login'} process for user_id={user_id}")
 
     # Get or create the user's session
     session = session_manager.start_session(user_id)
@@ -12,7 +70,7 @@ def validate_sportybet_credentials(user_id, phone_number, password, session_mana
 
     if not refresh_only:
         # Login flow
-        print("Debug: Navigating to login page...")
+        logger.debug("Navigating to login page...")
         page.goto("https://www.sportybet.com/ng/login", timeout=90000)
         page.fill("input[name='phone']", phone_number)
         page.fill("input[type='password']", password)
@@ -22,16 +80,15 @@ def validate_sportybet_credentials(user_id, phone_number, password, session_mana
             balance = page.locator(".m-balance").inner_text()
             return {"success": True, "balance": balance}
         except Exception as e:
-            print(f"Debug: Failed to find balance. Error: {e}")
+            logger.warning(f"Failed to find balance. Error: {e}")
             return {"success": False, "message": "Failed to login or fetch balance."}
     else:
         # Refresh balance flow
-        print("Debug: Refreshing balance...")
+        logger.debug("Refreshing balance...")
         try:
-            page.click("#j_refreshBalance")  # Click the refresh button
-            page.wait_for_timeout(6000)  # Wait for balance to update
-            balance = page.locator(".m-balance").inner_text()
-            return {"success": True, "balance": balance}
+            balance, observed, elapsed_ms = refresh_balance(page)
+            logger.debug(f"Balance refresh settled on '{observed}' after {elapsed_ms} ms")
+            return {"success": True, "balance": balance, "elapsed_ms": elapsed_ms}
         except Exception as e:
-            print(f"Debug: Failed to refresh balance. Error: {e}")
+            logger.warning(f"Failed to refresh balance. Error: {e}")
             return {"success": False, "message": "Failed to refresh balance."}
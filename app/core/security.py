@@ -0,0 +1,175 @@
+"""
+Password hashing and encryption helpers for data the bot keeps at rest.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from cryptography.fernet import Fernet, InvalidToken
+
+from app.config.settings import Settings
+from app.core.metrics import BCRYPT_SECONDS, EXECUTOR_QUEUE_WAIT_SECONDS
+
+_fernet = Fernet(Settings.SESSION_STATE_KEY.encode()) if Settings.SESSION_STATE_KEY else None
+
+
+def encryption_enabled():
+    """
+    Return True when an encryption key is configured.
+    """
+    return _fernet is not None
+
+
+def encrypt_json(data):
+    """
+    Serialize a JSON-compatible object and encrypt it.
+
+    Args:
+        data: Object to encrypt.
+
+    Returns:
+        bytes: Fernet token.
+    """
+    if _fernet is None:
+        raise RuntimeError("SESSION_STATE_KEY is not set. Cannot encrypt data.")
+    return _fernet.encrypt(json.dumps(data).encode())
+
+
+def decrypt_json(token):
+    """
+    Decrypt a Fernet token produced by `encrypt_json`.
+
+    Returns:
+        The decoded object, or None if the token cannot be decrypted
+        (for example after a key rotation).
+    """
+    if _fernet is None:
+        raise RuntimeError("SESSION_STATE_KEY is not set. Cannot decrypt data.")
+    try:
+        return json.loads(_fernet.decrypt(bytes(token)))
+    except InvalidToken:
+        return None
+
+
+def _hash_password(password, rounds):
+    """
+    Hash a password with bcrypt. Runs inside a hashing worker process.
+
+    Returns:
+        tuple: (hash, start timestamp, end timestamp) so the caller can tell queue
+        wait from hashing time.
+    """
+    import bcrypt
+    started = time.time()
+    hashed = bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=rounds)).decode()
+    return hashed, started, time.time()
+
+
+def _warm_up():
+    """
+    Import bcrypt in a hashing worker process, so the first real job does not pay for it.
+    """
+    import bcrypt  # noqa: F401
+
+
+def _verify_password(password, hashed):
+    """
+    Check a password against a bcrypt hash. Runs inside a hashing worker process.
+
+    Returns:
+        tuple: (matches, start timestamp, end timestamp)
+    """
+    import bcrypt
+    started = time.time()
+    matches = bcrypt.checkpw(password.encode(), hashed.encode())
+    return matches, started, time.time()
+
+
+class HasherBusyError(Exception):
+    """
+    Raised when too many hashing jobs are already queued.
+    """
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt in a dedicated process pool so hashing never blocks the event loop.
+
+    The number of queued and running jobs is capped; callers get `HasherBusyError`
+    instead of waiting behind an unbounded queue. The cost factor is read from
+    `BCRYPT_ROUNDS`.
+    """
+    def __init__(self, workers, max_pending, rounds):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self.pending = 0
+        self._executor = None
+
+    def _get_executor(self):
+        """
+        Create the worker pool on first use. Workers are spawned rather than forked
+        so they do not inherit the event loop or the Playwright driver threads.
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def _submit(self, operation, fn, *args):
+        if self.pending >= self.max_pending:
+            raise HasherBusyError(f"{self.pending} hashing jobs already queued.")
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            submitted = time.time()
+            result, started, finished = await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.pending -= 1
+        EXECUTOR_QUEUE_WAIT_SECONDS.labels("bcrypt").observe(max(started - submitted, 0))
+        BCRYPT_SECONDS.labels(operation).observe(finished - started)
+        return result
+
+    async def hash_password(self, password):
+        """
+        Hash a password with the configured cost factor.
+
+        Returns:
+            str: The bcrypt hash.
+        """
+        return await self._submit("hash", _hash_password, password, self.rounds)
+
+    async def verify_password(self, password, hashed):
+        """
+        Check a password against a stored bcrypt hash.
+        """
+        return await self._submit("verify", _verify_password, password, hashed)
+
+    async def warm_up(self):
+        """
+        Spawn every worker process ahead of the first login.
+        """
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        await asyncio.gather(*(loop.run_in_executor(executor, _warm_up) for _ in range(self.workers)))
+        logging.info(f"Password hashing pool warmed up with {self.workers} worker(s).")
+
+    def shutdown(self):
+        """
+        Stop the worker processes.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logging.info("Password hashing pool stopped.")
+
+
+password_hasher = PasswordHasher(
+    workers=Settings.BCRYPT_WORKERS,
+    max_pending=Settings.BCRYPT_MAX_PENDING,
+    rounds=Settings.BCRYPT_ROUNDS,
+)
@@ -1,30 +1,179 @@
+import logging
 from playwright.sync_api import sync_playwright
 
+from app.config.settings import Settings
+from app.core.resource_policy import ResourceCounters, ResourcePolicy, install_sync
+
+
+class BrowserPool:
+    """
+    A small, fixed set of long-lived Chromium browsers shared by all users.
+
+    Each user gets an isolated BrowserContext (own cookies and storage) placed on the
+    least-loaded browser. A browser that crashes or disconnects is replaced the next
+    time a context is requested; contexts on the other browsers are left untouched.
+
+    Sync Playwright objects are bound to the thread that created them, so a pool must
+    only be used from the thread that started it.
+    """
+    def __init__(self, size, headless=True):
+        self.size = size
+        self.headless = headless
+        self.playwright = None
+        self.slots = []  # One entry per browser: {"browser", "contexts", "crashed"}
+
+    def _launch(self):
+        """
+        Launch a browser and wrap it in a pool slot.
+        """
+        browser = self.playwright.chromium.launch(headless=self.headless)
+        slot = {"browser": browser, "contexts": set(), "crashed": False}
+        browser.on("disconnected", lambda _: self._mark_crashed(slot))
+        return slot
+
+    def _mark_crashed(self, slot):
+        """
+        Flag a slot whose browser went away. It is replaced lazily in `acquire`.
+        """
+        if not slot["crashed"]:
+            logging.warning(f"Pooled browser disconnected, dropping {len(slot['contexts'])} context(s).")
+        slot["crashed"] = True
+
+    def start(self):
+        """
+        Start the Playwright driver and launch the pooled browsers.
+        """
+        if self.playwright is None:
+            self.playwright = sync_playwright().start()
+            self.slots = [self._launch() for _ in range(self.size)]
+            logging.info(f"Browser pool started with {self.size} browser(s).")
+
+    def recycle_crashed(self):
+        """
+        Replace every crashed browser with a freshly launched one.
+        """
+        for index, slot in enumerate(self.slots):
+            if slot["crashed"] or not slot["browser"].is_connected():
+                slot["crashed"] = True
+                slot["contexts"].clear()
+                self.slots[index] = self._launch()
+                logging.info(f"Recycled pooled browser #{index}.")
+
+    def acquire(self):
+        """
+        Create a new context and page on the least-loaded healthy browser.
+
+        Returns:
+            tuple: (slot, context, page)
+        """
+        self.start()
+        self.recycle_crashed()
+        slot = min(self.slots, key=lambda s: len(s["contexts"]))
+        context = slot["browser"].new_context()
+        page = context.new_page()
+        slot["contexts"].add(context)
+        return slot, context, page
+
+    def release(self, slot, context):
+        """
+        Close a context and return its capacity to the pool.
+        """
+        slot["contexts"].discard(context)
+        if slot["crashed"]:
+            return  # The browser is gone together with its contexts
+        try:
+            context.close()
+        except Exception as e:
+            logging.warning(f"Failed to close browser context: {e}")
+
+    def close(self):
+        """
+        Close every pooled browser and stop the Playwright driver.
+        """
+        for slot in self.slots:
+            try:
+                slot["browser"].close()
+            except Exception as e:
+                logging.warning(f"Failed to close pooled browser: {e}")
+        self.slots = []
+        if self.playwright:
+            self.playwright.stop()
+            self.playwright = None
+
+    def stats(self):
+        """
+        Return the number of contexts open on each browser.
+        """
+        return [len(slot["contexts"]) for slot in self.slots]
+
+
 class SessionManager:
     """
-    Manages asynchronous Playwright browser sessions for users.
+    Manages Playwright browser sessions for users.
+
+    With a pool size greater than zero, users share a fixed set of browsers and each
+    session is an isolated BrowserContext. A pool size of 0 keeps the original
+    behaviour of one Playwright driver and browser per user.
     """
-    def __init__(self):
+    def __init__(self, pool_size=None):
+        if pool_size is None:
+            pool_size = Settings.BROWSER_POOL_SIZE
+        self.pool = BrowserPool(pool_size, headless=Settings.BROWSER_HEADLESS) if pool_size > 0 else None
         self.sessions = {}  # Dictionary to store user sessions
+        self.resource_policy = ResourcePolicy.from_settings() if Settings.RESOURCE_BLOCKING else None
+        self.resource_totals = ResourceCounters()
+
+    def _block_resources(self, session):
+        """
+        Apply the request-blocking policy to a new session's context.
+        """
+        if self.resource_policy:
+            session["resources"] = ResourceCounters(parent=self.resource_totals)
+            install_sync(session["page"].context, self.resource_policy, session["resources"])
+        return session
+
+    def _is_alive(self, session):
+        """
+        Check whether the browser behind a session is still usable.
+        """
+        slot = session.get("slot")
+        if slot is not None and slot["crashed"]:
+            return False
+        return session["browser"].is_connected()
 
     def start_session(self, user_id):
         """
         Start a new browser session for a user.
         """
-        if user_id in self.sessions:
-            return self.sessions[user_id]  # Return the existing session
+        session = self.sessions.get(user_id)
+        if session:
+            if self._is_alive(session):
+                return session  # Return the existing session
+            # The browser crashed: forget the dead session and build a new one
+            logging.warning(f"Browser session for user_id={user_id} was lost, starting a new one.")
+            self.sessions.pop(user_id)
+
+        if self.pool:
+            slot, context, page = self.pool.acquire()
+            self.sessions[user_id] = self._block_resources({
+                "browser": slot["browser"],
+                "context": context,
+                "page": page,
+                "slot": slot,
+            })
+            return self.sessions[user_id]
 
         # Create a new Playwright instance and browser session
         playwright = sync_playwright().start()
-        browser = playwright.chromium.launch(headless=True)
+        browser = playwright.chromium.launch(headless=Settings.BROWSER_HEADLESS)
         page = browser.new_page()
 
         # Store the session details
-        self.sessions[user_id] = {
+        self.sessions[user_id] = self._block_resources({
             "playwright": playwright,
             "browser": browser,
             "page": page,
-        }
+        })
         return self.sessions[user_id]
 
     def get_session(self, user_id):
@@ -39,5 +188,20 @@ class SessionManager:
         """
         if user_id in self.sessions:
             session = self.sessions.pop(user_id)
-            session["browser"].close()
-            session["playwright"].stop()
+            if "slot" in session:
+                self.pool.release(session["slot"], session["context"])
+            else:
+                session["browser"].close()
+                session["playwright"].stop()
+
+    def close_all(self):
+        """
+        Close every session and, in pooled mode, the shared browsers.
+        """
+        for user_id in list(self.sessions):
+            try:
+                self.close_session(user_id)
+            except Exception as e:
+                logging.warning(f"Failed to close session for user_id={user_id}: {e}")
+        if self.pool:
+            self.pool.close()
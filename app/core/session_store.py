@@ -0,0 +1,116 @@
+"""
+Bounded storage for live browser sessions.
+
+The store keeps sessions in least-recently-used order and evicts them when the
+capacity, the idle TTL or the memory budget is exceeded. Evicted sessions are not
+closed here: they are handed to a queue that the session manager's reaper drains in
+the background, so closing a browser never happens on the request path.
+"""
+import asyncio
+import time
+from collections import Counter, OrderedDict
+
+
+class SessionStore:
+    """
+    LRU- and idle-TTL-bounded mapping of user_id -> session.
+
+    Every session owns exactly one page, so `max_sessions` is also the page budget
+    of the process.
+    """
+    def __init__(self, max_sessions, idle_ttl, memory_budget_mb=0):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.memory_budget_mb = memory_budget_mb
+        self._sessions = OrderedDict()  # user_id -> session, oldest first
+        self._last_used = {}  # user_id -> monotonic timestamp
+        self.evicted = asyncio.Queue()  # (user_id, session) pairs waiting to be closed
+        self.evictions = Counter()  # reason -> number of evicted sessions
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, user_id):
+        return user_id in self._sessions
+
+    def __iter__(self):
+        return iter(list(self._sessions))
+
+    def get(self, user_id, default=None):
+        """
+        Return a session and mark it as most recently used.
+        """
+        if user_id not in self._sessions:
+            return default
+        self._sessions.move_to_end(user_id)
+        self._last_used[user_id] = time.monotonic()
+        return self._sessions[user_id]
+
+    def __setitem__(self, user_id, session):
+        self._sessions[user_id] = session
+        self._sessions.move_to_end(user_id)
+        self._last_used[user_id] = time.monotonic()
+        while len(self._sessions) > self.max_sessions:
+            self._evict_oldest("capacity")
+
+    def pop(self, user_id, *default):
+        """
+        Remove a session without queueing it for the reaper.
+        """
+        self._last_used.pop(user_id, None)
+        return self._sessions.pop(user_id, *default)
+
+    def _evict(self, user_id, reason):
+        session = self.pop(user_id)
+        self.evictions[reason] += 1
+        self.evicted.put_nowait((user_id, session))
+
+    def _evict_oldest(self, reason):
+        user_id = next(iter(self._sessions))
+        self._evict(user_id, reason)
+
+    def expire_idle(self):
+        """
+        Evict every session that has been idle longer than the TTL.
+
+        Returns:
+            int: Number of sessions evicted.
+        """
+        deadline = time.monotonic() - self.idle_ttl
+        expired = [user_id for user_id in self._sessions if self._last_used[user_id] < deadline]
+        for user_id in expired:
+            self._evict(user_id, "idle")
+        return len(expired)
+
+    def enforce_memory_budget(self, used_mb):
+        """
+        Evict least-recently-used sessions while memory use is over budget.
+
+        Sessions only release memory once the reaper closes them, so at most one
+        session per known megabyte overshoot is evicted per call.
+
+        Args:
+            used_mb: Current memory use of the process and its browsers, in MB.
+
+        Returns:
+            int: Number of sessions evicted.
+        """
+        if not self.memory_budget_mb or used_mb is None or used_mb <= self.memory_budget_mb:
+            return 0
+        per_session_mb = used_mb / max(len(self._sessions), 1)
+        overshoot = used_mb - self.memory_budget_mb
+        count = min(len(self._sessions), max(1, int(overshoot / per_session_mb) + 1))
+        for _ in range(count):
+            self._evict_oldest("memory")
+        return count
+
+    def stats(self):
+        """
+        Return the current session count and eviction counters.
+        """
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "pending_close": self.evicted.qsize(),
+            "evictions": dict(self.evictions),
+        }
@@ -1,10 +1,92 @@
-import threading
 import asyncio
+import heapq
 import logging
+import os
+import time
+
+from app.config.settings import Settings
+from app.core.database import add_pending_deletion, load_pending_deletions, remove_pending_deletions
+
+class DeletionScheduler:
+    """
+    Deletes Telegram messages after a delay without a thread per message.
+
+    Pending deletions sit in a heap ordered by due time and are persisted in MongoDB.
+    A single repeating JobQueue job deletes all due messages in one batch every
+    `tick` seconds, and pending deletions are replayed after a restart.
+    """
+    def __init__(self, tick):
+        self.tick = tick
+        self.bot = None
+        self._heap = []  # (due timestamp, chat_id, message_id)
+        self._persisting = set()  # Strong references, so persist tasks are not garbage-collected
+
+    async def start(self, bot, job_queue):
+        """
+        Replay persisted deletions and start the batching job.
+        """
+        self.bot = bot
+        try:
+            for pending in await load_pending_deletions():
+                heapq.heappush(self._heap, (pending["due_at"], pending["chat_id"], pending["message_id"]))
+            if self._heap:
+                logging.info(f"Replayed {len(self._heap)} pending message deletion(s).")
+        except Exception as e:
+            logging.error(f"Failed to replay pending message deletions: {e}")
+        job_queue.run_repeating(self._delete_due, interval=self.tick, first=self.tick, name="message_deletions")
+
+    def schedule(self, chat_id, message_id, delay):
+        """
+        Schedule a message for deletion `delay` seconds from now.
+        """
+        due_at = time.time() + delay
+        heapq.heappush(self._heap, (due_at, chat_id, message_id))
+        task = asyncio.get_running_loop().create_task(self._persist(chat_id, message_id, due_at))
+        self._persisting.add(task)
+        task.add_done_callback(self._persisting.discard)
+
+    async def _persist(self, chat_id, message_id, due_at):
+        try:
+            await add_pending_deletion(chat_id, message_id, due_at)
+        except Exception as e:
+            logging.error(f"Failed to persist pending message deletion: {e}")
+
+    async def _delete(self, chat_id, message_id):
+        try:
+            await self.bot.delete_message(chat_id=chat_id, message_id=message_id)
+        except Exception as e:
+            logging.error(f"Failed to delete password message: {e}")
+
+    async def _delete_due(self, context=None):
+        """
+        Delete every message whose due time has passed, as one batch.
+        """
+        now = time.time()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, chat_id, message_id = heapq.heappop(self._heap)
+            due.append((chat_id, message_id))
+        if not due:
+            return
+        await asyncio.gather(*(self._delete(chat_id, message_id) for chat_id, message_id in due))
+        try:
+            await remove_pending_deletions(due)
+        except Exception as e:
+            logging.error(f"Failed to clear persisted message deletions: {e}")
+
+    def pending(self):
+        """
+        Return the number of messages waiting to be deleted.
+        """
+        return len(self._heap)
+
+
+deletion_scheduler = DeletionScheduler(tick=Settings.MESSAGE_DELETION_TICK)
+
 
 def delete_password_message_later(bot, chat_id, message_id, delay=40):
     """
-    Delete the password message after a delay using threading.
+    Delete the password message after a delay using the shared deletion scheduler.
 
     Args:
         bot: Telegram Bot instance.
@@ -12,19 +94,45 @@ def delete_password_message_later(bot, chat_id, message_id, delay=40):
         message_id: ID of the message to be deleted.
         delay: Time to wait before deleting the message (in seconds).
     """
-    def delete_message(loop):
-        try:
-            # Wait for the specified delay
-            threading.Event().wait(delay)
+    if deletion_scheduler.bot is None:
+        deletion_scheduler.bot = bot
+    deletion_scheduler.schedule(chat_id, message_id, delay)
 
-            # Run the coroutine thread-safely in the provided event loop
-            coroutine = bot.delete_message(chat_id=chat_id, message_id=message_id)
-            asyncio.run_coroutine_threadsafe(coroutine, loop).result()  # Wait for the coroutine to complete
-        except Exception as e:
-            logging.error(f"Failed to delete password message: {e}")
+def process_tree_rss_mb(pid=None):
+    """
+    Return the resident memory of a process and all its descendants, in MB.
+
+    Browser processes are children of the Playwright driver, so they are only
+    accounted for when the whole process tree is summed. Reads `/proc` and returns
+    None on platforms without it.
 
-    # Get the current event loop (from the main thread)
-    loop = asyncio.get_event_loop()
+    Args:
+        pid: Root process ID. Defaults to the current process.
+    """
+    pid = pid or os.getpid()
+    if not os.path.isdir("/proc"):
+        return None
+
+    children = {}
+    rss_pages = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat_file:
+                stat = stat_file.read()
+            with open(f"/proc/{entry}/statm") as statm_file:
+                rss_pages[int(entry)] = int(statm_file.read().split()[1])
+        except (OSError, IndexError, ValueError):
+            continue  # The process exited while we were scanning
+        # The command name may contain spaces, so split after its closing parenthesis
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
 
-    # Start the deletion process in a new thread
-    threading.Thread(target=delete_message, args=(loop,)).start()
+    total_pages = 0
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        total_pages += rss_pages.get(current, 0)
+        stack.extend(children.get(current, []))
+    return total_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
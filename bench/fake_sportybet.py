@@ -0,0 +1,198 @@
+"""
+Local stand-in for the SportyBet pages and endpoints the bot uses.
+
+Reproduces the login form, the `.m-balance` element, the `#j_refreshBalance` button
+and the balance endpoint, so the scraper and the HTTP fast path run unchanged
+against it. Any phone number logs in except with the password "wrong". Every
+balance read moves the balance a little, so refreshes are observable. Slips posted
+to the bet endpoint are accepted when the balance covers the stake; a request ID
+seen twice is counted in `duplicate_bets`, so double placements show up.
+"""
+import asyncio
+import random
+import secrets
+import time
+from urllib.parse import parse_qs
+
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+
+COOKIE_NAME = "accessToken"
+
+LOGIN_PAGE = """<!doctype html>
+<html><head><title>SportyBet (bench)</title></head>
+<body>
+<form method="post" action="{prefix}/login">
+  <input name="phone" type="text">
+  <input name="password" type="password">
+  <button class="af-button" type="submit">Log In</button>
+</form>
+</body></html>
+"""
+
+HOME_PAGE = """<!doctype html>
+<html><head><title>SportyBet (bench)</title></head>
+<body>
+<span class="m-balance">{balance}</span>
+<button id="j_refreshBalance">Refresh</button>
+<script>
+document.getElementById("j_refreshBalance").addEventListener("click", async () => {{
+  const response = await fetch("{balance_path}", {{credentials: "same-origin"}});
+  const body = await response.json();
+  if (body.data) document.querySelector(".m-balance").innerText = body.data.avlBal;
+}});
+</script>
+</body></html>
+"""
+
+
+def fixture_events(leagues=8, matches_per_league=12):
+    """
+    Build a fixed set of tournaments and events in the shape of the events endpoint.
+    Odds are drawn on each call, so consecutive fetches differ a little.
+    """
+    now_ms = int(time.time() * 1000)
+    tournaments = []
+    for league in range(leagues):
+        events = []
+        for number in range(matches_per_league):
+            events.append({
+                "eventId": f"sr:match:{league * 1000 + number}",
+                "homeTeamName": f"Home {league}-{number}",
+                "awayTeamName": f"Away {league}-{number}",
+                "estimateStartTime": now_ms + (number + 1) * 3600 * 1000,
+                "markets": [{"id": "1", "desc": "1X2", "outcomes": [
+                    {"id": outcome, "desc": outcome, "odds": f"{random.uniform(1.2, 6):.2f}"}
+                    for outcome in ("1", "X", "2")
+                ]}],
+            })
+        tournaments.append({
+            "id": f"sr:tournament:{league}",
+            "name": f"League {league}",
+            "categoryName": "Bench",
+            "events": events,
+        })
+    return tournaments
+
+
+def create_app(prefix="/ng", balance_path="/api/ng/pocket/v1/finAccs/get",
+               fixtures_path="/api/ng/factsCenter/pcUpcomingEvents", bet_path="/api/ng/orders/order",
+               settled_path="/api/ng/orders/order/v2/realbet/settled", settle_after=10,
+               latency_ms=0, balance_change_rate=0.5):
+    """
+    Build the stub site.
+
+    Args:
+        prefix: Path the site root is served under, as in `SPORTYBET_BASE_URL`.
+        balance_path: Path of the balance endpoint, as in `BALANCE_API_PATH`.
+        fixtures_path: Path of the public events endpoint, as in `FIXTURES_API_PATH`.
+        bet_path: Path slips are posted to, as in `BET_API_PATH`.
+        settled_path: Path of the settled orders, as in `BET_SETTLED_API_PATH`.
+        settle_after: Seconds after placement a bet is reported as won or lost.
+        latency_ms: Delay added to every response, to mimic a remote site.
+        balance_change_rate: Share of balance reads that find the balance changed; the
+            others return it unchanged, as most refreshes on the real site do.
+    """
+    app = FastAPI()
+    app.state.balances = {}  # access token -> balance
+    app.state.logins = 0
+    app.state.bets = {}  # request ID -> order ID
+    app.state.duplicate_bets = 0
+    app.state.orders = {}  # access token -> list of (order ID, stake, odds, placed at)
+
+    async def delay():
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+
+    def balance_of(request):
+        return app.state.balances.get(request.cookies.get(COOKIE_NAME))
+
+    @app.get(f"{prefix}/login", response_class=HTMLResponse)
+    async def login_page():
+        await delay()
+        return LOGIN_PAGE.format(prefix=prefix)
+
+    @app.post(f"{prefix}/login")
+    async def login(request: Request):
+        await delay()
+        form = parse_qs((await request.body()).decode())
+        if form.get("password", [""])[0] == "wrong":
+            return HTMLResponse(LOGIN_PAGE.format(prefix=prefix), status_code=401)
+        token = secrets.token_hex(16)
+        app.state.balances[token] = round(random.uniform(100, 10000), 2)
+        app.state.logins += 1
+        response = RedirectResponse(f"{prefix}/", status_code=303)
+        response.set_cookie(COOKIE_NAME, token, path="/")
+        return response
+
+    @app.get(f"{prefix}/")
+    async def home(request: Request):
+        await delay()
+        balance = balance_of(request)
+        if balance is None:
+            return RedirectResponse(f"{prefix}/login", status_code=302)
+        return HTMLResponse(HOME_PAGE.format(balance=f"{balance:.2f}", balance_path=balance_path))
+
+    @app.get(balance_path)
+    async def balance(request: Request):
+        await delay()
+        token = request.cookies.get(COOKIE_NAME)
+        if token not in app.state.balances:
+            return JSONResponse({"bizCode": 19000, "message": "Not logged in"})
+        if random.random() < balance_change_rate:
+            app.state.balances[token] = round(app.state.balances[token] + random.uniform(0.01, 1), 2)
+        return JSONResponse({"bizCode": 10000, "data": {"avlBal": f"{app.state.balances[token]:.2f}"}})
+
+    @app.get(fixtures_path)
+    async def fixtures(pageSize: int = 100, pageNum: int = 1):
+        await delay()
+        # The stub has a single page; later pages are empty
+        tournaments = fixture_events() if pageNum == 1 else []
+        return JSONResponse({"bizCode": 10000, "data": {"tournaments": tournaments}})
+
+    @app.post(bet_path)
+    async def place_bet(request: Request):
+        await delay()
+        token = request.cookies.get(COOKIE_NAME)
+        if token not in app.state.balances:
+            return JSONResponse({"bizCode": 19000, "message": "Not logged in"}, status_code=401)
+        slip = await request.json()
+        request_id = slip.get("requestId")
+        if request_id in app.state.bets:
+            app.state.duplicate_bets += 1
+            return JSONResponse({"bizCode": 10000, "data": {"orderId": app.state.bets[request_id]}})
+        stake = float(slip.get("stake", 0))
+        if not slip.get("selections") or stake <= 0:
+            return JSONResponse({"bizCode": 4000, "message": "Invalid slip"}, status_code=400)
+        if stake > app.state.balances[token]:
+            return JSONResponse({"bizCode": 4200, "message": "Insufficient balance"}, status_code=400)
+        app.state.balances[token] = round(app.state.balances[token] - stake, 2)
+        order_id = secrets.token_hex(6)
+        if request_id:
+            app.state.bets[request_id] = order_id
+        odds = 1.0
+        for selection in slip["selections"]:
+            odds *= float(selection.get("odds", 1))
+        app.state.orders.setdefault(token, []).append((order_id, stake, odds, time.time()))
+        return JSONResponse({"bizCode": 10000, "data": {"orderId": order_id}})
+
+    @app.get(settled_path)
+    async def settled_orders(request: Request, pageSize: int = 50, pageNum: int = 1):
+        await delay()
+        token = request.cookies.get(COOKIE_NAME)
+        if token not in app.state.balances:
+            return JSONResponse({"bizCode": 19000, "message": "Not logged in"}, status_code=401)
+        orders = []
+        for order_id, stake, odds, placed_at in reversed(app.state.orders.get(token, [])):  # Newest first
+            if time.time() - placed_at < settle_after:
+                continue
+            won = int(order_id, 16) % 2 == 0  # Stable outcome per order
+            orders.append({
+                "orderId": order_id,
+                "status": "won" if won else "lost",
+                "totalWinnings": f"{stake * odds:.2f}" if won else "0",
+            })
+        start = (pageNum - 1) * pageSize
+        return JSONResponse({"bizCode": 10000, "data": {"entityList": orders[start:start + pageSize]}})
+
+    return app
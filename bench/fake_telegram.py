@@ -0,0 +1,104 @@
+"""
+Local stand-in for the Telegram Bot API, plus a generator of incoming updates.
+
+The bot is pointed here with `TELEGRAM_API_BASE_URL`. Every message the bot sends
+is answered like the real API would and queued per chat, so a virtual user can
+wait for the bot's reply to each update it posts.
+"""
+import asyncio
+import itertools
+import json
+import time
+from urllib.parse import parse_qs
+
+from fastapi import FastAPI, Request
+
+
+class FakeTelegram:
+    """
+    Bot API stub recording outgoing messages per chat.
+    """
+    def __init__(self):
+        self.app = FastAPI()
+        self.webhook_set = asyncio.Event()
+        self.calls = {}  # method -> number of calls
+        self._inbox = {}  # chat_id -> asyncio.Queue of (received at, text)
+        self._message_ids = itertools.count(1)
+        self.app.add_api_route("/bot{token}/{method}", self._handle, methods=["GET", "POST"])
+
+    def inbox(self, chat_id):
+        """
+        Return the queue of messages the bot sent to a chat.
+        """
+        if chat_id not in self._inbox:
+            self._inbox[chat_id] = asyncio.Queue()
+        return self._inbox[chat_id]
+
+    async def wait_for_reply(self, chat_id, predicate, timeout):
+        """
+        Wait for the next message to a chat matching `predicate`, skipping others.
+
+        Returns:
+            tuple: (received at as `time.perf_counter()`, text)
+        """
+        inbox = self.inbox(chat_id)
+        deadline = time.perf_counter() + timeout
+        while True:
+            received_at, text = await asyncio.wait_for(inbox.get(), deadline - time.perf_counter())
+            if predicate(text):
+                return received_at, text
+
+    async def _params(self, request):
+        body = await request.body()
+        if request.headers.get("content-type", "").startswith("application/json"):
+            return json.loads(body or b"{}")
+        params = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+        params.update(request.query_params)
+        return params
+
+    async def _handle(self, token: str, method: str, request: Request):
+        params = await self._params(request)
+        self.calls[method] = self.calls.get(method, 0) + 1
+        method = method.lower()
+        if method == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif method == "setwebhook":
+            self.webhook_set.set()
+            result = True
+        elif method == "sendmessage":
+            chat_id = int(params["chat_id"])
+            self.inbox(chat_id).put_nowait((time.perf_counter(), params.get("text", "")))
+            result = {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", ""),
+            }
+        else:
+            result = True  # deleteMessage, deleteWebhook and anything else
+        return {"ok": True, "result": result}
+
+
+class UpdateFactory:
+    """
+    Builds Telegram update JSON as the Bot API would post it to the webhook.
+    """
+    def __init__(self):
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def message(self, user_id, text):
+        """
+        Return an update carrying a private text message from `user_id`.
+        """
+        user = {"id": user_id, "is_bot": False, "first_name": f"Bench{user_id}", "language_code": "en"}
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": user["first_name"]},
+            "from": user,
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": next(self._update_ids), "message": message}
@@ -0,0 +1,412 @@
+"""
+Offline load test of the bot against a stub SportyBet site and a stub Bot API.
+
+Starts the stub site, the stub Bot API and (unless `--mongo-uri` is given) a
+throwaway `mongod`, then runs the app under uvicorn in a subprocess pointed at all
+three. Virtual users each walk through /login, phone number, password, a number
+of /balance requests and a number of bet slips (built with /bet and placed with
+/bet place) by posting updates to `/webhook` and waiting for the bot's replies.
+With `--redeliver`, every /bet place update is posted twice with the same
+update_id, as Telegram does when a webhook call times out; the run fails unless
+the app suppressed every redelivery and the stub site placed no slip twice.
+Nothing leaves the machine.
+
+Reports logins/sec, login, /balance and /bet place latency percentiles, bets/sec,
+suppressed duplicate updates, slips the stub site received twice (should be 0), and
+the peak RSS of the app's process tree (browsers included), browser count and open
+sessions.
+
+Usage:
+    python -m bench.run --users 50 --concurrency 25 --balance-rounds 5
+    python -m bench.run --balance-rounds 0 --bet-rounds 10 --selections 3 --redeliver
+    python -m bench.run --label no-fast-path --env BALANCE_HTTP_FAST_PATH=false --output bench.jsonl
+
+Results are printed and, with `--output`, appended as one JSON line per run, so runs
+of different settings or commits can be compared side by side.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import uvicorn
+
+from app.core.utils import process_tree_rss_mb
+from bench.fake_sportybet import create_app as create_fake_sportybet
+from bench.fake_telegram import FakeTelegram, UpdateFactory
+
+BENCH_TOKEN = "123456:bench"
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HOST = "127.0.0.1"
+# Beginnings of every reply balance_command can send
+BALANCE_REPLIES = ("Your balance", "Your updated balance", "Your session", "Could not", "You are not logged in")
+# Beginnings of every reply /bet place can send
+BET_REPLIES = ("✅ Bet placed", "This slip", "Your session", "Could not", "You are not logged in",
+               "Your bet slip is empty", "The bot is busy", "Too many requests")
+# Short match IDs served by the stub's first leagues
+BENCH_MATCHES = [str(league * 1000 + number) for league in range(8) for number in range(12)]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of a list of numbers, None when empty.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return round(ordered[rank - 1], 1)
+
+
+async def serve(app, port):
+    """
+    Serve an ASGI app on the running loop until cancelled.
+    """
+    server = uvicorn.Server(uvicorn.Config(app, host=HOST, port=port, log_level="warning", lifespan="off"))
+    server.install_signal_handlers = lambda: None
+    task = asyncio.get_running_loop().create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    return server, task
+
+
+async def wait_for_port(port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection(HOST, port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout}s.")
+
+
+def start_mongod(binary):
+    """
+    Start a throwaway mongod on a temporary data directory.
+
+    Returns:
+        tuple: (process, port, data directory)
+    """
+    path = shutil.which(binary)
+    if not path:
+        raise SystemExit(f"'{binary}' not found. Install MongoDB locally or pass --mongo-uri.")
+    port = free_port()
+    dbpath = tempfile.mkdtemp(prefix="bench-mongo-")
+    process = subprocess.Popen(
+        [path, "--dbpath", dbpath, "--port", str(port), "--bind_ip", HOST, "--quiet"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return process, port, dbpath
+
+
+class Sampler:
+    """
+    Periodically records the app's process-tree RSS and browser/session gauges.
+    """
+    def __init__(self, pid, client, interval=0.5):
+        self.pid = pid
+        self.client = client
+        self.interval = interval
+        self.peak_rss_mb = 0.0
+        self.peak_browsers = 0
+        self.peak_sessions = 0
+
+    def _gauge(self, text, name):
+        for line in text.splitlines():
+            if line.startswith(f"{name} "):
+                return float(line.split()[1])
+        return 0
+
+    async def run(self):
+        while True:
+            rss = process_tree_rss_mb(self.pid)
+            if rss is not None:
+                self.peak_rss_mb = max(self.peak_rss_mb, rss)
+            try:
+                metrics = (await self.client.get("/metrics")).text
+                self.peak_browsers = max(self.peak_browsers, int(self._gauge(metrics, "browsers")))
+                self.peak_sessions = max(self.peak_sessions, int(self._gauge(metrics, "browser_sessions")))
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(self.interval)
+
+
+class VirtualUsers:
+    """
+    Drives users through the login flow and /balance requests.
+    """
+    def __init__(self, client, telegram, timeout):
+        self.client = client
+        self.telegram = telegram
+        self.timeout = timeout
+        self.updates = UpdateFactory()
+        self.login_ms = []
+        self.login_failures = 0
+        self.balance_ms = []
+        self.balance_cached = 0
+        self.balance_failures = 0
+        self.bet_ms = []
+        self.bet_failures = 0
+        self.redelivered = 0
+        self.rejected = 0
+
+    async def _post(self, update):
+        while True:
+            response = await self.client.post("/webhook", json=update)
+            if response.status_code != 503:
+                return
+            self.rejected += 1  # Queue full: back off like Telegram would before redelivering
+            await asyncio.sleep(1)
+
+    async def send(self, user_id, text, predicate, redeliver=False):
+        """
+        Post an update and wait for the matching reply.
+
+        With `redeliver`, the same update (same update_id) is posted a second time.
+        The app drops it, so only one reply is awaited.
+
+        Returns:
+            tuple: (latency in ms, reply text)
+        """
+        update = self.updates.message(user_id, text)
+        started = time.perf_counter()
+        await self._post(update)
+        if redeliver:
+            await self._post(update)
+            self.redelivered += 1
+        received_at, reply = await self.telegram.wait_for_reply(user_id, predicate, self.timeout)
+        return (received_at - started) * 1000, reply
+
+    async def run_bets(self, user_id, bet_rounds, selections, redeliver):
+        for round_number in range(bet_rounds):
+            try:
+                for index in range(selections):
+                    match = BENCH_MATCHES[(user_id + round_number * selections + index) % len(BENCH_MATCHES)]
+                    await self.send(user_id, f"/bet {match} 1", lambda text: text.startswith(("🧾", "Match", "No odds")))
+                elapsed, reply = await self.send(
+                    user_id, "/bet place 1", lambda text: text.startswith(BET_REPLIES), redeliver=redeliver
+                )
+            except asyncio.TimeoutError:
+                self.bet_failures += 1
+                continue
+            if not reply.startswith("✅"):
+                self.bet_failures += 1
+                continue
+            self.bet_ms.append(elapsed)
+
+    async def run_user(self, user_id, balance_rounds, bet_rounds=0, selections=1, redeliver=False):
+        try:
+            await self.send(user_id, "/login", lambda text: "phone number" in text)
+            await self.send(user_id, f"080{user_id:08d}", lambda text: "password" in text)
+            elapsed, reply = await self.send(
+                user_id, "bench-password", lambda text: text.startswith(("Login successful", "Login failed", "Incorrect"))
+            )
+        except asyncio.TimeoutError:
+            self.login_failures += 1
+            return
+        if not reply.startswith("Login successful"):
+            self.login_failures += 1
+            return
+        self.login_ms.append(elapsed)
+
+        for _ in range(balance_rounds):
+            try:
+                elapsed, reply = await self.send(
+                    user_id, "/balance", lambda text: text.startswith(BALANCE_REPLIES)
+                )
+            except asyncio.TimeoutError:
+                self.balance_failures += 1
+                continue
+            if "balance is" not in reply:
+                self.balance_failures += 1
+                continue
+            self.balance_ms.append(elapsed)
+            if "cached" in reply:
+                self.balance_cached += 1
+
+        await self.run_bets(user_id, bet_rounds, selections, redeliver)
+
+
+async def run(args):
+    site_port, telegram_port, app_port = free_port(), free_port(), free_port()
+    telegram = FakeTelegram()
+    site = create_fake_sportybet(latency_ms=args.site_latency_ms)
+    site_server, site_task = await serve(site, site_port)
+    telegram_server, telegram_task = await serve(telegram.app, telegram_port)
+
+    mongod = dbpath = None
+    mongo_uri = args.mongo_uri
+    if not mongo_uri:
+        mongod, mongo_port, dbpath = start_mongod(args.mongod)
+        await wait_for_port(mongo_port, 30)
+        mongo_uri = f"mongodb://{HOST}:{mongo_port}"
+
+    env = dict(os.environ)
+    env.update({
+        "TELEGRAM_BOT_TOKEN": BENCH_TOKEN,
+        "TELEGRAM_API_BASE_URL": f"http://{HOST}:{telegram_port}/bot",
+        "WEBHOOK_URL": f"http://{HOST}:{app_port}",
+        "MONGO_URI": mongo_uri,
+        "SPORTYBET_BASE_URL": f"http://{HOST}:{site_port}/ng",
+        "BALANCE_CACHE_TTL": str(args.balance_cache_ttl),
+        "BCRYPT_ROUNDS": str(args.bcrypt_rounds),
+    })
+    for override in args.env:
+        key, _, value = override.partition("=")
+        env[key] = value
+
+    app_process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", HOST, "--port", str(app_port), "--log-level", "warning"],
+        cwd=ROOT,
+        env=env,
+    )
+    client = httpx.AsyncClient(base_url=f"http://{HOST}:{app_port}", timeout=args.timeout)
+    sampler_task = None
+    try:
+        deadline = time.monotonic() + args.startup_timeout
+        while True:
+            try:
+                if (await client.get("/ready")).status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass  # Not listening yet
+            if time.monotonic() > deadline or app_process.poll() is not None:
+                raise RuntimeError("The app did not become ready.")
+            await asyncio.sleep(0.2)
+
+        sampler = Sampler(app_process.pid, client)
+        sampler_task = asyncio.get_running_loop().create_task(sampler.run())
+        users = VirtualUsers(client, telegram, args.timeout)
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def limited(user_id):
+            async with semaphore:
+                await users.run_user(user_id, args.balance_rounds, args.bet_rounds, args.selections, args.redeliver)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(limited(1000 + index) for index in range(args.users)))
+        duration = time.perf_counter() - started
+        await asyncio.sleep(sampler.interval)  # One more sample after the load
+        update_stats = (await client.get("/api/updates/stats")).json()
+    finally:
+        if sampler_task:
+            sampler_task.cancel()
+        await client.aclose()
+        app_process.send_signal(signal.SIGINT)  # Graceful shutdown runs the lifespan cleanup
+        try:
+            app_process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            app_process.kill()
+        if mongod:
+            mongod.terminate()
+            mongod.wait()
+            shutil.rmtree(dbpath, ignore_errors=True)
+        site_server.should_exit = telegram_server.should_exit = True
+        await asyncio.gather(site_task, telegram_task, return_exceptions=True)
+
+    return {
+        "label": args.label,
+        "timestamp": int(time.time()),
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "balance_rounds": args.balance_rounds,
+        "site_latency_ms": args.site_latency_ms,
+        "env": args.env,
+        "duration_s": round(duration, 2),
+        "logins_ok": len(users.login_ms),
+        "logins_failed": users.login_failures,
+        "logins_per_sec": round(len(users.login_ms) / duration, 2) if duration else 0.0,
+        "login_ms": {p: percentile(users.login_ms, p) for p in (50, 95, 99)},
+        "balance_ok": len(users.balance_ms),
+        "balance_failed": users.balance_failures,
+        "balance_cached": users.balance_cached,
+        "balance_ms": {p: percentile(users.balance_ms, p) for p in (50, 95, 99)},
+        "bet_rounds": args.bet_rounds,
+        "selections": args.selections,
+        "redeliver": args.redeliver,
+        "bets_ok": len(users.bet_ms),
+        "bets_failed": users.bet_failures,
+        "bets_per_sec": round(len(users.bet_ms) / duration, 2) if duration else 0.0,
+        "bet_ms": {p: percentile(users.bet_ms, p) for p in (50, 95, 99)},
+        "redelivered_updates": users.redelivered,
+        "suppressed_updates": update_stats["duplicates"]["suppressed"],
+        "site_duplicate_bets": site.state.duplicate_bets,
+        "redelivery_ok": (
+            update_stats["duplicates"]["suppressed"] >= users.redelivered and site.state.duplicate_bets == 0
+        ),
+        "webhook_rejections": users.rejected,
+        "peak_rss_mb": round(sampler.peak_rss_mb, 1),
+        "peak_browsers": sampler.peak_browsers,
+        "peak_sessions": sampler.peak_sessions,
+    }
+
+
+def print_report(report):
+    print(f"\n== {report['label']} ==")
+    print(f"users {report['users']} (concurrency {report['concurrency']}), {report['duration_s']}s")
+    print(f"logins   {report['logins_ok']} ok, {report['logins_failed']} failed, {report['logins_per_sec']}/s")
+    print("login    p50 {50} ms  p95 {95} ms  p99 {99} ms".format(**report["login_ms"]))
+    print(f"/balance {report['balance_ok']} ok ({report['balance_cached']} cached), {report['balance_failed']} failed")
+    print("/balance p50 {50} ms  p95 {95} ms  p99 {99} ms".format(**report["balance_ms"]))
+    if report["bet_rounds"]:
+        print(f"/bet     {report['bets_ok']} ok, {report['bets_failed']} failed, {report['bets_per_sec']}/s, "
+              f"{report['site_duplicate_bets']} double-placed")
+        print(f"updates  {report['redelivered_updates']} redelivered, {report['suppressed_updates']} suppressed"
+              f"{'' if report['redelivery_ok'] else '  REDELIVERY CHECK FAILED'}")
+        print("/bet     p50 {50} ms  p95 {95} ms  p99 {99} ms".format(**report["bet_ms"]))
+    print(f"peak     {report['peak_rss_mb']} MB RSS, {report['peak_browsers']} browsers, {report['peak_sessions']} sessions")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="Number of virtual users.")
+    parser.add_argument("--concurrency", type=int, default=10, help="Users active at the same time.")
+    parser.add_argument("--balance-rounds", type=int, default=5, help="/balance requests per user.")
+    parser.add_argument("--bet-rounds", type=int, default=0, help="Slips placed per user.")
+    parser.add_argument("--selections", type=int, default=1, help="Selections per slip.")
+    parser.add_argument("--redeliver", action="store_true", help="Post every /bet place update twice.")
+    parser.add_argument("--site-latency-ms", type=int, default=50, help="Delay added by the stub site.")
+    parser.add_argument("--balance-cache-ttl", type=float, default=0, help="BALANCE_CACHE_TTL for the app.")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12, help="BCRYPT_ROUNDS for the app.")
+    parser.add_argument("--mongo-uri", help="Use this MongoDB instead of starting a throwaway mongod.")
+    parser.add_argument("--mongod", default="mongod", help="mongod binary to start.")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="Extra app setting.")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait for each reply.")
+    parser.add_argument("--startup-timeout", type=float, default=120, help="Seconds to wait for the app.")
+    parser.add_argument("--label", default="bench", help="Name of this run in the report.")
+    parser.add_argument("--output", help="Append the report as a JSON line to this file.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "a") as output:
+            output.write(json.dumps(report) + "\n")
+    if not report["redelivery_ok"]:
+        sys.exit("Redelivered updates were processed or slips were placed twice.")
+
+
+if __name__ == "__main__":
+    main()
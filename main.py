@@ -3,10 +3,21 @@ from contextlib import asynccontextmanager
 import os
 import logging
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from app.bot.listener import start_bot_listener
-from app.core.database import connect_to_db, close_db_connection, get_database
+from app.bot.dedup import update_deduplicator
+from app.bot.outbound import outbound
+from app.bot.update_queue import update_dispatcher
+from app.config.settings import Settings
+from app.core.async_session_manager import session_manager
+from app.core.balance_cache import balance_cache
+from app.core.job_scheduler import scraper_scheduler
+from app.core.metrics import registry
+from app.core.utils import process_tree_rss_mb
+from app.core.http_client import sportybet_http
+from app.core.security import password_hasher
+from app.core.database import connect_to_db, close_db_connection, ensure_indexes, get_database, user_writes
 from app.api.routes import router as user_router
 
 # Set Proactor Event Loop on Windows for compatibility with Playwright
@@ -29,20 +40,62 @@ logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s"  # Log format
 )
 
+# Startup steps reported by /ready; each is set once it has completed
+readiness = {"database": False, "bot": False, "browsers": False, "hasher": False}
+
+
+async def start_bot():
+    """
+    Import and start the Telegram bot. telegram and the handlers load here rather
+    than when this module is imported.
+    """
+    from app.bot.listener import start_bot_listener
+    readiness["bot"] = bool(await start_bot_listener(webhook_url=WEBHOOK_URL))
+    if readiness["bot"]:
+        logging.info("✅ Telegram bot listener started.")
+
+
+async def warm_up():
+    """
+    Launch the browser pool with spare contexts and spawn the hashing workers in the
+    background, so the first logins after a deploy do not pay for them.
+
+    A failed warm-up leaves the node not ready: it means browsers (e.g. Chromium is
+    missing) or hashing workers cannot start, so every login would fail too.
+    """
+    if Settings.BROWSER_PREWARM:
+        try:
+            await session_manager.prewarm(Settings.BROWSER_PREWARM_CONTEXTS)
+            readiness["browsers"] = True
+        except Exception as e:
+            logging.error(f"❌ Browser pre-warming failed: {e}")
+    else:
+        readiness["browsers"] = True  # Browsers start with the first login
+    try:
+        await password_hasher.warm_up()
+        readiness["hasher"] = True
+    except Exception as e:
+        logging.error(f"❌ Password hashing pool warm-up failed: {e}")
+
+
 # Lifespan context manager for FastAPI
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     Handles application lifecycle events: startup and shutdown.
     """
+    bot_task = warm_up_task = None
     try:
         # Startup: Connect to the database
         await connect_to_db()
         logging.info("✅ Connected to MongoDB.")
+        await ensure_indexes()
+        user_writes.start()
+        readiness["database"] = True
 
-        # Start the Telegram bot listener
-        bot_task = asyncio.create_task(start_bot_listener(webhook_url=WEBHOOK_URL))
-        logging.info("✅ Telegram bot listener started.")
+        # Start the Telegram bot listener and warm up browsers and hashing workers
+        bot_task = asyncio.create_task(start_bot())
+        warm_up_task = asyncio.create_task(warm_up())
 
         yield  # Application runs here
 
@@ -51,11 +104,46 @@ async def lifespan(app: FastAPI):
         raise
 
     finally:
-        # Shutdown: Close database connection and stop bot listener
+        # Shutdown: Drain queued updates, close database connection and stop bot listener
+        for task in (bot_task, warm_up_task):
+            if task:
+                task.cancel()
+        if readiness["bot"]:
+            from app.bot.listener import stop_bot_listener
+            await stop_bot_listener()
+            logging.info("✅ Telegram bot listener stopped.")
+        await user_writes.stop()
+        logging.info("✅ Pending database writes flushed.")
         await close_db_connection()
         logging.info("✅ MongoDB connection closed.")
-        bot_task.cancel()
-        logging.info("✅ Telegram bot listener stopped.")
+        await session_manager.close_all()
+        logging.info("✅ Browser sessions closed.")
+        await sportybet_http.close()
+        password_hasher.shutdown()
+
+def collect_runtime_metrics():
+    """
+    Gauges read from the live components each time /metrics is scraped.
+    """
+    session_stats = session_manager.stats()
+    yield "browser_sessions", "Open browser sessions.", session_stats["sessions"], {}
+    yield "browsers", "Running browser processes.", len(session_stats["browsers"]), {}
+    yield "process_tree_rss_megabytes", "Resident memory of this process and its browsers.", process_tree_rss_mb(), {}
+    yield "update_queue_depth", "Updates waiting to be processed.", update_dispatcher.size, {}
+    yield "updates_duplicate_suppressed", "Redelivered updates dropped before processing.", update_deduplicator.suppressed(), {}
+    yield "outbound_pending", "Outgoing messages waiting for their turn.", outbound.pending, {}
+    yield "outbound_paused_chats", "Chats paused by Telegram flood control.", outbound.stats()["paused_chats"], {}
+    yield "scraper_jobs_running", "Browser jobs holding a scheduler slot.", scraper_scheduler.running, {}
+    yield "scraper_jobs_queued", "Browser jobs waiting for a scheduler slot.", scraper_scheduler.queued, {}
+    cache_stats = balance_cache.stats()
+    yield "balance_cache_entries", "Balances held in the cache.", cache_stats["entries"], {}
+    for outcome in ("hits", "misses", "coalesced"):
+        yield "balance_cache_requests", "Balance cache lookups by outcome.", cache_stats[outcome], {"outcome": outcome}
+    yield "write_behind_pending", "Database writes waiting to be flushed.", user_writes.pending(), {}
+    yield "bcrypt_pending", "Hashing jobs queued or running.", password_hasher.pending, {}
+
+
+registry.register_collector(collect_runtime_metrics)
 
 # Initialize FastAPI application
 app = FastAPI(lifespan=lifespan)
@@ -80,6 +168,35 @@ async def health_check():
     """
     return {"status": "running"}
 
+# Metrics endpoint for Prometheus
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Expose latency histograms and runtime gauges in the Prometheus text format.
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+# Readiness endpoint, separate from the liveness check above
+@app.get("/ready")
+async def readiness_check():
+    """
+    Report whether startup has completed: database connected, bot running, browsers
+    and hashing workers warmed up. Answers 503 until then.
+    """
+    ready = all(readiness.values())
+    return JSONResponse({"ready": ready, **readiness}, status_code=200 if ready else 503)
+
+# Telegram webhook; updates are handed to the bot listener once it is running
+@app.post("/webhook")
+async def webhook(request: Request):
+    """
+    Receive an update from Telegram.
+    """
+    if not readiness["bot"]:
+        return PlainTextResponse("Application not initialized", status_code=503)
+    from app.bot.listener import webhook_handler
+    return await webhook_handler(request)
+
 # Test database connection route
 @app.get("/test-db")
 async def test_database():